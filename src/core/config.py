@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 import torch
 
@@ -7,6 +8,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent.parent
 DATA_DIR_NAME = "data"
 RAW_DATA_FOLDER_NAME = "raw"
 FOLDER_STRUCTURE_FILE = "folder_structure.json"
+SYNC_STATE_FILE = "sync_state.json"  # состояние синхронизации data/raw (CRC32 файлов), не в git
 
 # Полные пути
 DATA_PATH = BASE_DIR / DATA_DIR_NAME
@@ -15,12 +17,28 @@ RAW_DATA_PATH = DATA_PATH / RAW_DATA_FOLDER_NAME
 # Яндекс диск
 YANDEX_DISK_PUBLIC_KEY = 'https://disk.360.ru/d/ZWfcuA3Wi1BCiA'
 YANDEX_DISK_BASE_URL = 'https://cloud-api.yandex.net/v1/disk/public/resources/download?'
+YANDEX_DISK_META_URL = 'https://cloud-api.yandex.net/v1/disk/public/resources?'
 
 # Имена файлов/папок в процессе загрузки
 YAD_ZIP_FILENAME = "AI_Boostcamp.zip"
 YAD_EXTRACTED_FOLDER = "AI BoostCamp"
+PDF_ZIP_FILENAME = "All_PDFs_merged_1.zip"
 PDF_ZIP_EXTRACTED_FOLDER = "All_PDFs_merged_1"
 
+# Загрузка архива: потоковая запись частями с докачкой (HTTP Range) после обрыва
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_MAX_RETRIES = 5
+DOWNLOAD_RETRY_DELAY = 2  # секунды, удваивается с каждой попыткой
+DOWNLOAD_TIMEOUT = (10, 60)  # (соединение, пауза между частями ответа), секунды
+YAD_ZIP_SHA256 = None  # ожидаемый SHA-256 архива; None - взять из метаданных Я.Диска, если они есть
+# Локальная заглушка файлового сервера для проверки докачки (python -m src.ingestion.download_stub_server)
+DOWNLOAD_STUB_HOST = "127.0.0.1"
+DOWNLOAD_STUB_PORT = 8090
+
+# Извлечение текста из PDF
+PDF_EXTRACTION_WORKERS = os.cpu_count() or 1  # 1 - без пула процессов
+PDF_PAGES_PER_TASK = 50  # страниц в одной задаче пула (крупные PDF режутся на диапазоны)
+
 # чанкинг
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
@@ -29,20 +47,124 @@ SEPARATORS = [
     "\n",
     " ",
 ]
+# Разбиение на смещениях (src/ingestion/chunker.py) вместо RecursiveCharacterTextSplitter, чанки те же
+NATIVE_SPLITTER_ENABLED = True
+# Единица размера чанка: "chars" (CHUNK_SIZE/CHUNK_OVERLAP) или "tokens" (токенизатор модели эмбеддингов)
+CHUNK_LENGTH_UNIT = "chars"
+CHUNK_SIZE_TOKENS = 400  # e5 обрезает вход на 512 токенах
+CHUNK_OVERLAP_TOKENS = 80
 
 # Модель эмбедингов
 EMBEDDING_MODEL_NAME = "intfloat/multilingual-e5-large"
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# Бэкенд инференса: "torch" (fp32), "torch-int8" (динамическая int8-квантизация, только CPU),
+# "onnx" (ONNX Runtime, нужен пакет optimum[onnxruntime])
+EMBEDDING_BACKEND = "torch"
+EMBEDDING_ONNX_FILE_NAME = None  # например "onnx/model_qint8_avx512_vnni.onnx"; None - модель по умолчанию
+# Бюджет токенов на батч векторизации чанков (размер батча * длина самого длинного чанка)
+EMBEDDING_TOKEN_BUDGET = 16384
+# Кэш эмбеддингов чанков (SQLite), ключ - (модель, нормализованный текст)
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = DATA_PATH / "embedding_cache.sqlite3"
+EMBEDDING_CACHE_MAX_ENTRIES = 500_000  # ~2 ГБ для векторов размерности 1024
 
 # ChromaDB
 VECTOR_DB_PATH = DATA_PATH / "vectordb"
 COLLECTION_NAME = "orion_assistant_docs"
+# Манифест инкрементальной индексации (хеши файлов и id их чанков)
+INGEST_MANIFEST_PATH = DATA_PATH / "ingest_manifest.json"
+# Версия индекса: перезаписывается при каждом изменении коллекции (для сброса кэшей)
+INDEX_VERSION_PATH = DATA_PATH / "index_version"
+# Лексический (BM25) индекс по тем же id чанков, что и в ChromaDB
+LEXICAL_INDEX_PATH = DATA_PATH / "lexical_index.sqlite3"
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Размер батча потоковой индексации (чанков на одну векторизацию и запись в ChromaDB)
+INGEST_BATCH_SIZE = 256
+# Векторный поиск: "chroma" - в ChromaDB; "compact" - в CompactVectorStore (float16/int8 + IVF);
+# "mmap" - точный перебор в MmapVectorStore. Хранилища выгружаются из ChromaDB
+# (VectorStoreManager.build_vector_export, после индексации - автоматически). ChromaDB остается
+# источником истины: если выгрузка устарела (версия индекса изменилась), поиск идет в ChromaDB.
+VECTOR_BACKEND = "chroma"
+MMAP_STORE_PATH = DATA_PATH / "mmap_store"
+MMAP_SEARCH_BLOCK_ROWS = 65536  # строк матрицы на одно умножение при переборе
+COMPACT_STORE_PATH = DATA_PATH / "compact_store"
+COMPACT_STORE_DTYPE = "int8"  # "float16" или "int8" (со своим масштабом для каждого вектора)
+COMPACT_STORE_N_PROBE = 16  # списков IVF, просматриваемых на запрос
+COMPACT_STORE_RESCORE = 4  # кандидатов на пересчет по fp16: COMPACT_STORE_RESCORE * n_results
 
 # Retriever
 TOP_K_CHUNKS = 5 
+# Гибридный поиск: BM25 по лексическому индексу + векторный поиск, слияние через RRF
+HYBRID_SEARCH_ENABLED = True
+HYBRID_CANDIDATES = 20  # кандидатов от каждого из поисков
+RRF_K = 60
+# Поиск в пределах продукта (папки верхнего уровня из folder_structure.json),
+# продукт определяется по упоминанию в запросе
+PRODUCT_DETECTION_ENABLED = True
+FOLDER_STRUCTURE_PATH = DATA_PATH / FOLDER_STRUCTURE_FILE
+# Переранжирование кросс-энкодером
+RERANKER_ENABLED = False  # на CPU-узлах переранжирование часто не укладывается в бюджет
+RERANKER_MODEL_NAME = "BAAI/bge-reranker-v2-m3"
+RERANK_CANDIDATES = 30  # сколько кандидатов переранжировать
+RERANK_BATCH_SIZE = 8
+RERANK_BUDGET_MS = 300  # при превышении - порядок без переранжирования
+# Кэш текстов чанков в памяти ретривера (id -> текст и метаданные)
+CHUNK_CACHE_MAX_ENTRIES = 20000
+# Микробатчинг эмбеддингов запросов при конкурентных обращениях
+QUERY_BATCHING_ENABLED = True
+QUERY_BATCH_MAX_SIZE = 32
+QUERY_BATCH_MAX_WAIT_MS = 5
+# Пакетный поиск (Retriever.retrieve_many): запросов в одном батче векторизации и поиска
+RETRIEVE_MANY_BATCH_SIZE = 64
+# Оценка поиска (src/retrieval/retrieval_bench.py): набор вопросов с ожидаемыми страницами
+RETRIEVAL_EVAL_DATASET_PATH = DATA_PATH / "eval" / "retrieval_v1.json"
+RETRIEVAL_EVAL_KS = (1, 3, 5, 10)
+# Кэш результатов поиска: точный (по нормализованному запросу) и семантический (по близости эмбеддингов)
+RETRIEVAL_CACHE_ENABLED = True
+RETRIEVAL_CACHE_MAX_ENTRIES = 1024
+RETRIEVAL_CACHE_TTL_SECONDS = 3600
+RETRIEVAL_CACHE_SEMANTIC_MAX_ENTRIES = 256
+RETRIEVAL_CACHE_SEMANTIC_THRESHOLD = 0.97  # косинусная близость запросов для попадания
 
 # LLM
 LLM_API_URL = "https://inference.product.nova.neurotech.k2.cloud"
 LLM_TOKEN = "qwen2 oOv0w4yv5QxeAlgm8VL"
 LLM_MODEL_NAME = "Qwen2.5-32B"
-LLM_MAX_TOKENS = 1024
\ No newline at end of file
+LLM_MAX_TOKENS = 1024
+LLM_TOKENIZER_NAME = "Qwen/Qwen2.5-32B-Instruct"  # для подсчета токенов промпта
+LLM_CONTEXT_WINDOW = 32768
+LLM_CHAT_COMPLETIONS_PATH = "/v1/chat/completions"  # OpenAI-совместимый эндпоинт (SSE-стриминг)
+LLM_VERIFY_SSL = False
+# Статический префикс промпта (системный промпт и инструкции) - отдельным system-сообщением,
+# одинаковым во всех запросах, чтобы сервер переиспользовал его KV-кэш (prefix caching)
+PROMPT_PREFIX_LAYOUT = True
+# Поле подсказки кэша префикса в запросе, если сервер его поддерживает (например "prompt_cache_key");
+# None - не отправлять
+LLM_CACHE_HINT_FIELD = None
+# Пул соединений и устойчивость клиента LLM
+LLM_MAX_CONNECTIONS = 32  # keep-alive соединений в пуле
+LLM_CONNECT_TIMEOUT = 5  # секунды
+LLM_READ_TIMEOUT = 60  # максимальная пауза между частями потока, секунды
+LLM_MAX_RETRIES = 3  # повторы до первого токена при сетевых ошибках, 429 и 5xx
+LLM_RETRY_BASE_DELAY = 0.5  # экспоненциальная задержка со случайным разбросом (full jitter)
+LLM_RETRY_MAX_DELAY = 8
+# Упаковка контекста в промпт: склейка перекрывающихся чанков одной страницы,
+# удаление почти дубликатов и отбор по релевантности в пределах бюджета токенов
+CONTEXT_PACKING_ENABLED = True
+CONTEXT_TOKEN_BUDGET = 6000
+CONTEXT_DEDUP_THRESHOLD = 0.9  # доля общих триграмм слов, с которой чанк считается дубликатом
+# RAG-оркестратор: одновременно выполняемых запросов на этапах поиска и генерации
+RAG_MAX_CONCURRENT_RETRIEVALS = 16
+RAG_MAX_CONCURRENT_GENERATIONS = 8
+# Кэш ответов LLM (SQLite): ключ - (нормализованный запрос, id найденных чанков по порядку,
+# версия шаблона промпта, модель); записи с переиндексированными чанками удаляются
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_PATH = DATA_PATH / "answer_cache.sqlite3"
+ANSWER_CACHE_LINKS_TABLE = "answer_chunks"  # связи ответов с чанками, их снимает индексация (ChunkLinks)
+ANSWER_CACHE_MAX_ENTRIES = 10_000
+ANSWER_CACHE_TTL_SECONDS = 7 * 24 * 3600
+ANSWER_CACHE_REPLAY_SPEED = 1.0  # во сколько раз быстрее исходной генерации выдается ответ из кэша (2.0 - вдвое); 0 - сразу целиком
+# Локальная заглушка LLM для офлайн-проверок (python -m src.generation.stub_server)
+LLM_STUB_HOST = "127.0.0.1"
+LLM_STUB_PORT = 8089
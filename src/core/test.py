@@ -43,23 +43,16 @@ def retrieve_and_display_documents(n_documents: int = 2):
     # Используем метод get(), чтобы извлечь документы и метаданные.
     # Ограничиваемся первыми N документами.
     
-    # NOTE: ChromaDB не гарантирует порядок, но мы можем использовать get() для извлечения.
-    # Чтобы получить 'первые' N документов, нам нужно получить их ID, 
-    # но поскольку при индексации мы использовали IDs вида 'doc_0', 'doc_1',
-    # мы можем просто взять их для извлечения.
-
-    # Используем get() для извлечения данных по ID
-    ids_to_fetch = [f"doc_{i}" for i in range(min(n_documents, total_count))]
-
+    # NOTE: ChromaDB не гарантирует порядок, поэтому 'первые' N документов -
+    # это просто первые N записей, которые вернет get(limit=N).
+    # Идентификаторы чанков имеют вид 'source:page:n' (см. VectorStoreManager.make_chunk_ids).
     try:
         results = collection.get(
-            ids=ids_to_fetch,
+            limit=n_documents,
             include=['documents', 'metadatas']
         )
     except Exception as e:
-        # Если IDs не найдены (например, база была перезаписана)
-        print(f"Ошибка при извлечении документов по ID: {e}")
-        # Попробуем извлечь без указания ID (если IDs не последовательные)
+        print(f"Ошибка при извлечении документов: {e}")
         results = collection.peek(limit=n_documents)
 
     # 3. Преобразование результатов в формат Document
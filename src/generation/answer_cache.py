@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+from pathlib import Path
+
+from src.ingestion.chunk_links import ChunkLinks
+from src.retrieval.cache import RetrievalCache
+from src.core.config import (ANSWER_CACHE_PATH, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS,
+                             ANSWER_CACHE_LINKS_TABLE)
+
+# SQLite ограничивает число параметров в одном запросе
+_SQL_BATCH = 500
+
+class AnswerCache:
+    """
+    Дисковый кэш готовых ответов LLM в SQLite.
+    Ключ - SHA-256 от (нормализованный запрос, id найденных чанков по порядку,
+    версия шаблона промпта, имя модели). Связи ответа с чанками, на которых он
+    построен, хранятся в таблице ChunkLinks: VectorStoreManager снимает их при
+    переиндексации или удалении любого из чанков, и ответ без связей считается
+    устаревшим (удаляется при чтении и при вытеснении).
+    Записи старше ttl_seconds не возвращаются; сверх max_entries вытесняются
+    самые давно использованные.
+    Ответ хранится частями, как он пришел из потока, вместе со средним интервалом
+    между частями, чтобы при выдаче из кэша воспроизвести темп генерации.
+    """
+    def __init__(self, path: Path = ANSWER_CACHE_PATH, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY, tokens TEXT NOT NULL, token_interval REAL NOT NULL,
+                created REAL NOT NULL, last_access INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS idx_answers_last_access ON answers(last_access);
+        """)
+        self.links = ChunkLinks(self.conn, ANSWER_CACHE_LINKS_TABLE)
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(query: str, chunk_ids: List[str], template_version: str, model_name: str) -> str:
+        data = json.dumps([RetrievalCache.normalize(query), chunk_ids, template_version, model_name],
+                          ensure_ascii=False)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[List[str], float]]:
+        """
+        Возвращает (части ответа, средний интервал между ними в секундах) или None.
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT tokens, token_interval, created FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[2] + self.ttl < time.time() or not self.links.is_linked(key):
+                if row is not None:
+                    self._delete_keys([key])
+                    self.conn.commit()
+                self.misses += 1
+                return None
+
+            self.conn.execute("UPDATE answers SET last_access = ? WHERE key = ?", (time.time_ns(), key))
+            self.conn.commit()
+            self.hits += 1
+            return json.loads(row[0]), row[1]
+
+    def put(self, key: str, chunk_ids: List[str], tokens: List[str], token_interval: float,
+            is_current: Optional[Callable[[], bool]] = None) -> bool:
+        """
+        Сохраняет ответ и его связь с чанками.
+
+        is_current проверяет, что индекс не менялся с момента поиска (ответ построен
+        на актуальном тексте чанков). Проверка идет под блокировкой записи SQLite:
+        индексация меняет версию индекса до того, как снимает связи (ChunkLinks),
+        поэтому ответ либо сохраняется раньше и его связи снимаются, либо видит
+        новую версию и не сохраняется.
+
+        Возвращает:
+            bool: Ответ сохранен.
+        """
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            if is_current is not None and not is_current():
+                self.conn.rollback()
+                return False
+            try:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO answers (key, tokens, token_interval, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, json.dumps(tokens, ensure_ascii=False), token_interval, now, time.time_ns())
+                )
+                self.links.link(key, chunk_ids)
+                self._evict()
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return True
+
+    def invalidate_chunks(self, chunk_ids: List[str]) -> int:
+        """
+        Удаляет ответы, построенные на любом из указанных чанков.
+
+        Возвращает:
+            int: Количество удаленных ответов.
+        """
+        with self._lock:
+            keys = self.links.unlink_chunks(chunk_ids)
+            self._delete_keys(keys)
+            self.conn.commit()
+        return len(keys)
+
+    def _delete_keys(self, keys: List[str]):
+        for start in range(0, len(keys), _SQL_BATCH):
+            batch = keys[start:start + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            self.conn.execute(f"DELETE FROM answers WHERE key IN ({placeholders})", batch)
+        self.links.unlink_keys(keys)
+
+    def _evict(self):
+        """
+        Удаляет просроченные записи, записи без связей с чанками (чанки переиндексированы)
+        и самые давно использованные сверх max_entries.
+        """
+        expired = [key for (key,) in self.conn.execute(
+            f"SELECT key FROM answers WHERE created < ? OR key NOT IN (SELECT key FROM {self.links.table})",
+            (time.time() - self.ttl,)
+        )]
+        count = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - len(expired)
+        excess = count - self.max_entries
+        if excess > 0:
+            expired += [key for (key,) in self.conn.execute(
+                f"SELECT key FROM answers WHERE created >= ? AND key IN (SELECT key FROM {self.links.table}) "
+                "ORDER BY last_access LIMIT ?",
+                (time.time() - self.ttl, excess)
+            )]
+        self._delete_keys(expired)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries,
+            'max_entries': self.max_entries,
+        }
+
+    def close(self):
+        self.conn.close()
+
+async def replay(tokens: List[str], token_interval: float, speed: float = 1.0) -> AsyncIterator[str]:
+    """
+    Отдает сохраненный ответ частями с темпом исходной генерации, ускоренным в speed раз
+    (интервал между частями - token_interval / speed; speed=0 - сразу целиком, без задержек).
+    """
+    delay = token_interval / speed if speed > 0 else 0.0
+    for i, token in enumerate(tokens):
+        if i and delay > 0:
+            await asyncio.sleep(delay)
+        yield token
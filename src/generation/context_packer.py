@@ -0,0 +1,155 @@
+import math
+import re
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from langchain.schema.document import Document
+
+from src.ingestion.model_registry import get_tokenizer
+from src.core.config import (
+    LLM_TOKENIZER_NAME, CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUP_THRESHOLD, CHUNK_OVERLAP
+)
+
+# Запас на заголовок фрагмента ("[ФРАГМЕНТ N] Источник: ..., страница N") и разделитель
+_FRAGMENT_OVERHEAD_TOKENS = 16
+# Перекрытие короче этого считается случайным совпадением, а не перекрытием чанков
+_MIN_OVERLAP_CHARS = 20
+_WORD_RE = re.compile(r"\w+")
+
+class ContextPacker:
+    """
+    Упаковывает найденные чанки в контекст промпта в пределах бюджета токенов:
+    1. чанки, почти дублирующие более релевантные (общие триграммы слов), отбрасываются;
+    2. чанки одной страницы (source + page) объединяются в один фрагмент:
+       соседние с перекрытием (CHUNK_OVERLAP) склеиваются без повтора текста,
+       несмежные разделяются "[...]";
+    3. чанки добавляются в порядке релевантности, пока фрагменты укладываются в бюджет.
+    Фрагменты сохраняют source и page, поэтому цитирование не меняется.
+    Токены считаются токенизатором LLM (Qwen); если он недоступен - по оценке длины текста.
+    """
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+                 tokenizer_name: str = LLM_TOKENIZER_NAME):
+        self.token_budget = token_budget
+        self.dedup_threshold = dedup_threshold
+        self.tokenizer_name = tokenizer_name
+        self._count: Optional[Callable[[str], int]] = None
+
+        self.last_stats: Dict[str, int] = {}
+
+    def count_tokens(self, text: str) -> int:
+        if self._count is None:
+            try:
+                tokenizer = get_tokenizer(self.tokenizer_name)
+                self._count = lambda s: len(tokenizer.encode(s, add_special_tokens=False))
+            except Exception as e:
+                # ~2.5 символа на токен для русского текста - оценка с запасом
+                print(f"Токенизатор {self.tokenizer_name} недоступен ({e}), токены оцениваются по длине текста.")
+                self._count = lambda s: math.ceil(len(s) / 2.5)
+        return self._count(text)
+
+    def pack(self, documents: List[Document], token_budget: Optional[int] = None) -> List[Document]:
+        """
+        Аргументы:
+            documents: Чанки в порядке убывания релевантности (как их вернул Retriever).
+            token_budget: Бюджет токенов на контекст (по умолчанию - self.token_budget).
+
+        Возвращает:
+            List[Document]: Фрагменты в порядке релевантности лучшего чанка. В метаданных -
+                            source, filename, page и chunk_ids (id вошедших чанков через запятую).
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+
+        # page_key -> (чанки фрагмента, токены фрагмента); порядок вставки = порядок релевантности
+        groups: Dict[Tuple[str, object], Tuple[List[Document], int]] = {}
+        kept_shingles: List[Set[Tuple[str, ...]]] = []
+        used_tokens = 0
+        duplicates = over_budget = 0
+
+        for doc in documents:
+            shingles = self._shingles(doc.page_content)
+            if any(self._similarity(shingles, kept) >= self.dedup_threshold for kept in kept_shingles):
+                duplicates += 1
+                continue
+
+            key = (doc.metadata.get('source', ''), doc.metadata.get('page'))
+            members, tokens = groups.get(key, ([], 0))
+            new_tokens = self.count_tokens(self._merge_text(members + [doc])) + _FRAGMENT_OVERHEAD_TOKENS
+            if used_tokens - tokens + new_tokens > budget:
+                over_budget += 1
+                continue
+
+            groups[key] = (members + [doc], new_tokens)
+            used_tokens += new_tokens - tokens
+            kept_shingles.append(shingles)
+
+        self.last_stats = {
+            'chunks_in': len(documents),
+            'fragments': len(groups),
+            'duplicates': duplicates,
+            'over_budget': over_budget,
+            'tokens': used_tokens,
+        }
+        return [self._make_fragment(members) for members, _ in groups.values()]
+
+    @staticmethod
+    def _chunk_number(doc: Document) -> Optional[int]:
+        # id чанка: 'source:page:n'
+        try:
+            return int(str(doc.metadata.get('id', '')).rsplit(':', 1)[1])
+        except (IndexError, ValueError):
+            return None
+
+    @classmethod
+    def _merge_text(cls, members: List[Document]) -> str:
+        """
+        Текст фрагмента страницы: чанки в порядке следования на странице,
+        перекрытие соседних чанков выводится один раз.
+        """
+        ordered = sorted(members, key=lambda doc: (cls._chunk_number(doc) is None, cls._chunk_number(doc) or 0))
+        text = ordered[0].page_content
+        for previous, doc in zip(ordered, ordered[1:]):
+            number, previous_number = cls._chunk_number(doc), cls._chunk_number(previous)
+            if number is not None and previous_number is not None and number == previous_number + 1:
+                overlap = cls._overlap(text, doc.page_content)
+                text += doc.page_content[overlap:] if overlap else "\n" + doc.page_content
+            else:
+                text += "\n[...]\n" + doc.page_content
+        return text
+
+    @staticmethod
+    def _overlap(left: str, right: str) -> int:
+        """
+        Длина самого длинного конца left, совпадающего с началом right (не больше CHUNK_OVERLAP).
+        """
+        for size in range(min(len(left), len(right), CHUNK_OVERLAP), _MIN_OVERLAP_CHARS - 1, -1):
+            if left.endswith(right[:size]):
+                return size
+        return 0
+
+    @classmethod
+    def _make_fragment(cls, members: List[Document]) -> Document:
+        first = members[0]
+        metadata = {
+            'source': first.metadata.get('source', 'Неизвестный источник'),
+            'filename': first.metadata.get('filename'),
+            'page': first.metadata.get('page', '?'),
+            'chunk_ids': ",".join(str(doc.metadata.get('id', '')) for doc in members),
+        }
+        return Document(page_content=cls._merge_text(members), metadata=metadata)
+
+    @staticmethod
+    def _shingles(text: str) -> Set[Tuple[str, ...]]:
+        words = _WORD_RE.findall(text.lower())
+        if len(words) < 3:
+            return {tuple(words)}
+        return {tuple(words[i:i + 3]) for i in range(len(words) - 2)}
+
+    @staticmethod
+    def _similarity(a: Set[Tuple[str, ...]], b: Set[Tuple[str, ...]]) -> float:
+        """
+        Доля триграмм меньшего из текстов, встречающихся в другом
+        (чанк, целиком содержащийся в другом, тоже дубликат).
+        """
+        if not a or not b:
+            return 0.0
+        return len(a & b) / min(len(a), len(b))
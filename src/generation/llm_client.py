@@ -1,52 +1,215 @@
-from typing import List
-import requests
+import asyncio
 import json
+import random
+from typing import AsyncIterator, Dict, List, Optional, Union
+
+import aiohttp
 from langchain.schema.document import Document
 
-from src.core.config import (LLM_API_URL, LLM_TOKEN, LLM_MODEL_NAME, LLM_MAX_TOKENS)
+from src.generation.prompt_builder import PromptBuilder
+from src.core.config import (
+    LLM_API_URL, LLM_TOKEN, LLM_MODEL_NAME, LLM_MAX_TOKENS, LLM_CHAT_COMPLETIONS_PATH, LLM_VERIFY_SSL,
+    LLM_MAX_CONNECTIONS, LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT,
+    LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY, LLM_CACHE_HINT_FIELD
+)
+
+# Промпт: строка (одно user-сообщение) или готовый список сообщений chat-API
+Prompt = Union[str, List[Dict[str, str]]]
+
+# Статусы, при которых запрос можно повторить
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+class LLMError(Exception):
+    """
+    Ошибка обращения к LLM (после исчерпания повторов или при обрыве потока).
+    """
+
+class _RetryableStatus(Exception):
+    def __init__(self, status: int, retry_after: Optional[float]):
+        super().__init__(f"HTTP {status}")
+        self.retry_after = retry_after
 
 class LLMClient:
-    def __init__(self):
-        self.api_url = LLM_API_URL
-        self.token = LLM_TOKEN
-        self.model_name = LLM_MODEL_NAME
-        self.headers = {'Authorization': f"Bearer {LLM_API_TOKEN}",
-        'Content-Type': "application/json"}
+    """
+    Асинхронный клиент OpenAI-совместимого API LLM.
+    Соединения берутся из пула keep-alive сессии aiohttp, ответ приходит
+    потоком токенов (server-sent events). Сетевые ошибки, таймауты, 429 и 5xx
+    повторяются с экспоненциальной задержкой и случайным разбросом, но только
+    до первого полученного токена.
+    """
+    def __init__(self, api_url: str = LLM_API_URL, token: str = LLM_TOKEN, model_name: str = LLM_MODEL_NAME,
+                 max_tokens: int = LLM_MAX_TOKENS, max_connections: int = LLM_MAX_CONNECTIONS,
+                 connect_timeout: float = LLM_CONNECT_TIMEOUT, read_timeout: float = LLM_READ_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES, verify_ssl: bool = LLM_VERIFY_SSL,
+                 cache_hint_field: Optional[str] = LLM_CACHE_HINT_FIELD):
+        self.api_url = api_url.rstrip("/") + LLM_CHAT_COMPLETIONS_PATH
+        self.token = token
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.verify_ssl = verify_ssl
+        self.cache_hint_field = cache_hint_field
+        # sock_read - пауза между частями потока, а не длительность всего ответа
+        self.timeout = aiohttp.ClientTimeout(total=None, connect=connect_timeout, sock_read=read_timeout)
+        self.headers = {'Authorization': f"Bearer {self.token}",
+                        'Content-Type': "application/json",
+                        'Accept': "text/event-stream"}
+        self.prompt_builder = PromptBuilder()
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.retries = 0
         print("LLMClient инициализирован.")
 
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Сессия с пулом соединений, одна на event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, ssl=None if self.verify_ssl else False)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers=self.headers)
+            self._loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self) -> "LLMClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _payload(self, prompt: Prompt, max_tokens: Optional[int], cache_key: Optional[str]) -> dict:
+        payload = {
+            "model": self.model_name,
+            "messages": [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt,
+            "max_tokens": max_tokens or self.max_tokens,
+            "stream": True,
+        }
+        if cache_key and self.cache_hint_field:
+            payload[self.cache_hint_field] = cache_key
+        return payload
+
+    async def stream(self, prompt: Prompt, max_tokens: Optional[int] = None,
+                     cache_key: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Генерирует ответ на промпт, отдавая текст по мере поступления токенов.
+        cache_key - подсказка кэша префикса (отправляется, если задано поле cache_hint_field).
+
+        Исключения:
+            LLMError: Повторы исчерпаны, ответ с ошибкой или поток оборвался после первого токена.
+        """
+        payload = self._payload(prompt, max_tokens, cache_key)
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                async with self._get_session().post(self.api_url, json=payload) as response:
+                    if response.status in RETRY_STATUSES:
+                        raise _RetryableStatus(response.status, self._retry_after(response))
+                    if response.status >= 400:
+                        raise LLMError(f"HTTP {response.status}: {(await response.text())[:500]}")
+                    async for token in self._iter_sse(response):
+                        started = True
+                        yield token
+                    return
+            except (aiohttp.ClientError, asyncio.TimeoutError, _RetryableStatus) as e:
+                error = str(e) or type(e).__name__
+                # Повтор после первого токена продублировал бы уже отданный текст
+                if started:
+                    raise LLMError(f"Поток ответа LLM прерван: {error}") from e
+                if attempt == self.max_retries:
+                    raise LLMError(f"LLM недоступна после {attempt + 1} попыток: {error}") from e
+                delay = self._retry_delay(attempt, getattr(e, 'retry_after', None))
+                self.retries += 1
+                print(f"Ошибка запроса к LLM ({error}), повтор через {delay:.2f} с.")
+                await asyncio.sleep(delay)
+
+    async def agenerate(self, prompt: Prompt, max_tokens: Optional[int] = None,
+                        cache_key: Optional[str] = None) -> str:
+        """
+        Полный ответ на промпт одной строкой.
+        """
+        return "".join([token async for token in self.stream(prompt, max_tokens, cache_key)])
+
+    async def agenerate_response(self, query: str, context: List[Document]) -> str:
+        """
+        Собирает RAG-промпт из вопроса и контекста и возвращает ответ LLM.
+        """
+        messages = self.prompt_builder.build_messages(query, context)
+        return await self.agenerate(messages, cache_key=self.prompt_builder.cache_key)
+
     def generate_response(self, query: str, context: List[Document]) -> str:
         """
-        Отправляет запрос на генерацию ответа в LLM.
+        Синхронная обертка для скриптов без event loop.
 
         Аргументы:
             query: Вопрос пользователя.
             context: Список релевантных чанков.
-            
+
         Возвращает:
             str: Сгенерированный ответ LLM или сообщение об ошибке.
         """
-        payload = {
-            "model": self.model_name,
-            "max_tokens": self.max_tokens
-            }
-        
+        async def run() -> str:
+            try:
+                return await self.agenerate_response(query, context)
+            finally:
+                await self.close()
+
         print(f"Отправка запроса к {self.model_name}.")
-        
         try:
-            response = requests.post(self.api_url, headers=self.headers, json=payload, verify=False)
-            response.raise_for_status()
-
-            response_data = response.json()[0]['generated_text']
-            
-            # Извлечение сгенерированного текста
-            if response_data:
-                return response_data
-            else:
-                return f"LLM не вернула ответ. Детали: {response_data}"
-
-        except requests.exceptions.RequestException as e:
-            return f"Ошибка HTTP-запроса к LLM: {e}"
-        except json.JSONDecodeError:
-            return "Ошибка декодирования JSON-ответа от LLM."
-        except Exception as e:
-            return f"Ошибка при генерации ответа: {e}"
\ No newline at end of file
+            return asyncio.run(run())
+        except LLMError as e:
+            return f"Ошибка при генерации ответа: {e}"
+
+    @staticmethod
+    async def _iter_sse(response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+        """
+        Разбирает поток server-sent events: события разделены пустой строкой,
+        данные - в строках 'data:'. Поток заканчивается событием '[DONE]'.
+        """
+        data_lines: List[str] = []
+        async for raw_line in response.content:
+            line = raw_line.decode("utf-8").rstrip("\r\n")
+            if line.startswith("data:"):
+                data_lines.append(line[5:].removeprefix(" "))
+                continue
+            # Комментарии и поля event/id/retry не нужны
+            if line or not data_lines:
+                continue
+
+            data, data_lines = "\n".join(data_lines), []
+            if data == "[DONE]":
+                return
+            try:
+                chunk = json.loads(data)
+            except json.JSONDecodeError:
+                raise LLMError(f"Некорректное событие в потоке LLM: {data[:200]}")
+            if 'error' in chunk:
+                raise LLMError(f"LLM вернула ошибку: {chunk['error']}")
+            for choice in chunk.get('choices', []):
+                content = (choice.get('delta') or {}).get('content')
+                if content:
+                    yield content
+
+    @staticmethod
+    def _retry_after(response: aiohttp.ClientResponse) -> Optional[float]:
+        try:
+            return float(response.headers.get('Retry-After', ''))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _retry_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Full jitter: случайная задержка от 0 до base * 2^attempt (не больше LLM_RETRY_MAX_DELAY).
+        Если сервер прислал Retry-After, ждем не меньше него.
+        """
+        delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, LLM_RETRY_MAX_DELAY))
+        return delay
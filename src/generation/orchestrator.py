@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from langchain.schema.document import Document
+
+from src.generation.answer_cache import AnswerCache, replay
+from src.generation.llm_client import LLMClient
+from src.retrieval.retriever import Retriever
+from src.core.config import (RAG_MAX_CONCURRENT_RETRIEVALS, RAG_MAX_CONCURRENT_GENERATIONS,
+                             ANSWER_CACHE_ENABLED, ANSWER_CACHE_REPLAY_SPEED)
+
+class RAGAnswer:
+    """
+    Ответ оркестратора: найденные документы, сообщения промпта и поток токенов LLM.
+    Генерация начинается при итерации по ответу (async for token in answer).
+    В timings - длительности этапов в мс; ttft и total отсчитываются от начала запроса.
+    Для ответа из кэша (cached=True) промпт не собирается, а поток воспроизводит сохраненный ответ.
+    """
+    def __init__(self, query: str, documents: List[Document], prompt: Optional[List[Dict[str, str]]],
+                 timings: Dict[str, float], started_at: float, stream: Callable[[], AsyncIterator[str]],
+                 cached: bool = False):
+        self.query = query
+        self.documents = documents
+        self.prompt = prompt
+        self.timings = timings
+        self.cached = cached
+        self.text = ""
+        self._started_at = started_at
+        self._stream = stream
+        self._consumed = False
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        if self._consumed:
+            raise RuntimeError("Поток ответа уже прочитан, используйте answer.text")
+        self._consumed = True
+
+        parts: List[str] = []
+        async for token in self._stream():
+            if not parts:
+                self.timings['ttft'] = (time.perf_counter() - self._started_at) * 1000
+            parts.append(token)
+            yield token
+        self.text = "".join(parts)
+        self.timings['total'] = (time.perf_counter() - self._started_at) * 1000
+
+    async def read(self) -> str:
+        """
+        Дочитывает поток и возвращает полный текст ответа.
+        """
+        if not self._consumed:
+            async for _ in self:
+                pass
+        return self.text
+
+class RAGOrchestrator:
+    """
+    Единая точка входа RAG: поиск контекста -> сборка промпта -> потоковая генерация.
+    Ретривер, сборщик промптов и клиент LLM создаются один раз и используются
+    всеми запросами event loop. Число одновременно выполняемых запросов
+    ограничено отдельно для поиска и для генерации, чтобы медленная LLM
+    не задерживала поиск для новых запросов и наоборот.
+    Ответы на тот же запрос по тем же чанкам берутся из AnswerCache без обращения к LLM.
+    """
+    def __init__(self, retriever: Optional[Retriever] = None, llm_client: Optional[LLMClient] = None,
+                 max_concurrent_retrievals: int = RAG_MAX_CONCURRENT_RETRIEVALS,
+                 max_concurrent_generations: int = RAG_MAX_CONCURRENT_GENERATIONS,
+                 use_answer_cache: bool = ANSWER_CACHE_ENABLED):
+        self.retriever = retriever or Retriever()
+        self.llm = llm_client or LLMClient()
+        self.prompt_builder = self.llm.prompt_builder
+        self.answer_cache: Optional[AnswerCache] = AnswerCache() if use_answer_cache else None
+        self._retrieval_slots = asyncio.Semaphore(max_concurrent_retrievals)
+        self._generation_slots = asyncio.Semaphore(max_concurrent_generations)
+
+    async def answer(self, query: str, products: Optional[List[str]] = None) -> RAGAnswer:
+        """
+        Находит контекст и собирает промпт; генерация идет при чтении ответа.
+
+        Аргументы:
+            query: Вопрос пользователя.
+            products: Продукты для поиска (None - определить по запросу).
+
+        Возвращает:
+            RAGAnswer: Документы, промпт, тайминги и поток токенов.
+
+        Пример:
+            answer = await orchestrator.answer("Как обновить zVirt?")
+            async for token in answer:
+                print(token, end="")
+            print(answer.timings)
+        """
+        started_at = time.perf_counter()
+        timings: Dict[str, float] = {}
+
+        async with self._retrieval_slots:
+            timings['retrieval_queue'] = (time.perf_counter() - started_at) * 1000
+            start = time.perf_counter()
+            # Версия индекса до поиска: ответ не сохраняется в кэш, если индекс изменился во время генерации
+            index_version = self.retriever.manager.get_index_version()
+            documents = await self.retriever.aretrieve(query, products, timings)
+            timings['retrieval'] = (time.perf_counter() - start) * 1000
+
+        # Кэш ответов: тот же запрос по тем же чанкам с тем же шаблоном и моделью
+        chunk_ids = [doc.metadata.get('id', '') for doc in documents]
+        cache_key = None
+        if self.answer_cache and documents:
+            start = time.perf_counter()
+            cache_key = AnswerCache.make_key(query, chunk_ids, self.prompt_builder.template_version,
+                                             self.llm.model_name)
+            cached = await asyncio.to_thread(self.answer_cache.get, cache_key)
+            timings['answer_cache'] = (time.perf_counter() - start) * 1000
+            if cached is not None:
+                tokens, token_interval = cached
+                return RAGAnswer(query, documents, None, timings, started_at,
+                                 lambda: replay(tokens, token_interval, ANSWER_CACHE_REPLAY_SPEED), cached=True)
+
+        start = time.perf_counter()
+        prompt = self.prompt_builder.build_messages(query, documents)
+        timings['prompt'] = (time.perf_counter() - start) * 1000
+
+        async def stream() -> AsyncIterator[str]:
+            queued_at = time.perf_counter()
+            async with self._generation_slots:
+                timings['generation_queue'] = (time.perf_counter() - queued_at) * 1000
+                start = time.perf_counter()
+                tokens: List[str] = []
+                first_token_at = last_token_at = 0.0
+                async for token in self.llm.stream(prompt, cache_key=self.prompt_builder.cache_key):
+                    last_token_at = time.perf_counter()
+                    first_token_at = first_token_at or last_token_at
+                    tokens.append(token)
+                    yield token
+                timings['generation'] = (time.perf_counter() - start) * 1000
+
+            # В кэш попадают только полностью полученные ответы
+            if cache_key and tokens:
+                token_interval = (last_token_at - first_token_at) / max(len(tokens) - 1, 1)
+                await asyncio.to_thread(self.answer_cache.put, cache_key, chunk_ids, tokens, token_interval,
+                                        lambda: self.retriever.manager.get_index_version() == index_version)
+
+        return RAGAnswer(query, documents, prompt, timings, started_at, stream)
+
+    async def answer_text(self, query: str, products: Optional[List[str]] = None) -> RAGAnswer:
+        """
+        То же, что answer, но с уже прочитанным ответом (answer.text).
+        """
+        answer = await self.answer(query, products)
+        await answer.read()
+        return answer
+
+    async def close(self):
+        await self.llm.close()
+
+def format_timings(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{stage} {ms:.1f} мс" for stage, ms in timings.items())
+
+async def _main(queries: List[str], api_url: Optional[str]):
+    orchestrator = RAGOrchestrator(llm_client=LLMClient(api_url=api_url) if api_url else None)
+    try:
+        if len(queries) == 1:
+            answer = await orchestrator.answer(queries[0])
+            async for token in answer:
+                print(token, end="", flush=True)
+            print(f"\n\nИсточники: {', '.join(doc.metadata.get('source', '?') for doc in answer.documents)}")
+            print(f"Тайминги: {format_timings(answer.timings)}")
+            return
+
+        # Несколько запросов - одновременно, в одном event loop
+        answers = await asyncio.gather(*(orchestrator.answer_text(query) for query in queries))
+        for answer in answers:
+            print(f"- {answer.query[:60]}: {format_timings(answer.timings)}")
+    finally:
+        await orchestrator.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ответ на вопросы по документации (поиск + LLM)")
+    parser.add_argument("queries", nargs="+", help="Вопросы; несколько выполняются одновременно")
+    parser.add_argument("--api-url", default=None, help="Адрес LLM, например заглушки http://127.0.0.1:8089")
+    args = parser.parse_args()
+
+    asyncio.run(_main(args.queries, args.api_url))
+
+# запуск: python -m src.generation.orchestrator "Как настроить резервное копирование в zVirt?"
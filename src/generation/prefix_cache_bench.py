@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from typing import Dict, List
+
+from langchain.schema.document import Document
+
+from src.generation.llm_client import LLMClient
+from src.generation.prompt_builder import PromptBuilder
+from src.generation.stub_server import start_stub_server
+
+def make_requests(n_requests: int, n_chunks: int, seed: int = 0) -> List[tuple]:
+    """
+    Синтетические запросы: вопрос и n_chunks чанков по ~1000 символов (разные в каждом запросе).
+    """
+    rng = random.Random(seed)
+    vocabulary = [f"термин{i}" for i in range(5000)]
+    requests = []
+    for i in range(n_requests):
+        documents = [
+            Document(
+                page_content=" ".join(rng.choice(vocabulary) for _ in range(110)),
+                metadata={'source': f"nova/doc_{rng.randrange(50)}.pdf", 'page': rng.randrange(1, 300)}
+            )
+            for _ in range(n_chunks)
+        ]
+        requests.append((f"Вопрос {i}: как настроить {rng.choice(vocabulary)}?", documents))
+    return requests
+
+async def measure(builder: PromptBuilder, client: LLMClient, requests: List[tuple]) -> Dict[str, float]:
+    """
+    TTFT (от начала сборки промпта до первого токена) и время сборки промпта для последовательных запросов.
+    """
+    ttfts, build_times = [], []
+    for query, documents in requests:
+        start = time.perf_counter()
+        messages = builder.build_messages(query, documents)
+        build_times.append(time.perf_counter() - start)
+        async for _ in client.stream(messages, max_tokens=1, cache_key=builder.cache_key):
+            ttfts.append(time.perf_counter() - start)
+    await client.close()
+
+    ttfts_ms = sorted(1000 * t for t in ttfts)
+    return {
+        'ttft_mean_ms': statistics.mean(ttfts_ms),
+        'ttft_p50_ms': ttfts_ms[len(ttfts_ms) // 2],
+        'ttft_p95_ms': ttfts_ms[min(len(ttfts_ms) - 1, int(0.95 * len(ttfts_ms)))],
+        'prompt_build_us': 1e6 * statistics.mean(build_times),
+    }
+
+def run_benchmark(n_requests: int = 50, n_chunks: int = 5, prefill_ms: float = 60, base_ttft_ms: float = 20) -> Dict[str, dict]:
+    """
+    Сравнивает TTFT на заглушке LLM, моделирующей префилл и кэш префиксов:
+    - prefix_layout: статический system-префикс + user-сообщение (PROMPT_PREFIX_LAYOUT);
+    - single_message: весь промпт TEMPLATE одним user-сообщением;
+    - no_prefix_cache: раскладка с префиксом на сервере без кэша префиксов (нижняя граница).
+    Каждый вариант запускается на новой заглушке (холодный кэш).
+    """
+    requests = make_requests(n_requests, n_chunks)
+    variants = [
+        ('prefix_layout', True, True),
+        ('single_message', False, True),
+        ('no_prefix_cache', True, False),
+    ]
+
+    results: Dict[str, dict] = {}
+    for name, use_prefix_layout, prefix_cache in variants:
+        server = start_stub_server(ttft_ms=base_ttft_ms, token_ms=0, prefill_ms=prefill_ms, prefix_cache=prefix_cache)
+        # Упаковка контекста отключена: сравнивается только раскладка промпта
+        builder = PromptBuilder(use_packing=False, use_prefix_layout=use_prefix_layout)
+        client = LLMClient(api_url=server.url, cache_hint_field="prompt_cache_key")
+        metrics = asyncio.run(measure(builder, client, requests))
+        metrics['prefix_cache_hit_ratio'] = server.cached_chars / server.prompt_chars
+        metrics['cache_hints'] = server.cache_hints
+        server.shutdown()
+        server.server_close()
+        results[name] = metrics
+
+    print(f"\nЗапросов: {n_requests}, чанков в запросе: {n_chunks}, префилл {prefill_ms} мс / 1000 символов")
+    print(f"{'Вариант':<16} {'TTFT ср.':>9} {'p50':>8} {'p95':>8} {'сборка, мкс':>12} {'из кэша':>8}")
+    for name, metrics in results.items():
+        print(f"{name:<16} {metrics['ttft_mean_ms']:>9.1f} {metrics['ttft_p50_ms']:>8.1f} "
+              f"{metrics['ttft_p95_ms']:>8.1f} {metrics['prompt_build_us']:>12.1f} "
+              f"{metrics['prefix_cache_hit_ratio']:>8.1%}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TTFT при разной раскладке промпта (на локальной заглушке LLM)")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--chunks", type=int, default=5, help="Чанков контекста в запросе")
+    parser.add_argument("--prefill-ms", type=float, default=60, help="Префилл заглушки, мс на 1000 символов")
+    parser.add_argument("--output", default=None, help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.requests, args.chunks, args.prefill_ms)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+# запуск: python -m src.generation.prefix_cache_bench --requests 50 --chunks 5
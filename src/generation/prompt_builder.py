@@ -1,6 +1,10 @@
-from typing import List
+import hashlib
+from typing import Dict, List, Optional
 from langchain.schema.document import Document
 
+from src.generation.context_packer import ContextPacker
+from src.core.config import CONTEXT_PACKING_ENABLED, LLM_CONTEXT_WINDOW, LLM_MAX_TOKENS, PROMPT_PREFIX_LAYOUT
+
 SYSTEM_PROMPT = """
 1. Роль
 Ты — OrionGPT, внутренний "умный" ассистент для сотрудников (инженеров, BDM, presale) компании Orion soft.
@@ -29,16 +33,59 @@ TEMPLATE = """
 Теперь, основываясь строго на предоставленной выше информации, дай полный и точный ответ.
 """
 
+# Раскладка для кэша префиксов сервера: все статичное - в system-сообщении,
+# которое одинаково до байта во всех запросах; в user-сообщении - только контекст и вопрос.
+PREFIX_INSTRUCTIONS = """
+4. Формат запроса
+Контекст, извлеченный из корпоративной документации, приходит в сообщении пользователя внутри тегов <КОНТЕКСТ>, вопрос - внутри тегов <ВОПРОС ПОЛЬЗОВАТЕЛЯ>.
+Основываясь строго на предоставленной информации, дай полный и точный ответ.
+"""
+
+USER_TEMPLATE = """<КОНТЕКСТ>
+{formatted_context}
+</КОНТЕКСТ>
+
+<ВОПРОС ПОЛЬЗОВАТЕЛЯ>
+{user_query}
+</ВОПРОС ПОЛЬЗОВАТЕЛЯ>"""
+
 class PromptBuilder:
     """
     Класс для сборки финального промпта для LLM, включающего
     системные инструкции, контекст и вопрос пользователя.
+    Контекст упаковывается ContextPacker-ом в бюджет токенов, который
+    к тому же не превышает окно модели за вычетом ответа и остального промпта.
+
+    При раскладке с префиксом (use_prefix_layout) build_messages возвращает
+    статический system-префикс, собранный один раз при инициализации, и
+    user-сообщение с контекстом и вопросом: сервер переиспользует KV-кэш префикса,
+    а cache_key (хеш префикса) передается как подсказка кэша, если сервер ее поддерживает.
     """
-    def __init__(self, system_prompt: str = SYSTEM_PROMPT, template: str = TEMPLATE):
+    def __init__(self, system_prompt: str = SYSTEM_PROMPT, template: str = TEMPLATE,
+                 use_packing: bool = CONTEXT_PACKING_ENABLED, use_prefix_layout: bool = PROMPT_PREFIX_LAYOUT):
         self.system_prompt = system_prompt
         self.template = template
+        self.packer: Optional[ContextPacker] = ContextPacker() if use_packing else None
+        self.use_prefix_layout = use_prefix_layout
+
+        # Статический префикс собирается (и при упаковке токенизируется) один раз
+        self.static_prefix = f"{system_prompt.strip()}\n\n{PREFIX_INSTRUCTIONS.strip()}"
+        self.prefix_key = hashlib.sha256(self.static_prefix.encode("utf-8")).hexdigest()[:16]
+        self._static_tokens: Optional[int] = None
+        # Версия шаблона для кэша ответов: меняется вместе с текстом шаблонов и настройками упаковки
+        packing = (self.packer.token_budget, self.packer.dedup_threshold) if self.packer else None
+        version_source = "\0".join(map(str, (system_prompt, template, PREFIX_INSTRUCTIONS, USER_TEMPLATE,
+                                               use_prefix_layout, packing)))
+        self.template_version = hashlib.sha256(version_source.encode("utf-8")).hexdigest()[:16]
         print("PromptBuilder инициализирован.")
 
+    @property
+    def cache_key(self) -> Optional[str]:
+        """
+        Подсказка кэша префикса для LLM (только при раскладке с префиксом).
+        """
+        return self.prefix_key if self.use_prefix_layout else None
+
     @staticmethod
     def format_context_for_prompt(documents: List[Document]) -> str:
         """
@@ -70,6 +117,10 @@ class PromptBuilder:
         Возвращает:
             str: Финальный промпт для отправки в LLM.
         """
+        # Склейка и отбор чанков в пределах бюджета токенов
+        if self.packer:
+            context_documents = self.packer.pack(context_documents, self._context_budget(user_query))
+
         # Форматируем контекст с помощью статического метода
         formatted_context = self.format_context_for_prompt(context_documents)
         
@@ -82,6 +133,43 @@ class PromptBuilder:
         
         return final_prompt
 
+    def build_messages(self, user_query: str, context_documents: List[Document]) -> List[Dict[str, str]]:
+        """
+        Собирает сообщения для chat-API LLM.
+
+        Возвращает:
+            List[Dict[str, str]]: [system: статический префикс, user: контекст и вопрос]
+                                  или одно user-сообщение с build_rag_prompt без раскладки с префиксом.
+        """
+        if not self.use_prefix_layout:
+            return [{"role": "user", "content": self.build_rag_prompt(user_query, context_documents)}]
+
+        if self.packer:
+            context_documents = self.packer.pack(context_documents, self._context_budget(user_query))
+        user_content = USER_TEMPLATE.format(
+            formatted_context=self.format_context_for_prompt(context_documents),
+            user_query=user_query
+        )
+        return [
+            {"role": "system", "content": self.static_prefix},
+            {"role": "user", "content": user_content},
+        ]
+
+    def _context_budget(self, user_query: str) -> int:
+        """
+        Бюджет токенов контекста: не больше настроенного и не больше того,
+        что остается в окне модели после шаблона, вопроса и ответа.
+        Токены статической части шаблона считаются один раз.
+        """
+        if self._static_tokens is None:
+            if self.use_prefix_layout:
+                static_text = self.static_prefix + USER_TEMPLATE.format(formatted_context="", user_query="")
+            else:
+                static_text = self.template.format(system_prompt=self.system_prompt, formatted_context="", user_query="")
+            self._static_tokens = self.packer.count_tokens(static_text)
+        prompt_tokens = self._static_tokens + self.packer.count_tokens(user_query)
+        return min(self.packer.token_budget, LLM_CONTEXT_WINDOW - LLM_MAX_TOKENS - prompt_tokens)
+
 if __name__ == "__main__":
     
     # Имитация данных, полученных от retriever
@@ -0,0 +1,204 @@
+import argparse
+import json
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from src.core.config import LLM_STUB_HOST, LLM_STUB_PORT, LLM_CHAT_COMPLETIONS_PATH
+
+DEFAULT_ANSWER = (
+    "Это ответ локальной заглушки LLM. Он приходит потоком токенов так же, "
+    "как ответ настоящей модели через OpenAI-совместимый API."
+)
+
+class StubLLMServer(ThreadingHTTPServer):
+    """
+    Локальная заглушка OpenAI-совместимого API (/v1/chat/completions) для офлайн-проверок клиента.
+    Отдает фиксированный ответ потоком SSE с заданными задержками до первого
+    токена и между токенами; первые fail_first запросов получают 503.
+
+    Префилл моделируется задержкой prefill_ms на каждую 1000 символов промпта,
+    которых нет в кэше префиксов. Кэш устроен как automatic prefix caching в vLLM:
+    промпт режется на блоки, блок переиспользуется, только если совпадает вместе
+    со всем, что перед ним.
+    """
+    daemon_threads = True
+    BLOCK_CHARS = 256
+    MAX_CACHED_BLOCKS = 100_000
+
+    def __init__(self, address: Tuple[str, int], answer: str = DEFAULT_ANSWER,
+                 ttft_ms: float = 200, token_ms: float = 20, fail_first: int = 0,
+                 prefill_ms: float = 0, prefix_cache: bool = True):
+        super().__init__(address, _StubHandler)
+        self.answer = answer
+        self.ttft = ttft_ms / 1000
+        self.token_delay = token_ms / 1000
+        self.fail_first = fail_first
+        self.prefill = prefill_ms / 1000
+        self.prefix_cache = prefix_cache
+        self._lock = threading.Lock()
+        self._blocks: "OrderedDict[int, None]" = OrderedDict()
+        self.requests = 0
+        self.connections = 0
+        self.prompt_chars = 0
+        self.cached_chars = 0
+        self.cache_hints = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def next_request(self) -> int:
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+    def handle_error(self, request, client_address):
+        # Клиент закрыл keep-alive соединение - не ошибка
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+    def prefill_delay(self, messages: List[dict]) -> float:
+        """
+        Задержка префилла с учетом кэша префиксов; блоки промпта добавляются в кэш.
+        """
+        text = "".join(f"<|{m.get('role', '')}|>{m.get('content', '')}" for m in messages)
+        chain, cached_blocks, prefix_matches = 0, 0, True
+        with self._lock:
+            for start in range(0, len(text) - self.BLOCK_CHARS + 1, self.BLOCK_CHARS):
+                chain = hash((chain, text[start:start + self.BLOCK_CHARS]))
+                if prefix_matches and self.prefix_cache and chain in self._blocks:
+                    cached_blocks += 1
+                    self._blocks.move_to_end(chain)
+                    continue
+                prefix_matches = False
+                self._blocks[chain] = None
+            while len(self._blocks) > self.MAX_CACHED_BLOCKS:
+                self._blocks.popitem(last=False)
+            cached_chars = cached_blocks * self.BLOCK_CHARS
+            self.prompt_chars += len(text)
+            self.cached_chars += cached_chars
+        return self.prefill * (len(text) - cached_chars) / 1000
+
+    def tokens(self, max_tokens: int):
+        # Токен - слово вместе с последующим пробелом
+        words = self.answer.split(" ")
+        return ([word + " " for word in words[:-1]] + words[-1:])[:max_tokens]
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, поток - chunked
+    server: StubLLMServer
+
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path != LLM_CHAT_COMPLETIONS_PATH:
+            return self._send_json(404, {"error": f"unknown path {self.path}"})
+
+        if self.server.next_request() <= self.server.fail_first:
+            return self._send_json(503, {"error": "stub: temporary failure"}, retry_after="0")
+
+        try:
+            request = json.loads(body)
+        except json.JSONDecodeError:
+            return self._send_json(400, {"error": "invalid JSON"})
+        if not request.get('messages'):
+            return self._send_json(400, {"error": "messages are required"})
+
+        if request.get('prompt_cache_key'):
+            with self.server._lock:
+                self.server.cache_hints += 1
+        prefill = self.server.prefill_delay(request['messages'])
+        tokens = self.server.tokens(int(request.get('max_tokens', 1024)))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = request.get('model', 'stub')
+
+        if not request.get('stream'):
+            time.sleep(self.server.ttft + prefill + self.server.token_delay * len(tokens))
+            return self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                             "finish_reason": "stop"}],
+            })
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        time.sleep(self.server.ttft + prefill)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.server.token_delay)
+            self._send_event({
+                "id": completion_id, "object": "chat.completion.chunk", "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            })
+        self._send_event({
+            "id": completion_id, "object": "chat.completion.chunk", "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        })
+        self._send_chunk(b"data: [DONE]\n\n")
+        self._send_chunk(b"")
+
+    def _send_event(self, data: dict):
+        self._send_chunk(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    def _send_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, data: dict, retry_after: Optional[str] = None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if retry_after is not None:
+            self.send_header('Retry-After', retry_after)
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_stub_server(host: str = LLM_STUB_HOST, port: int = 0, **kwargs) -> StubLLMServer:
+    """
+    Запускает заглушку в фоновом потоке (port=0 - любой свободный порт).
+    Остановка: server.shutdown().
+    """
+    server = StubLLMServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальная заглушка OpenAI-совместимого API LLM")
+    parser.add_argument("--host", default=LLM_STUB_HOST)
+    parser.add_argument("--port", type=int, default=LLM_STUB_PORT)
+    parser.add_argument("--ttft-ms", type=float, default=200, help="Задержка до первого токена")
+    parser.add_argument("--token-ms", type=float, default=20, help="Задержка между токенами")
+    parser.add_argument("--fail-first", type=int, default=0, help="Сколько первых запросов получат 503")
+    parser.add_argument("--prefill-ms", type=float, default=0, help="Префилл, мс на 1000 символов вне кэша")
+    parser.add_argument("--no-prefix-cache", action="store_true", help="Отключить кэш префиксов")
+    args = parser.parse_args()
+
+    server = StubLLMServer((args.host, args.port), ttft_ms=args.ttft_ms, token_ms=args.token_ms,
+                           fail_first=args.fail_first, prefill_ms=args.prefill_ms,
+                           prefix_cache=not args.no_prefix_cache)
+    print(f"Заглушка LLM: {server.url}{LLM_CHAT_COMPLETIONS_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+# запуск: python -m src.generation.stub_server --port 8089
+# клиент: LLMClient(api_url="http://127.0.0.1:8089")
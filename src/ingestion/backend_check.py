@@ -0,0 +1,98 @@
+import argparse
+import random
+import time
+from typing import Dict, List
+
+import numpy as np
+from langchain.schema.document import Document
+
+from src.ingestion.embedder import Embedder
+from src.ingestion.model_registry import EMBEDDING_BACKENDS, unload_embedding_model
+from src.ingestion.vector_store import VectorStoreManager
+from src.core.config import EMBEDDING_MODEL_NAME, DEVICE
+
+def load_corpus_sample(sample_size: int) -> List[str]:
+    """
+    Берет первые sample_size чанков из коллекции ChromaDB (модель для этого не загружается).
+    """
+    collection = VectorStoreManager().get_or_create_collection()
+    if not collection:
+        return []
+    return collection.get(limit=sample_size, include=['documents'])['documents']
+
+def make_queries(texts: List[str], n_queries: int, seed: int = 0) -> List[str]:
+    """
+    Псевдозапросы: первое предложение (до 200 символов) случайных чанков выборки.
+    """
+    rng = random.Random(seed)
+    sampled = rng.sample(texts, min(n_queries, len(texts)))
+    return [text.strip().split(". ")[0][:200] for text in sampled]
+
+def top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """
+    Индексы k ближайших по косинусу чанков для каждого запроса.
+    """
+    corpus = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = queries @ corpus.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def run_backend_check(backends: List[str], sample_size: int = 2000, n_queries: int = 200, k: int = 10) -> Dict[str, dict]:
+    """
+    Сравнивает бэкенды эмбеддингов с fp32 ("torch") на выборке корпуса:
+    recall@k - доля совпадений top-k бэкенда с top-k fp32, плюс скорость.
+
+    Возвращает:
+        Dict[str, dict]: Метрики по каждому бэкенду.
+    """
+    texts = load_corpus_sample(sample_size)
+    if not texts:
+        print("Коллекция пуста. Сначала запустите индексацию.")
+        return {}
+    queries = make_queries(texts, n_queries)
+    chunks = [Document(page_content=text) for text in texts]
+    print(f"Выборка: {len(texts)} чанков, {len(queries)} запросов, k={k}")
+
+    baseline_top = None
+    results: Dict[str, dict] = {}
+    # fp32 всегда считается первым - это эталон
+    for backend in ["torch"] + [b for b in backends if b != "torch"]:
+        embedder = Embedder(use_cache=False, backend=backend)
+
+        start = time.perf_counter()
+        corpus = np.asarray(embedder.embed_documents(chunks), dtype=np.float32)
+        corpus_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        query_vectors = np.asarray([embedder.embed_query(query) for query in queries], dtype=np.float32)
+        query_time = time.perf_counter() - start
+
+        found = top_k(corpus, query_vectors, k)
+        if baseline_top is None:
+            baseline_top = found
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, baseline_top)])
+
+        results[backend] = {
+            f'recall@{k}_vs_fp32': float(recall),
+            'chunks_per_sec': len(texts) / corpus_time,
+            'ms_per_query': 1000 * query_time / len(queries),
+        }
+        unload_embedding_model(EMBEDDING_MODEL_NAME, DEVICE, backend)
+
+    print(f"\n{'Бэкенд':<12} {'recall@' + str(k):>10} {'чанков/с':>10} {'мс/запрос':>10}")
+    for backend, metrics in results.items():
+        print(f"{backend:<12} {metrics[f'recall@{k}_vs_fp32']:>10.4f} "
+              f"{metrics['chunks_per_sec']:>10.1f} {metrics['ms_per_query']:>10.1f}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Дрейф recall@k бэкендов эмбеддингов относительно fp32")
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--sample", type=int, default=2000, help="Количество чанков из коллекции")
+    parser.add_argument("--queries", type=int, default=200, help="Количество псевдозапросов")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    run_backend_check(args.backends, args.sample, args.queries, args.k)
+
+# запуск: python -m src.ingestion.backend_check --backends torch-int8 onnx
@@ -0,0 +1,55 @@
+import sqlite3
+from typing import Iterable, List
+
+# SQLite ограничивает число параметров в одном запросе
+_SQL_BATCH = 500
+
+class ChunkLinks:
+    """
+    Связи записей другого хранилища (например, ответов кэша LLM) с чанками, на которых
+    они построены: таблица (chunk_id, key) в SQLite-базе этого хранилища.
+    Таблицей владеет индексация: при переиндексации или удалении чанков
+    VectorStoreManager снимает все связи записей, построенных на них (unlink_chunks),
+    а хранилище считает запись без связей устаревшей. Так индексации не нужно знать
+    о хранилищах, которые зависят от чанков.
+
+    Методы не фиксируют транзакцию и не блокируют соединение - это делает владелец conn.
+    """
+    def __init__(self, conn: sqlite3.Connection, table: str):
+        self.conn = conn
+        self.table = table
+        self.conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                chunk_id TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (chunk_id, key)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_{table}_key ON {table}(key);
+        """)
+
+    def link(self, key: str, chunk_ids: Iterable[str]):
+        self.conn.executemany(f"INSERT OR IGNORE INTO {self.table} (chunk_id, key) VALUES (?, ?)",
+                              [(chunk_id, key) for chunk_id in set(chunk_ids)])
+
+    def is_linked(self, key: str) -> bool:
+        return self.conn.execute(f"SELECT 1 FROM {self.table} WHERE key = ? LIMIT 1", (key,)).fetchone() is not None
+
+    def unlink_chunks(self, chunk_ids: List[str]) -> List[str]:
+        """
+        Снимает все связи записей, построенных на любом из чанков.
+
+        Возвращает:
+            List[str]: Ключи этих записей.
+        """
+        keys = set()
+        for start in range(0, len(chunk_ids), _SQL_BATCH):
+            batch = chunk_ids[start:start + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            keys.update(key for (key,) in self.conn.execute(
+                f"SELECT key FROM {self.table} WHERE chunk_id IN ({placeholders})", batch
+            ))
+        self.unlink_keys(list(keys))
+        return list(keys)
+
+    def unlink_keys(self, keys: List[str]):
+        for start in range(0, len(keys), _SQL_BATCH):
+            batch = keys[start:start + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            self.conn.execute(f"DELETE FROM {self.table} WHERE key IN ({placeholders})", batch)
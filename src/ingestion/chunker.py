@@ -0,0 +1,152 @@
+from collections import deque
+from typing import Callable, Deque, List, Optional, Sequence, Tuple
+
+from src.core.config import CHUNK_SIZE, CHUNK_OVERLAP, SEPARATORS, CHUNK_LENGTH_UNIT, EMBEDDING_MODEL_NAME
+
+# Чанк - (индекс страницы во входном списке, начало, конец) в тексте страницы
+ChunkSpan = Tuple[int, int, int]
+# Часть текста при разбиении - (начало, конец, длина в символах или токенах)
+_Split = Tuple[int, int, int]
+
+class RecursiveChunker:
+    """
+    Рекурсивное разбиение текста по разделителям, дающее те же чанки, что и
+    RecursiveCharacterTextSplitter из LangChain с keep_separator=True и
+    strip_whitespace=True (настройки TextSplitter), но на смещениях: части текста
+    и окно склейки хранятся как пары (начало, конец), а строка создается
+    только для готового чанка.
+
+    Алгоритм тот же: берется первый разделитель, который есть в тексте; текст
+    режется перед каждым его вхождением; части короче chunk_size склеиваются
+    в чанки с перекрытием chunk_overlap, более длинные режутся следующим
+    разделителем. Чанк не выходит за пределы страницы.
+
+    length_unit="tokens" - размер и перекрытие в токенах токенизатора модели
+    эмбеддингов (как RecursiveCharacterTextSplitter.from_huggingface_tokenizer);
+    длины частей одного уровня считаются одним батчем.
+    """
+    def __init__(self, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                 separators: Sequence[str] = SEPARATORS, length_unit: str = CHUNK_LENGTH_UNIT,
+                 tokenizer_name: str = EMBEDDING_MODEL_NAME):
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size должен быть > 0, получено {chunk_size}")
+        if not 0 <= chunk_overlap <= chunk_size:
+            raise ValueError(f"chunk_overlap должен быть от 0 до chunk_size, получено {chunk_overlap}")
+        if length_unit not in ("chars", "tokens"):
+            raise ValueError(f"Неизвестная единица длины чанка: {length_unit}")
+
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = list(separators)
+        self.length_unit = length_unit
+        self._count_tokens: Optional[Callable[[List[str]], List[int]]] = None
+        if length_unit == "tokens":
+            # Импорт здесь: в режиме символов transformers не нужен
+            from src.ingestion.model_registry import get_tokenizer
+            tokenizer = get_tokenizer(tokenizer_name)
+            self._count_tokens = lambda texts: [
+                len(ids) for ids in tokenizer(texts, add_special_tokens=False)['input_ids']
+            ]
+
+    def split_pages(self, texts: Sequence[str]) -> List[ChunkSpan]:
+        """
+        Разбивает тексты страниц на чанки.
+
+        Возвращает:
+            List[ChunkSpan]: (индекс страницы, начало, конец) для каждого чанка,
+                             в порядке страниц и положения в тексте.
+        """
+        chunks: List[ChunkSpan] = []
+        for page, text in enumerate(texts):
+            chunks.extend((page, start, end) for start, end in self.split_text(text))
+        return chunks
+
+    def split_text(self, text: str) -> List[Tuple[int, int]]:
+        """
+        Разбивает один текст; возвращает границы чанков (text[start:end] - текст чанка).
+        """
+        spans: List[Tuple[int, int]] = []
+        self._split(text, 0, len(text), 0, spans)
+        return spans
+
+    def _split(self, text: str, start: int, end: int, sep_index: int, spans: List[Tuple[int, int]]):
+        # Первый разделитель, который есть в text[start:end]; если ни одного - последний
+        separators = self.separators
+        separator, next_index = separators[-1], len(separators)
+        for i in range(sep_index, len(separators)):
+            if not separators[i]:
+                separator = separators[i]
+                break
+            if text.find(separators[i], start, end) != -1:
+                separator, next_index = separators[i], i + 1
+                break
+
+        bounds = self._split_bounds(text, start, end, separator)
+        good: List[_Split] = []
+        for split_start, split_end, length in zip(bounds, bounds[1:], self._lengths(text, bounds)):
+            if split_start == split_end:
+                continue
+            if length < self.chunk_size:
+                good.append((split_start, split_end, length))
+                continue
+
+            if good:
+                self._merge(text, good, spans)
+                good = []
+            if next_index >= len(separators):
+                # Резать больше нечем - часть идет в чанк целиком (без strip, как в LangChain)
+                spans.append((split_start, split_end))
+            else:
+                self._split(text, split_start, split_end, next_index, spans)
+        if good:
+            self._merge(text, good, spans)
+
+    @staticmethod
+    def _split_bounds(text: str, start: int, end: int, separator: str) -> List[int]:
+        """
+        Границы частей: start, позиция каждого вхождения разделителя (разделитель
+        остается в начале следующей части), end. Пустой разделитель - по символам.
+        """
+        if not separator:
+            return list(range(start, end + 1))
+        bounds = [start]
+        pos = text.find(separator, start, end)
+        while pos != -1:
+            bounds.append(pos)
+            pos = text.find(separator, pos + len(separator), end)
+        bounds.append(end)
+        return bounds
+
+    def _lengths(self, text: str, bounds: List[int]) -> List[int]:
+        if self._count_tokens is None:
+            return [end - start for start, end in zip(bounds, bounds[1:])]
+        return self._count_tokens([text[start:end] for start, end in zip(bounds, bounds[1:])])
+
+    def _merge(self, text: str, splits: List[_Split], spans: List[Tuple[int, int]]):
+        """
+        Склеивает подряд идущие части в чанки не длиннее chunk_size; следующий чанк
+        начинается с хвоста предыдущего длиной не больше chunk_overlap.
+        Части непрерывны, поэтому чанк окна - от начала первой части до конца последней.
+        """
+        window: Deque[_Split] = deque()
+        total = 0
+        for split in splits:
+            length = split[2]
+            if total + length > self.chunk_size and window:
+                self._emit(text, window[0][0], window[-1][1], spans)
+                while total > self.chunk_overlap or (total + length > self.chunk_size and total > 0):
+                    total -= window.popleft()[2]
+            window.append(split)
+            total += length
+        if window:
+            self._emit(text, window[0][0], window[-1][1], spans)
+
+    @staticmethod
+    def _emit(text: str, start: int, end: int, spans: List[Tuple[int, int]]):
+        # strip() без копирования строки; пустые чанки пропускаются
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start < end:
+            spans.append((start, end))
@@ -0,0 +1,296 @@
+import json
+import os
+import shutil
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from pathlib import Path
+
+import numpy as np
+
+from src.core.config import COMPACT_STORE_PATH, COMPACT_STORE_DTYPE, COMPACT_STORE_N_PROBE, COMPACT_STORE_RESCORE
+
+# Строк на блок при выгрузке и присвоении списков IVF
+_BLOCK = 16384
+# Векторов в выборке для k-means
+_KMEANS_SAMPLE = 50_000
+_KMEANS_ITERS = 10
+
+# Результат поиска по одному запросу: (id чанков, косинусные дистанции как в ChromaDB)
+SearchResult = Tuple[List[str], List[float]]
+
+class CompactVectorStore:
+    """
+    Векторное хранилище, выгружаемое из коллекции ChromaDB (источник истины остается там).
+    Векторы хранятся матрицей float16 или int8 (с масштабом для каждого вектора),
+    открытой через np.load(mmap_mode='r'), и индексом IVF: строки сгруппированы
+    по ближайшему центроиду (сферический k-means), поэтому список IVF - непрерывный
+    срез матрицы. Запрос просматривает n_probe ближайших списков по сжатым векторам,
+    а rescore * n_results лучших кандидатов пересчитывает по float16: для int8 -
+    по отдельной fp16-матрице rescore.npy, из которой читаются только строки
+    кандидатов; для float16 сжатые векторы и есть матрица пересчета. Полных
+    fp32-векторов хранилище не держит - они остаются только в ChromaDB.
+
+    Файлы в path: meta.json (версия индекса, размеры, продукты), ids.json,
+    codes.npy, scales.npy и rescore.npy (только int8), products.npy,
+    centroids.npy, offsets.npy (границы списков IVF).
+    """
+    def __init__(self, path: Path = COMPACT_STORE_PATH, dtype: str = COMPACT_STORE_DTYPE,
+                 n_probe: int = COMPACT_STORE_N_PROBE, rescore: int = COMPACT_STORE_RESCORE):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Неподдерживаемый тип векторов: {dtype}")
+        self.path = path
+        self.dtype = dtype
+        self.n_probe = n_probe
+        self.rescore = rescore
+        self.meta: Optional[dict] = None
+        self.ids: List[str] = []
+
+    # ---------- выгрузка из ChromaDB ----------
+
+    def build(self, batches: Iterator[Dict], count: int, index_version: str, n_lists: Optional[int] = None) -> dict:
+        """
+        Строит хранилище по пачкам collection.get (ids, embeddings, metadatas)
+        и атомарно заменяет им предыдущее.
+
+        Аргументы:
+            batches: Пачки коллекции, например VectorStoreManager.iter_collection(include=('embeddings', 'metadatas')).
+            count: Размер коллекции (для выделения временного файла fp32 заранее).
+            index_version: Версия индекса ChromaDB, с которой сделана выгрузка.
+            n_lists: Число списков IVF (по умолчанию ~4 * sqrt(count)).
+
+        Возвращает:
+            dict: Метаданные хранилища (meta.json).
+        """
+        start = time.perf_counter()
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+
+        # 1. Выгрузка нормализованных fp32-векторов в порядке коллекции (во временный файл на диске)
+        ids: List[str] = []
+        product_names: List[str] = []
+        raw = None
+        for batch in batches:
+            embeddings = np.asarray(batch['embeddings'], dtype=np.float32)
+            if raw is None:
+                raw = np.lib.format.open_memmap(tmp_path / "raw.npy", mode='w+', dtype=np.float32,
+                                                shape=(count, embeddings.shape[1]))
+            raw[len(ids):len(ids) + len(embeddings)] = self._normalize(embeddings)
+            ids.extend(batch['ids'])
+            product_names.extend(meta.get('product', '') if meta else '' for meta in batch['metadatas'])
+        if raw is None or not ids:
+            shutil.rmtree(tmp_path)
+            raise ValueError("Коллекция пуста - выгружать нечего.")
+        raw = raw[:len(ids)]
+        n, dim = raw.shape
+
+        # 2. IVF: центроиды по выборке, затем список для каждой строки
+        n_lists = max(1, min(n, n_lists or int(4 * np.sqrt(n))))
+        centroids = self._kmeans(raw, n_lists)
+        assignment = np.concatenate([
+            np.argmax(raw[i:i + _BLOCK] @ centroids.T, axis=1) for i in range(0, n, _BLOCK)
+        ])
+        order = np.argsort(assignment, kind='stable')
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignment, minlength=n_lists))
+
+        # 3. Запись в порядке списков: сжатые векторы, fp16 для пересчета (int8), продукты, id
+        products = sorted(set(product_names))
+        product_codes = np.array([products.index(p) for p in product_names], dtype=np.int16)
+        code_dtype = np.int8 if self.dtype == "int8" else np.float16
+        codes = np.lib.format.open_memmap(tmp_path / "codes.npy", mode='w+', dtype=code_dtype, shape=(n, dim))
+        rescore = (np.lib.format.open_memmap(tmp_path / "rescore.npy", mode='w+', dtype=np.float16, shape=(n, dim))
+                   if self.dtype == "int8" else None)
+        scales = np.ones(n, dtype=np.float32)
+        for i in range(0, n, _BLOCK):
+            # Строки временного файла читаются по возрастанию номеров, а пишутся в порядке списков
+            rows = order[i:i + _BLOCK]
+            by_position = np.argsort(rows)
+            block = np.empty((len(rows), dim), dtype=np.float32)
+            block[by_position] = raw[rows[by_position]]
+            if self.dtype == "int8":
+                block_scales = np.maximum(np.abs(block).max(axis=1), 1e-12) / 127
+                codes[i:i + len(block)] = np.round(block / block_scales[:, None]).astype(np.int8)
+                scales[i:i + len(block)] = block_scales
+                rescore[i:i + len(block)] = block.astype(np.float16)
+            else:
+                codes[i:i + len(block)] = block.astype(np.float16)
+        codes.flush()
+        if rescore is not None:
+            rescore.flush()
+        del raw, codes, rescore
+        (tmp_path / "raw.npy").unlink()
+
+        if self.dtype == "int8":
+            np.save(tmp_path / "scales.npy", scales)
+        np.save(tmp_path / "products.npy", product_codes[order])
+        np.save(tmp_path / "centroids.npy", centroids)
+        np.save(tmp_path / "offsets.npy", offsets)
+        with open(tmp_path / "ids.json", 'w', encoding='utf-8') as f:
+            json.dump([ids[i] for i in order], f, ensure_ascii=False)
+        meta = {'index_version': index_version, 'count': n, 'dim': dim, 'dtype': self.dtype,
+                'n_lists': n_lists, 'products': products}
+        with open(tmp_path / "meta.json", 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(tmp_path, self.path)
+        print(f"Компактное хранилище построено: {n} векторов {self.dtype}, {n_lists} списков IVF, "
+              f"{time.perf_counter() - start:.1f} с.")
+        return meta
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def _kmeans(self, vectors: np.ndarray, n_lists: int, seed: int = 0) -> np.ndarray:
+        """
+        Сферический k-means (центроиды нормализуются) по случайной выборке строк.
+        Пустой список получает случайный вектор выборки.
+        """
+        rng = np.random.default_rng(seed)
+        n = len(vectors)
+        sample = np.asarray(vectors[np.sort(rng.choice(n, min(n, _KMEANS_SAMPLE), replace=False))])
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(_KMEANS_ITERS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            counts = np.bincount(assignment, minlength=n_lists)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            sums = np.zeros_like(centroids)
+            sums[counts > 0] = np.add.reduceat(sample[np.argsort(assignment, kind='stable')], starts[counts > 0])
+            sums[counts == 0] = sample[rng.choice(len(sample), int((counts == 0).sum()))]
+            centroids = self._normalize(sums)
+        return centroids
+
+    # ---------- поиск ----------
+
+    def open(self) -> bool:
+        """
+        Открывает хранилище (матрицы - через mmap, в память читаются только id и метаданные).
+        Возвращает False, если хранилище еще не построено или построено в прежнем
+        формате (int8 с fp32-копией vectors.npy вместо rescore.npy) - его нужно перестроить.
+        """
+        if not (self.path / "meta.json").exists():
+            return False
+        with open(self.path / "meta.json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta['dtype'] == "int8" and not (self.path / "rescore.npy").exists():
+            return False
+        self.meta = meta
+        with open(self.path / "ids.json", 'r', encoding='utf-8') as f:
+            self.ids = json.load(f)
+        self.dtype = self.meta['dtype']
+        self.codes = np.load(self.path / "codes.npy", mmap_mode='r')
+        self.scales = np.load(self.path / "scales.npy", mmap_mode='r') if self.dtype == "int8" else None
+        # Матрица пересчета: fp16-копия для int8, сами сжатые векторы для float16
+        self.rescore_vectors = np.load(self.path / "rescore.npy", mmap_mode='r') if self.dtype == "int8" else self.codes
+        self.product_codes = np.load(self.path / "products.npy", mmap_mode='r')
+        self.centroids = np.load(self.path / "centroids.npy")
+        self.offsets = np.load(self.path / "offsets.npy")
+        return True
+
+    def is_fresh(self, index_version: str) -> bool:
+        """
+        Хранилище открыто и выгружено из текущей версии коллекции.
+        """
+        return self.meta is not None and self.meta['index_version'] == index_version
+
+    def stored_version(self) -> Optional[str]:
+        """
+        Версия индекса хранилища, лежащего на диске (она может быть новее открытого,
+        если его перестроила индексация в другом процессе); None - хранилища нет.
+        """
+        try:
+            with open(self.path / "meta.json", 'r', encoding='utf-8') as f:
+                return json.load(f)['index_version']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def reopen(self) -> Optional['CompactVectorStore']:
+        """
+        Новый экземпляр с теми же настройками, открытый на текущих файлах (None - хранилища нет).
+        Текущий экземпляр не закрывается: по его отображениям могут дочитывать другие потоки.
+        """
+        store = CompactVectorStore(self.path, self.dtype, self.n_probe, self.rescore)
+        return store if store.open() else None
+
+    def search(self, query_embeddings: Sequence[Sequence[float]], n_results: int,
+               products: Optional[List[str]] = None) -> List[SearchResult]:
+        """
+        Поиск n_results ближайших чанков для каждого запроса.
+
+        Аргументы:
+            query_embeddings: Векторы запросов.
+            n_results: Сколько чанков вернуть на запрос.
+            products: Искать только среди чанков этих продуктов (None или [] - везде).
+
+        Возвращает:
+            List[SearchResult]: Для каждого запроса (id, дистанции 1 - cos) по возрастанию дистанции.
+        """
+        queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32))
+        allowed = None
+        if products:
+            allowed = np.array([i for i, p in enumerate(self.meta['products']) if p in products], dtype=np.int16)
+            if len(allowed) == 0:
+                return [([], []) for _ in queries]
+
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), n_probe - 1, axis=1)[:, :n_probe]
+        results: List[SearchResult] = []
+        for query, query_probes in zip(queries, probes):
+            rows, scores = self._scan(query, query_probes, allowed)
+            if len(rows) < n_results and n_probe < len(self.centroids):
+                # В ближайших списках мало подходящих чанков (узкий фильтр) - просматриваем все
+                rows, scores = self._scan(query, np.arange(len(self.centroids)), allowed)
+            results.append(self._rescore(query, rows, scores, n_results))
+        return results
+
+    def _scan(self, query: np.ndarray, lists: np.ndarray, allowed: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Приближенные оценки (cos по сжатым векторам) всех строк указанных списков IVF.
+        """
+        row_parts, score_parts = [], []
+        for lst in np.sort(lists):
+            start, end = self.offsets[lst], self.offsets[lst + 1]
+            if start == end:
+                continue
+            scores = self.codes[start:end].astype(np.float32) @ query
+            if self.scales is not None:
+                scores *= self.scales[start:end]
+            rows = np.arange(start, end)
+            if allowed is not None:
+                mask = np.isin(self.product_codes[start:end], allowed)
+                rows, scores = rows[mask], scores[mask]
+            row_parts.append(rows)
+            score_parts.append(scores)
+        if not row_parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return np.concatenate(row_parts), np.concatenate(score_parts)
+
+    def _rescore(self, query: np.ndarray, rows: np.ndarray, scores: np.ndarray, n_results: int) -> SearchResult:
+        """
+        Пересчет лучших по приближенной оценке кандидатов по fp16-векторам.
+        """
+        n_candidates = min(len(rows), max(n_results, self.rescore * n_results))
+        if n_candidates == 0:
+            return [], []
+        if n_candidates < len(rows):
+            rows = rows[np.argpartition(-scores, n_candidates - 1)[:n_candidates]]
+        rows = np.sort(rows)
+        exact = self.rescore_vectors[rows].astype(np.float32) @ query
+        top = np.argsort(-exact, kind='stable')[:n_results]
+        return [self.ids[i] for i in rows[top]], (1.0 - exact[top]).tolist()
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """
+        Размеры в байтах: 'index' - то, что читается при каждом поиске (сжатые векторы,
+        масштабы, центроиды, продукты, id); 'rescore' - fp16-копия для пересчета (только int8),
+        из которой читаются только строки кандидатов; 'total' - все файлы хранилища на диске.
+        """
+        index_files = ["codes.npy", "scales.npy", "centroids.npy", "offsets.npy", "products.npy", "ids.json"]
+        rescore_path = self.path / "rescore.npy"
+        return {
+            'index': sum((self.path / name).stat().st_size for name in index_files if (self.path / name).exists()),
+            'rescore': rescore_path.stat().st_size if rescore_path.exists() else 0,
+            'total': sum(f.stat().st_size for f in self.path.iterdir() if f.is_file()),
+        }
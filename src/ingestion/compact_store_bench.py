@@ -0,0 +1,210 @@
+import argparse
+import json
+import multiprocessing
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+from pathlib import Path
+
+import numpy as np
+
+from src.ingestion.compact_store import CompactVectorStore
+from src.ingestion.mmap_store import MmapVectorStore
+from src.ingestion.vector_store import VectorStoreManager
+from src.core.config import VECTOR_DB_PATH, COMPACT_STORE_PATH, MMAP_STORE_PATH, COLLECTION_NAME
+
+def _dir_size(path: Path, pattern: str = "*") -> int:
+    return sum(f.stat().st_size for f in path.rglob(pattern) if f.is_file())
+
+def _cold_open_chroma(db_path: str, query: List[float], k: int) -> float:
+    """
+    Выполняется в новом процессе: подключение к ChromaDB и первый запрос (загрузка HNSW).
+    """
+    start = time.perf_counter()
+    import chromadb
+    collection = chromadb.PersistentClient(path=db_path).get_collection(COLLECTION_NAME)
+    collection.query(query_embeddings=[query], n_results=k, include=[])
+    return time.perf_counter() - start
+
+def _cold_open_compact(path: str, query: List[float], k: int) -> float:
+    """
+    Выполняется в новом процессе: открытие компактного хранилища и первый запрос.
+    """
+    start = time.perf_counter()
+    store = CompactVectorStore(Path(path))
+    store.open()
+    store.search([query], k)
+    return time.perf_counter() - start
+
+def _cold_open_mmap(path: str, query: List[float], k: int) -> float:
+    """
+    Выполняется в новом процессе: открытие выгрузки для перебора и первый запрос.
+    """
+    start = time.perf_counter()
+    store = MmapVectorStore(Path(path))
+    store.open()
+    store.search([query], k)
+    return time.perf_counter() - start
+
+def make_queries(manager: VectorStoreManager, n_queries: int, noise: float, seed: int = 0) -> np.ndarray:
+    """
+    Запросы - эмбеддинги случайных чанков коллекции с гауссовым шумом
+    (чтобы запрос не совпадал с вектором чанка точно).
+    """
+    rng = np.random.default_rng(seed)
+    collection = manager.get_or_create_collection()
+    offsets = rng.choice(collection.count(), min(n_queries, collection.count()), replace=False)
+    vectors = np.array([
+        collection.get(limit=1, offset=int(offset), include=['embeddings'])['embeddings'][0] for offset in offsets
+    ], dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors += rng.normal(0, noise / np.sqrt(vectors.shape[1]), vectors.shape).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def exact_top_k(manager: VectorStoreManager, queries: np.ndarray, k: int) -> List[List[str]]:
+    """
+    Точный ответ - полный перебор fp32-эмбеддингов коллекции ChromaDB пачками
+    (у компактного хранилища fp32-копии нет).
+    """
+    best_ids = np.empty((len(queries), 0), dtype=object)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    for batch in manager.iter_collection(include=('embeddings',)):
+        embeddings = np.asarray(batch['embeddings'], dtype=np.float32)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        scores = np.concatenate([best_scores, queries @ embeddings.T], axis=1)
+        ids = np.concatenate([best_ids, np.broadcast_to(np.array(batch['ids'], dtype=object),
+                                                        (len(queries), len(batch['ids'])))], axis=1)
+        top = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(ids, top, axis=1)
+    return best_ids.tolist()
+
+def _recall(found: List[List[str]], expected: List[List[str]], k: int) -> float:
+    return float(np.mean([len(set(f[:k]) & set(e[:k])) / k for f, e in zip(found, expected)]))
+
+def run_benchmark(dtypes: List[str], n_queries: int = 200, k: int = 10, n_probe: Optional[int] = None,
+                  noise: float = 0.5, keep: bool = False, with_mmap: bool = True) -> Dict[str, dict]:
+    """
+    Сравнивает поиск в ChromaDB, в CompactVectorStore и (with_mmap) перебором
+    в MmapVectorStore на текущей коллекции:
+    объем, читаемый при поиске (индекс в памяти), полный размер на диске, время
+    холодного открытия (новый процесс: открытие + первый запрос), средняя задержка
+    запроса и recall@k - относительно точного поиска по fp32 и относительно результатов ChromaDB.
+    Выгрузки хранятся в дополнение к ChromaDB: уменьшается резидентная память поиска,
+    а место на диске растет на их полный размер.
+    """
+    manager = VectorStoreManager()
+    collection = manager.get_or_create_collection()
+    queries = make_queries(manager, n_queries, noise)
+    spawn = multiprocessing.get_context("spawn")
+
+    # ChromaDB
+    start = time.perf_counter()
+    chroma_ids = collection.query(query_embeddings=queries.tolist(), n_results=k, include=[])['ids']
+    chroma_latency = (time.perf_counter() - start) / len(queries)
+    with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+        chroma_cold = executor.submit(_cold_open_chroma, str(VECTOR_DB_PATH), queries[0].tolist(), k).result()
+    exact_ids = exact_top_k(manager, queries, k)
+    results: Dict[str, dict] = {'chroma': {
+        'hnsw_bytes': _dir_size(VECTOR_DB_PATH, "*.bin"),
+        'total_bytes': _dir_size(VECTOR_DB_PATH),
+        'cold_open_s': chroma_cold,
+        'latency_ms': chroma_latency * 1000,
+        'recall_vs_exact': _recall(chroma_ids, exact_ids, k),
+    }}
+
+    for dtype in dtypes:
+        path = COMPACT_STORE_PATH.with_name(f"{COMPACT_STORE_PATH.name}_bench_{dtype}")
+        store = CompactVectorStore(path, dtype=dtype, **({'n_probe': n_probe} if n_probe else {}))
+        store.build(manager.iter_collection(include=('embeddings', 'metadatas')), collection.count(),
+                    manager.get_index_version())
+        store.open()
+
+        start = time.perf_counter()
+        compact_ids = [ids for ids, _ in store.search(queries, k)]
+        latency = (time.perf_counter() - start) / len(queries)
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+            cold = executor.submit(_cold_open_compact, str(path), queries[0].tolist(), k).result()
+
+        footprint = store.memory_footprint()
+        results[f"compact_{dtype}"] = {
+            'index_bytes': footprint['index'],
+            'rescore_bytes': footprint['rescore'],
+            'total_bytes': footprint['total'],
+            'cold_open_s': cold,
+            'latency_ms': latency * 1000,
+            'recall_vs_exact': _recall(compact_ids, exact_ids, k),
+            'recall_vs_chroma': _recall(compact_ids, chroma_ids, k),
+            'n_lists': store.meta['n_lists'],
+            'n_probe': store.n_probe,
+        }
+        if not keep:
+            shutil.rmtree(path)
+
+    if with_mmap:
+        path = MMAP_STORE_PATH.with_name(f"{MMAP_STORE_PATH.name}_bench")
+        store = MmapVectorStore(path)
+        store.build(manager.iter_collection(include=('embeddings', 'documents', 'metadatas')),
+                    collection.count(), manager.get_index_version())
+        store.open()
+        start = time.perf_counter()
+        mmap_ids = [[doc.metadata['id'] for doc in documents] for documents in store.search(queries, k)]
+        batch_latency = (time.perf_counter() - start) / len(queries)
+        start = time.perf_counter()
+        for query in queries:
+            store.search_rows([query], k)
+        latency = (time.perf_counter() - start) / len(queries)
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+            cold = executor.submit(_cold_open_mmap, str(path), queries[0].tolist(), k).result()
+        footprint = store.memory_footprint()
+        store.close()
+        results['mmap'] = {
+            'index_bytes': footprint['vectors'],
+            'records_bytes': footprint['records'],
+            'total_bytes': footprint['vectors'] + footprint['records'],
+            'cold_open_s': cold,
+            'latency_ms': latency * 1000,
+            'batch_latency_ms': batch_latency * 1000,
+            'recall_vs_exact': _recall(mmap_ids, exact_ids, k),
+            'recall_vs_chroma': _recall(mmap_ids, chroma_ids, k),
+        }
+        if not keep:
+            shutil.rmtree(path)
+
+    print(f"\nЧанков: {collection.count()}, запросов: {len(queries)}, k={k}")
+    print(f"{'Бэкенд':<16} {'индекс, МБ':>11} {'диск, МБ':>10} {'холодн., с':>11} {'запрос, мс':>11} "
+          f"{'recall/точн.':>13} {'recall/Chroma':>14}")
+    for name, r in results.items():
+        size = r.get('index_bytes', r.get('hnsw_bytes', 0)) / 2**20
+        print(f"{name:<16} {size:>11.1f} {r['total_bytes'] / 2**20:>10.1f} {r['cold_open_s']:>11.3f} "
+              f"{r['latency_ms']:>11.2f} {r['recall_vs_exact']:>13.3f} {r.get('recall_vs_chroma', 1.0):>14.3f}")
+    print("Индекс - то, что читается при каждом поиске (для compact - сжатые векторы и IVF; fp16-копия "
+          "для пересчета int8 читается только по строкам кандидатов). Диск - все файлы бэкенда. "
+          "compact и mmap хранятся в дополнение к ChromaDB: они уменьшают резидентную память поиска, "
+          "а место на диске растет на их размер.")
+    if 'mmap' in results:
+        print(f"mmap: запрос в батче из {len(queries)} - {results['mmap']['batch_latency_ms']:.2f} мс на запрос "
+              f"(с чтением текстов чанков).")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Память, холодный старт и recall: ChromaDB vs CompactVectorStore "
+                                                 "vs MmapVectorStore")
+    parser.add_argument("--dtype", choices=["float16", "int8", "both"], default="both")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--n-probe", type=int, default=None)
+    parser.add_argument("--noise", type=float, default=0.5, help="Шум запросов относительно векторов чанков")
+    parser.add_argument("--keep", action="store_true", help="Не удалять построенные хранилища")
+    parser.add_argument("--no-mmap", action="store_true", help="Не сравнивать с поиском перебором (MmapVectorStore)")
+    parser.add_argument("--output", default=None, help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    dtypes = ["float16", "int8"] if args.dtype == "both" else [args.dtype]
+    results = run_benchmark(dtypes, args.queries, args.k, args.n_probe, args.noise, args.keep, not args.no_mmap)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+# запуск: python -m src.ingestion.compact_store_bench --dtype both --queries 200
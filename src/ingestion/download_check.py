@@ -0,0 +1,185 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import sys
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict
+
+import requests
+
+from src.ingestion import downloader
+from src.ingestion.downloader import DataLoader, IncompleteDownloadError
+from src.ingestion.download_stub_server import start_download_stub
+
+# Часть загрузки меньше файла: с urllib3 2.x оборванная часть отбрасывается (IncompleteRead),
+# и при части больше файла докачивать было бы нечего
+CHUNK_SIZE = 16 * 1024
+PAYLOAD_SIZE = 300_000
+DROP_AFTER = 70_000
+
+def _payload(seed: bytes) -> bytes:
+    return (hashlib.sha256(seed).digest() * (PAYLOAD_SIZE // 32 + 1))[:PAYLOAD_SIZE]
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def check_resume(tmp_path: Path):
+    """
+    Два обрыва подряд: загрузка докачивается с места остановки с If-Range.
+    """
+    payload = _payload(b"resume")
+    part_path = tmp_path / "archive.zip.part"
+    # Размер .part к моменту следующего запроса: сколько байт оборванного ответа осталось
+    # на диске, зависит от версии urllib3 (2.x отбрасывает неполную часть, 1.26 - нет)
+    server = start_download_stub(payload=payload, drop_first=2, drop_after=DROP_AFTER,
+                                 on_request=lambda: {'part_size': part_path.stat().st_size if part_path.exists() else 0})
+    try:
+        dest = DataLoader().download_file(server.url, tmp_path / "archive.zip", _sha256(payload))
+    finally:
+        server.shutdown()
+    assert dest.read_bytes() == payload, "файл после докачки не совпал с исходным"
+    assert server.log[0]['range'] is None, server.log
+    for previous, request in zip(server.log, server.log[1:]):
+        assert previous['part_size'] < request['part_size'] <= previous['part_size'] + DROP_AFTER, server.log
+        assert request['range'] == f"bytes={request['part_size']}-", server.log
+    assert all(r['if_range'] == server.etag for r in server.log[1:]), "докачка без If-Range"
+    assert not (tmp_path / "archive.zip.part.validator").exists(), "валидатор не удален после загрузки"
+
+def check_restart_without_range(tmp_path: Path):
+    """
+    Сервер не поддерживает Range: после обрыва приходит 200, и файл скачивается заново.
+    """
+    payload = _payload(b"no-range")
+    server = start_download_stub(payload=payload, drop_first=1, drop_after=DROP_AFTER, range=False)
+    try:
+        dest = DataLoader().download_file(server.url, tmp_path / "archive.zip", _sha256(payload))
+    finally:
+        server.shutdown()
+    assert dest.read_bytes() == payload, "файл, скачанный заново, не совпал с исходным (часть дописана в хвост)"
+    assert server.responses == 2, server.log
+
+def check_changed_file(tmp_path: Path):
+    """
+    Файл на сервере заменен между обрывом и докачкой: If-Range не совпадает,
+    сервер отдает новый файл целиком (200), части разных версий не склеиваются.
+    """
+    old, new = _payload(b"old"), _payload(b"new")
+    server = start_download_stub(payload=old, drop_first=1, drop_after=DROP_AFTER, change_after=1, next_payload=new)
+    try:
+        dest = DataLoader().download_file(server.url, tmp_path / "archive.zip")
+    finally:
+        server.shutdown()
+    assert dest.read_bytes() == new, "склеены части старой и новой версии файла"
+    assert server.log[1]['if_range'] is not None, "докачка без If-Range"
+
+def check_restart_without_validator(tmp_path: Path):
+    """
+    Нет ни ETag, ни Last-Modified и не задан SHA-256: после обрыва загрузка начинается с начала.
+    """
+    payload = _payload(b"no-validator")
+    server = start_download_stub(payload=payload, drop_first=1, drop_after=DROP_AFTER,
+                                 etag=False, last_modified=False)
+    try:
+        dest = DataLoader().download_file(server.url, tmp_path / "archive.zip")
+    finally:
+        server.shutdown()
+    assert dest.read_bytes() == payload
+    assert server.log[1]['range'] is None, "докачка без валидатора и контрольной суммы"
+
+def check_size_mismatch(tmp_path: Path):
+    """
+    Сервер всегда отдает меньше, чем объявил: после повторов - ошибка, dest не создается,
+    .part остается для следующей докачки.
+    """
+    payload = _payload(b"short")
+    server = start_download_stub(payload=payload, declared_extra=1000)
+    try:
+        DataLoader().download_file(server.url, tmp_path / "archive.zip", _sha256(payload))
+        raise AssertionError("неполный файл принят")
+    except (requests.exceptions.RequestException, IncompleteDownloadError):
+        pass
+    finally:
+        server.shutdown()
+    assert not (tmp_path / "archive.zip").exists(), "неполный файл переименован в архив"
+    assert 0 < (tmp_path / "archive.zip.part").stat().st_size <= PAYLOAD_SIZE
+
+def check_checksum_mismatch(tmp_path: Path):
+    """
+    Контрольная сумма не совпала: ValueError, временный файл удален.
+    """
+    server = start_download_stub(payload=_payload(b"checksum"), drop_first=1, drop_after=DROP_AFTER)
+    try:
+        DataLoader().download_file(server.url, tmp_path / "archive.zip", _sha256(b"other"))
+        raise AssertionError("файл с неверной контрольной суммой принят")
+    except ValueError:
+        pass
+    finally:
+        server.shutdown()
+    assert not any(tmp_path.iterdir()), f"остались файлы: {[p.name for p in tmp_path.iterdir()]}"
+
+def check_bad_zip(tmp_path: Path):
+    """
+    Скачан не zip: download_and_prepare_data возвращает False и удаляет архив,
+    чтобы следующий запуск скачал его заново, а не взял как "уже скачанный".
+    """
+    server = start_download_stub(payload=_payload(b"not-a-zip"))
+    data_path = downloader.DATA_PATH
+    downloader.DATA_PATH = tmp_path
+    try:
+        assert DataLoader().download_and_prepare_data(server.url) is False, "поврежденный архив принят"
+    finally:
+        downloader.DATA_PATH = data_path
+        server.shutdown()
+    assert not (tmp_path / downloader.YAD_ZIP_FILENAME).exists(), "поврежденный архив не удален"
+
+CHECKS: Dict[str, Callable[[Path], None]] = {
+    'resume': check_resume,
+    'restart_without_range': check_restart_without_range,
+    'changed_file': check_changed_file,
+    'restart_without_validator': check_restart_without_validator,
+    'size_mismatch': check_size_mismatch,
+    'checksum_mismatch': check_checksum_mismatch,
+    'bad_zip': check_bad_zip,
+}
+
+def run_checks(names=None, verbose: bool = False) -> bool:
+    """
+    Прогоняет проверки DataLoader против локальной заглушки файлового сервера
+    (без сети и без data/). Повторы загрузки идут без пауз, файл пишется частями по CHUNK_SIZE.
+
+    Возвращает:
+        bool: Все проверки прошли.
+    """
+    retry_delay, chunk_size = downloader.DOWNLOAD_RETRY_DELAY, downloader.DOWNLOAD_CHUNK_SIZE
+    downloader.DOWNLOAD_RETRY_DELAY, downloader.DOWNLOAD_CHUNK_SIZE = 0, CHUNK_SIZE
+    failed = []
+    try:
+        for name in names or CHECKS:
+            with tempfile.TemporaryDirectory(prefix="download_check_") as tmp:
+                output = io.StringIO()
+                try:
+                    with contextlib.redirect_stdout(sys.stdout if verbose else output):
+                        CHECKS[name](Path(tmp))
+                    print(f"OK    {name}")
+                except Exception as e:
+                    failed.append(name)
+                    print(f"FAIL  {name}: {type(e).__name__}: {e}")
+                    print(output.getvalue(), end="")
+    finally:
+        downloader.DOWNLOAD_RETRY_DELAY, downloader.DOWNLOAD_CHUNK_SIZE = retry_delay, chunk_size
+    print(f"Проверок: {len(names or CHECKS)}, не прошли: {len(failed)}")
+    return not failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Проверка докачки и сверки архива на локальной заглушке сервера")
+    parser.add_argument("checks", nargs="*", help=f"Какие проверки запустить (по умолчанию все): {', '.join(CHECKS)}")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Показывать вывод DataLoader")
+    args = parser.parse_args()
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"неизвестные проверки: {', '.join(unknown)}")
+    sys.exit(0 if run_checks(args.checks, args.verbose) else 1)
+
+# запуск: python -m src.ingestion.download_check
@@ -0,0 +1,158 @@
+import argparse
+import hashlib
+import socket
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Tuple
+
+from src.core.config import DOWNLOAD_STUB_HOST, DOWNLOAD_STUB_PORT
+
+class StubFileServer(ThreadingHTTPServer):
+    """
+    Локальная заглушка файлового сервера для офлайн-проверок докачки DataLoader.download_file.
+    Отдает payload по любому пути, поддерживает Range (bytes=N-) и If-Range по ETag
+    или Last-Modified. Первые drop_first ответов обрываются после drop_after байт
+    (соединение закрывается, как при сбое сети). Режимы сбоев:
+    range=False - Range игнорируется (всегда 200), declared_extra - объявленный размер
+    (Content-Length и Content-Range) больше реального, последние байты не приходят никогда; change_after - после стольких ответов файл
+    на сервере заменяется на next_payload (новые ETag и Last-Modified).
+    on_request вызывается в начале каждого запроса, до ответа; его dict добавляется
+    в запись log (например, размер .part клиента к моменту повторного запроса).
+    """
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], payload: bytes, drop_first: int = 0,
+                 drop_after: int = 0, range: bool = True, etag: bool = True, last_modified: bool = True,
+                 declared_extra: int = 0, change_after: Optional[int] = None,
+                 next_payload: Optional[bytes] = None, on_request: Optional[Callable[[], dict]] = None):
+        super().__init__(address, _StubHandler)
+        self.drop_first = drop_first
+        self.drop_after = drop_after
+        self.range = range
+        self.use_etag = etag
+        self.use_last_modified = last_modified
+        self.declared_extra = declared_extra
+        self.change_after = change_after
+        self.next_payload = next_payload
+        self.on_request = on_request
+        self._lock = threading.Lock()
+        self._version = 0
+        self.set_payload(payload)
+        self.responses = 0
+        self.log: List[dict] = []
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/archive.zip"
+
+    def set_payload(self, payload: bytes):
+        """
+        Заменяет файл на сервере; ETag и Last-Modified меняются вместе с ним.
+        """
+        self.payload = payload
+        self._version += 1
+        self.etag = f'"{hashlib.sha256(payload).hexdigest()[:16]}"'
+        self.last_modified = formatdate(1_700_000_000 + self._version, usegmt=True)
+
+    def next_response(self, request_headers: dict) -> Tuple[int, bool]:
+        """
+        Номер ответа и нужно ли его оборвать; записывает запрос в log.
+        """
+        with self._lock:
+            self.responses += 1
+            if self.change_after is not None and self.responses == self.change_after + 1:
+                self.set_payload(self.next_payload)
+            self.log.append({**request_headers, **(self.on_request() if self.on_request else {})})
+            return self.responses, self.responses <= self.drop_first
+
+    def validators(self) -> List[str]:
+        return ([self.etag] if self.use_etag else []) + ([self.last_modified] if self.use_last_modified else [])
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: StubFileServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        _, drop = self.server.next_response({'range': self.headers.get('Range'),
+                                             'if_range': self.headers.get('If-Range')})
+        payload = self.server.payload
+        size = len(payload) + self.server.declared_extra
+        start = self._range_start(size)
+        if start is not None and start >= size:
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{size}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = payload[start or 0:]
+        self.send_response(206 if start is not None else 200)
+        if start is not None:
+            self.send_header('Content-Range', f"bytes {start}-{size - 1}/{size}")
+        self.send_header('Content-Length', str(size - (start or 0)))
+        if self.server.range:
+            self.send_header('Accept-Ranges', 'bytes')
+        if self.server.use_etag:
+            self.send_header('ETag', self.server.etag)
+        if self.server.use_last_modified:
+            self.send_header('Last-Modified', self.server.last_modified)
+        self.end_headers()
+
+        if drop or self.server.declared_extra:
+            self.wfile.write(body[:self.server.drop_after] if drop else body)
+            self.wfile.flush()
+            # Обрыв соединения: клиент получает меньше байт, чем в Content-Length
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        self.wfile.write(body)
+
+    def _range_start(self, size: int) -> Optional[int]:
+        """
+        Начало запрошенного диапазона или None - отдать файл целиком (нет Range,
+        Range не поддерживается или If-Range не совпал с текущей версией файла).
+        """
+        header = self.headers.get('Range', '')
+        if not self.server.range or not header.startswith('bytes=') or not header.endswith('-'):
+            return None
+        if_range = self.headers.get('If-Range')
+        if if_range is not None and if_range not in self.server.validators():
+            return None
+        start = header[len('bytes='):-1]
+        return int(start) if start.isdigit() else None
+
+def start_download_stub(host: str = DOWNLOAD_STUB_HOST, port: int = 0, **kwargs) -> StubFileServer:
+    """
+    Запускает заглушку в фоновом потоке (port=0 - любой свободный порт).
+    Остановка: server.shutdown().
+    """
+    server = StubFileServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальная заглушка файлового сервера с Range и обрывами соединения")
+    parser.add_argument("file", help="Файл, который отдает сервер")
+    parser.add_argument("--host", default=DOWNLOAD_STUB_HOST)
+    parser.add_argument("--port", type=int, default=DOWNLOAD_STUB_PORT)
+    parser.add_argument("--drop-first", type=int, default=0, help="Сколько первых ответов оборвать")
+    parser.add_argument("--drop-after", type=int, default=1024 * 1024, help="После скольких байт обрывать")
+    parser.add_argument("--no-range", action="store_true", help="Игнорировать Range (всегда 200)")
+    args = parser.parse_args()
+
+    with open(args.file, 'rb') as f:
+        server = StubFileServer((args.host, args.port), f.read(), drop_first=args.drop_first,
+                                drop_after=args.drop_after, range=not args.no_range)
+    print(f"Заглушка файлового сервера: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+# запуск: python -m src.ingestion.download_stub_server data/AI_Boostcamp.zip --drop-first 2
+# клиент: python -m src.ingestion.downloader --url http://127.0.0.1:8090/archive.zip
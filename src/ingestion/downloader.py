@@ -1,132 +1,312 @@
 import os
+import hashlib
+import time
 import requests
 import zipfile
 import shutil
 import json
+import zlib
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import urlencode
 
 from src.core.config import (
     RAW_DATA_PATH, DATA_PATH, YANDEX_DISK_PUBLIC_KEY,
-    YANDEX_DISK_BASE_URL, YAD_ZIP_FILENAME, YAD_EXTRACTED_FOLDER,
-    PDF_ZIP_EXTRACTED_FOLDER, FOLDER_STRUCTURE_FILE
+    YANDEX_DISK_BASE_URL, YANDEX_DISK_META_URL, YAD_ZIP_FILENAME, YAD_EXTRACTED_FOLDER,
+    PDF_ZIP_FILENAME, PDF_ZIP_EXTRACTED_FOLDER, FOLDER_STRUCTURE_FILE, SYNC_STATE_FILE,
+    DOWNLOAD_CHUNK_SIZE, DOWNLOAD_MAX_RETRIES, DOWNLOAD_RETRY_DELAY, DOWNLOAD_TIMEOUT, YAD_ZIP_SHA256
 )
 
+class IncompleteDownloadError(IOError):
+    """
+    Соединение закрылось раньше, чем пришел весь файл.
+    """
+
 class DataLoader:
     """
     Класс для загрузки, распаковки и подготовки корпоративной документации.
+    Архив скачивается потоком во временный файл .part; после обрыва загрузка
+    продолжается с места остановки (HTTP Range), готовый архив сверяется
+    по размеру и SHA-256. Архив с PDF распаковывается прямо из внешнего архива,
+    без промежуточных файлов на диске.
+
+    Распаковка выборочная: CRC32 и размер файлов из центрального каталога архива
+    сравниваются с data/raw и записями 'files' в data/sync_state.json, и на диск
+    пишутся только новые и измененные файлы; файлы, которых нет в архиве, удаляются.
+    Неизмененные файлы не трогаются, поэтому манифест индексации видит их
+    неизмененными по mtime и размеру. Изменения последней синхронизации - в last_delta.
+
+    sync_state.json - рабочее состояние (не в git); folder_structure.json (список
+    продуктов для ProductDetector) только читается: о новых папках продуктов
+    в архиве выводится предупреждение.
     """
     def __init__(self):
+        self.last_delta: Dict[str, object] = {}
         print("Инициализация Downloader")
 
-    def _cleanup_data_folder(self, data_path: Path):
+    def _resolve_download(self) -> Tuple[str, Optional[str]]:
         """
-        Очищает папку 'data/', удаляя все, кроме папки с PDF-файлами,
-        которая будет переименована в 'raw'.
+        Получает ссылку на скачивание публичного ресурса Я.Диска и,
+        если API ее отдает, SHA-256 файла (для папок, которые Я.Диск упаковывает
+        в zip на лету, контрольной суммы нет).
         """
-        try:
-            if not data_path.exists():
-                print(f"Папка {data_path} не существует. Создаем.")
-                data_path.mkdir(parents=True, exist_ok=True)
-                return
-
-            print(f"Начало очистки папки: {data_path}")
-
-            for item in data_path.iterdir():
-                # Сохраняем папку с PDF, которая еще не переименована в 'raw'
-                if item.name == PDF_ZIP_EXTRACTED_FOLDER:
-                    print(f"Временная папка с PDF сохранена: {item.name}")
-                    continue
-                # Сохраняем папку 'raw', если она уже существует
-                if item.name == RAW_DATA_PATH.name and item.is_dir():
-                    print(f"Текущая папка 'raw' сохранена: {item.name}")
-                    continue
-
-                # Удаляем все остальные файлы/папки
-                try:
-                    if item.is_file():
-                        item.unlink()
-                        print(f"Удален файл: {item.name}")
-                    elif item.is_dir():
-                        shutil.rmtree(item)
-                        print(f"Удалена папка: {item.name}")
-                except Exception as e:
-                    print(f"Ошибка при удалении {item}: {e}")
-
-            print(f"Очистка папки {data_path} завершена.")
+        params = urlencode(dict(public_key=YANDEX_DISK_PUBLIC_KEY))
+        response = requests.get(YANDEX_DISK_BASE_URL + params, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        download_url = response.json()['href']
+
+        expected_sha256 = YAD_ZIP_SHA256
+        if expected_sha256 is None:
+            try:
+                meta = requests.get(YANDEX_DISK_META_URL + params, timeout=DOWNLOAD_TIMEOUT)
+                meta.raise_for_status()
+                expected_sha256 = meta.json().get('sha256')
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"Не удалось получить контрольную сумму архива: {e}")
+        return download_url, expected_sha256
+
+    def download_file(self, url: str, dest_path: Path, expected_sha256: Optional[str] = None) -> Path:
+        """
+        Скачивает файл потоком частями по DOWNLOAD_CHUNK_SIZE во временный файл
+        dest_path.part. После обрыва соединения запрос повторяется с заголовком Range
+        и дописывает файл с места остановки. Валидатор ответа (ETag или Last-Modified)
+        сохраняется рядом в dest_path.part.validator и отправляется при докачке в If-Range:
+        если файл на сервере изменился или сервер не поддерживает Range (200 вместо 206),
+        загрузка начинается заново. Без валидатора докачка возможна только при заданном
+        expected_sha256 - иначе склейку частей разных версий файла нечем обнаружить.
+        Готовый файл сверяется с размером из ответа сервера и, если задан expected_sha256,
+        с контрольной суммой.
+
+        Возвращает:
+            Path: dest_path после успешной загрузки.
+
+        Исключения:
+            requests.exceptions.RequestException, IncompleteDownloadError: Повторы исчерпаны.
+            ValueError: Контрольная сумма не совпала (временный файл удаляется).
+        """
+        part_path = dest_path.with_name(dest_path.name + ".part")
+        validator_path = dest_path.with_name(dest_path.name + ".part.validator")
+        for attempt in range(DOWNLOAD_MAX_RETRIES + 1):
+            offset = part_path.stat().st_size if part_path.exists() else 0
+            validator = validator_path.read_text(encoding='utf-8') if validator_path.exists() else None
+            if offset and not validator and not expected_sha256:
+                print("Нет валидатора для докачки (ETag/Last-Modified), загрузка с начала.")
+                offset = 0
+            headers = {'Range': f"bytes={offset}-"} if offset else {}
+            if offset and validator:
+                headers['If-Range'] = validator
+            try:
+                with requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                    # 416 - запрошен диапазон за концом файла: файл уже скачан целиком
+                    if response.status_code == 416 and offset:
+                        break
+                    response.raise_for_status()
+                    if offset and response.status_code != 206:
+                        print("Файл на сервере изменился или сервер не поддерживает докачку, загрузка с начала.")
+                        offset = 0
+                    total_size = self._total_size(response, offset)
+                    if offset:
+                        print(f"Докачка с {offset / 2**20:.1f} МБ")
+                    else:
+                        self._save_validator(response, validator_path)
+
+                    with open(part_path, 'ab' if offset else 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+
+                size = part_path.stat().st_size
+                if total_size is not None and size < total_size:
+                    raise IncompleteDownloadError(f"получено {size} из {total_size} байт")
+                break
+            except (requests.exceptions.RequestException, IncompleteDownloadError) as e:
+                if attempt == DOWNLOAD_MAX_RETRIES:
+                    raise
+                delay = DOWNLOAD_RETRY_DELAY * 2 ** attempt
+                print(f"Загрузка прервана ({e}), повтор через {delay} с.")
+                time.sleep(delay)
+
+        validator_path.unlink(missing_ok=True)
+        if expected_sha256:
+            actual_sha256 = self._sha256(part_path)
+            if actual_sha256 != expected_sha256.lower():
+                part_path.unlink()
+                raise ValueError(f"Контрольная сумма {dest_path.name} не совпала: "
+                                 f"{actual_sha256} вместо {expected_sha256}")
+            print("Контрольная сумма архива совпала.")
 
+        part_path.replace(dest_path)
+        return dest_path
+
+    @staticmethod
+    def _save_validator(response: requests.Response, validator_path: Path):
+        """
+        Сохраняет валидатор для If-Range: сильный ETag, иначе Last-Modified
+        (слабый ETag W/"..." в If-Range не допускается).
+        """
+        etag = response.headers.get('ETag')
+        validator = etag if etag and not etag.startswith('W/') else response.headers.get('Last-Modified')
+        if validator:
+            validator_path.write_text(validator, encoding='utf-8')
+        else:
+            validator_path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _total_size(response: requests.Response, offset: int) -> Optional[int]:
+        """
+        Полный размер файла по Content-Range (ответ 206) или Content-Length (ответ 200).
+        """
+        if response.status_code == 206:
+            total = response.headers.get('Content-Range', '').rpartition('/')[2]
+            return int(total) if total.isdigit() else None
+        length = response.headers.get('Content-Length')
+        return int(length) if length and length.isdigit() else None
+
+    @staticmethod
+    def _sha256(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(DOWNLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _load_known_files(self) -> Dict[str, dict]:
+        """
+        CRC32 и размеры файлов data/raw из sync_state.json предыдущей синхронизации.
+        """
+        state_path = DATA_PATH / SYNC_STATE_FILE
+        if not state_path.exists():
+            return {}
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('files', {})
         except Exception as e:
-            print(f"Общая ошибка при очистке папки: {e}")
+            print(f"Ошибка чтения {state_path}: {e}. CRC32 файлов будут пересчитаны.")
+            return {}
+
+    @staticmethod
+    def _file_crc32(file_path: Path) -> int:
+        crc = 0
+        with open(file_path, 'rb') as f:
+            while chunk := f.read(DOWNLOAD_CHUNK_SIZE):
+                crc = zlib.crc32(chunk, crc)
+        return crc
+
+    def _is_unchanged(self, member: zipfile.ZipInfo, target: Path, known: Optional[dict]) -> bool:
+        """
+        Файл на диске совпадает с записью архива: размер сверяется всегда, CRC32 -
+        по sync_state.json, а если записи нет (первая синхронизация) - по содержимому файла.
+        """
+        if not target.is_file() or target.stat().st_size != member.file_size:
+            return False
+        if known is not None:
+            return known.get('crc32') == member.CRC and known.get('size') == member.file_size
+        return self._file_crc32(target) == member.CRC
+
+    def _sync_pdfs(self, zip_path: Path, raw_path: Path) -> Dict[str, dict]:
+        """
+        Синхронизирует raw_path с вложенным архивом All_PDFs_merged_1.zip, читая его
+        прямо из потока внешнего архива (без записи вложенного архива на диск).
+        Извлекаются только новые и измененные файлы - в порядке их расположения
+        во вложенном архиве, чтобы поток внешнего архива читался вперед.
+        Каждый файл пишется во временный файл и атомарно переименовывается;
+        CRC32 проверяется zipfile при чтении.
 
-    def download_and_prepare_data(self):
+        Возвращает:
+            Dict[str, dict]: {путь относительно raw_path: {'crc32', 'size'}} для всех файлов архива.
+        """
+        inner_name = f"{YAD_EXTRACTED_FOLDER}/{PDF_ZIP_FILENAME}"
+        prefix = f"{PDF_ZIP_EXTRACTED_FOLDER}/"
+        known_files = self._load_known_files()
+        files: Dict[str, dict] = {}
+        added: List[str] = []
+        changed: List[str] = []
+
+        with zipfile.ZipFile(zip_path, 'r') as outer:
+            if inner_name not in outer.namelist():
+                raise FileNotFoundError(f"В архиве {zip_path.name} не найден файл: {inner_name}")
+
+            with outer.open(inner_name) as inner_stream, zipfile.ZipFile(inner_stream, 'r') as inner:
+                to_extract: List[Tuple[zipfile.ZipInfo, str]] = []
+                for member in inner.infolist():
+                    if member.is_dir() or not member.filename.startswith(prefix):
+                        continue
+                    rel_path = member.filename[len(prefix):]
+                    if Path(rel_path).is_absolute() or '..' in Path(rel_path).parts:
+                        print(f"Пропущен файл с недопустимым путем: {member.filename}")
+                        continue
+
+                    files[rel_path] = {'crc32': member.CRC, 'size': member.file_size}
+                    target = raw_path / rel_path
+                    if self._is_unchanged(member, target, known_files.get(rel_path)):
+                        continue
+                    (changed if target.exists() else added).append(rel_path)
+                    to_extract.append((member, rel_path))
+
+                to_extract.sort(key=lambda item: item[0].header_offset)
+                for member, rel_path in to_extract:
+                    target = raw_path / rel_path
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    tmp_path = target.with_name(target.name + ".tmp")
+                    with inner.open(member) as src, open(tmp_path, 'wb') as dst:
+                        shutil.copyfileobj(src, dst, DOWNLOAD_CHUNK_SIZE)
+                    os.replace(tmp_path, target)
+
+        # Удаляем файлы, которых больше нет в архиве, и опустевшие папки
+        removed: List[str] = []
+        if raw_path.exists():
+            for file_path in sorted(raw_path.rglob("*")):
+                if file_path.is_file() and str(file_path.relative_to(raw_path)) not in files:
+                    file_path.unlink()
+                    removed.append(str(file_path.relative_to(raw_path)))
+            for dir_path in sorted((d for d in raw_path.rglob("*") if d.is_dir()), reverse=True):
+                if not any(dir_path.iterdir()):
+                    dir_path.rmdir()
+
+        self.last_delta = {'added': added, 'changed': changed, 'removed': removed,
+                           'unchanged': len(files) - len(added) - len(changed)}
+        print(f"Синхронизация data/raw: новых {len(added)}, измененных {len(changed)}, "
+              f"удаленных {len(removed)}, без изменений {self.last_delta['unchanged']}.")
+        return files
+
+    def download_and_prepare_data(self, download_url: Optional[str] = None):
         """
         Основной метод: скачивает, распаковывает и подготавливает данные.
+        download_url - прямая ссылка на архив (по умолчанию берется у API Я.Диска).
         """
         print("Запуск загрузки и подготовки данных")
-        
-        # 1. Формируем URL для скачивания
-        yad_download_url = YANDEX_DISK_BASE_URL + urlencode(dict(public_key=YANDEX_DISK_PUBLIC_KEY))
+
         zip_path = DATA_PATH / YAD_ZIP_FILENAME
-        
         DATA_PATH.mkdir(parents=True, exist_ok=True)
 
         try:
-            # 2. Скачиваем ZIP-архив
-            print(f"Скачивание {YAD_ZIP_FILENAME}")
-            response = requests.get(yad_download_url)
-            response.raise_for_status()
-            
-            download_url = response.json()['href']
-            download_response = requests.get(download_url)
-            download_response.raise_for_status()
-
-            with open(zip_path, 'wb') as f:
-                f.write(download_response.content)
-            print(f"Архив успешно скачан: {zip_path}")
-
-            # 3. Распаковываем внешний архив (AI_Boostcamp.zip)
-            print(f'Распаковка архива Я.Диска')
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(DATA_PATH)
-            zip_path.unlink()
-            print(f'Архив ЯД распакован. Исходный ZIP удален.')
-
-            # Путь к ZIP-файлу с PDF внутри
-            pdf_zip_path = DATA_PATH / YAD_EXTRACTED_FOLDER / "All_PDFs_merged_1.zip"
-            if not pdf_zip_path.exists():
-                raise FileNotFoundError(f"Не найден файл: {pdf_zip_path}")
-
-            # 4. Распаковываем архив с PDF-файлами
-            print(f'Распаковка архива с PDF-файлами...')
-            with zipfile.ZipFile(pdf_zip_path, 'r') as zip_ref:
-                filtered_files = [f for f in zip_ref.namelist() if not f.startswith('__MACOSX/')]
-                for file in filtered_files:
-                    zip_ref.extract(file, DATA_PATH)
-            print(f'Архив PDF распакован.')
-            
-            # 5. Очистка и переименование
-            self._cleanup_data_folder(DATA_PATH)
-
-            # Переименовываем папку с PDF в 'raw'
-            source_folder = DATA_PATH / PDF_ZIP_EXTRACTED_FOLDER
-            if source_folder.exists():
-                # Удаляем старую папку RAW_DATA_PATH, если она существует
-                if RAW_DATA_PATH.exists():
-                    shutil.rmtree(RAW_DATA_PATH)
-                    print(f"Старая папка {RAW_DATA_PATH.name} удалена.")
-
-                source_folder.rename(RAW_DATA_PATH)
-                print(f"Папка с документацией переименована: {source_folder.name} -> {RAW_DATA_PATH.name}")
+            # 1-2. Скачиваем ZIP-архив (архив, оставшийся от прерванной распаковки, используется повторно)
+            if zip_path.exists():
+                print(f"Архив уже скачан: {zip_path}")
             else:
-                raise FileNotFoundError(f"Исходная папка PDF {source_folder} не найдена после распаковки.")
+                print(f"Скачивание {YAD_ZIP_FILENAME}")
+                expected_sha256 = None
+                if download_url is None:
+                    download_url, expected_sha256 = self._resolve_download()
+                self.download_file(download_url, zip_path, expected_sha256)
+                print(f"Архив успешно скачан: {zip_path}")
 
-            # 6. Создание метаданных
-            metadata = self._get_folder_structure(RAW_DATA_PATH)
-            output_path = DATA_PATH / FOLDER_STRUCTURE_FILE
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, indent=2, ensure_ascii=False)
-            print(f"Структура папок сохранена в: {output_path}")
+            # 3-4. Распаковываем в data/raw только новые и измененные PDF прямо из архива Я.Диска
+            print(f'Синхронизация PDF-файлов с архивом...')
+            files = self._sync_pdfs(zip_path, RAW_DATA_PATH)
+            zip_path.unlink()
+            print(f'Архив PDF обработан ({len(files)} файлов). Исходный ZIP удален.')
+
+            # 5. Состояние синхронизации (с CRC32 файлов для следующей синхронизации)
+            state = self._get_folder_structure(RAW_DATA_PATH)
+            state['files'] = files
+            state['last_sync'] = self.last_delta
+            state_path = DATA_PATH / SYNC_STATE_FILE
+            tmp_path = state_path.with_name(state_path.name + ".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, indent=2, ensure_ascii=False)
+            tmp_path.replace(state_path)
+            print(f"Состояние синхронизации сохранено в: {state_path}")
+            self._check_products(files)
 
             print("Загрузка данных завершена успешно")
             return True
@@ -134,13 +314,35 @@ class DataLoader:
         except requests.exceptions.RequestException as e:
             print(f"Ошибка HTTP-запроса при скачивании: {e}")
             return False
+        except zipfile.BadZipFile as e:
+            # Поврежденный архив удаляется, иначе следующий запуск снова взял бы его как "уже скачанный"
+            zip_path.unlink(missing_ok=True)
+            print(f"Архив {zip_path.name} поврежден ({e}) и удален, при следующем запуске он будет скачан заново.")
+            return False
         except Exception as e:
             print(f"Непредвиденная ошибка при загрузке: {e}")
             return False
 
+    def _check_products(self, files: Dict[str, dict]):
+        """
+        Предупреждает о папках продуктов из архива, которых нет в folder_structure.json:
+        без них ProductDetector не определит продукт по запросу.
+        """
+        structure_path = DATA_PATH / FOLDER_STRUCTURE_FILE
+        try:
+            with open(structure_path, 'r', encoding='utf-8') as f:
+                known = set(json.load(f).get('folders', {}))
+        except (OSError, ValueError) as e:
+            print(f"Не удалось прочитать {structure_path}: {e}")
+            return
+        new_products = sorted({Path(rel_path).parts[0] for rel_path in files if len(Path(rel_path).parts) > 1} - known)
+        if new_products:
+            print(f"В архиве есть продукты, которых нет в {structure_path.name}: {', '.join(new_products)}. "
+                  f"Добавьте их в 'folders', чтобы продукт определялся по запросу.")
+
     def _get_folder_structure(self, base_path: Path) -> dict:
         """
-        Сохраняет метаданные о структуре папок с PDF-файлами.
+        Число PDF-файлов по папкам (для состояния синхронизации).
         """
         folder_stats = {}
         total_pdfs = 0
@@ -166,6 +368,15 @@ class DataLoader:
         
         return metadata
 
-# if __name__ == "__main__":
-#     downloader = DataLoader()
-#     downloader.download_and_prepare_data()
\ No newline at end of file
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Загрузка документации и синхронизация data/raw")
+    parser.add_argument("--url", default=None, help="Прямая ссылка на архив (по умолчанию - Я.Диск)")
+    args = parser.parse_args()
+
+    downloader = DataLoader()
+    if downloader.download_and_prepare_data(args.url):
+        print(json.dumps(downloader.last_delta, indent=2, ensure_ascii=False))
+
+# запуск: python -m src.ingestion.downloader
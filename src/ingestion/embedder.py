@@ -1,31 +1,59 @@
-from typing import List
+from typing import List, Optional
 from langchain_core.embeddings import Embeddings
 from langchain_core.documents import Document
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from sentence_transformers import SentenceTransformer
 import torch
+import time
 
 from src.core.config import (
-    RAW_DATA_PATH, EMBEDDING_MODEL_NAME, DEVICE
+    RAW_DATA_PATH, EMBEDDING_MODEL_NAME, DEVICE, EMBEDDING_CACHE_ENABLED, EMBEDDING_BACKEND,
+    EMBEDDING_TOKEN_BUDGET
 )
+from src.ingestion.embedding_cache import EmbeddingCache
+from src.ingestion.model_registry import get_embedding_model
 
 class Embedder:
     """
     Класс для загрузки модели эмбеддингов и генерации векторных представлений текста.
     """
-    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, device: str = DEVICE):
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, device: str = DEVICE,
+                 use_cache: bool = EMBEDDING_CACHE_ENABLED, backend: str = EMBEDDING_BACKEND):
         """
-        Инициализирует модель эмбеддингов.
+        Настраивает эмбеддер и (опционально) дисковый кэш эмбеддингов чанков.
+        Сама модель загружается лениво, при первом обращении к self.model,
+        и берется из общего реестра процесса (см. model_registry).
+        backend: "torch", "torch-int8" или "onnx" - API эмбеддера от него не зависит.
         """
-        try:
-            self.model = SentenceTransformer(model_name, device=device)
-            self.embedding_dimension = self.model.get_sentence_embedding_dimension()
-            print(f"Модель успешно загружена. Размерность эмбеддингов: {self.embedding_dimension}")
-            
-        except Exception as e:
-            print(f"Ошибка при загрузке модели {model_name}: {e}")
-            self.model = None
-            self.embedding_dimension = 0
+        self.model_name = model_name
+        self.device = device
+        self.backend = backend
+        # Векторы квантизованных бэкендов отличаются от fp32, поэтому в кэше они хранятся отдельно
+        self.cache_model_key = model_name if backend == "torch" else f"{model_name}@{backend}"
+        self.cache: Optional[EmbeddingCache] = EmbeddingCache() if use_cache else None
+        self._model: Optional[SentenceTransformer] = None
+        self._load_failed = False
+        # Статистика последней векторизации чанков (см. _encode_bucketed)
+        self.last_stats: dict = {}
+
+    @property
+    def model(self) -> Optional[SentenceTransformer]:
+        """
+        Общая модель эмбеддингов (None, если загрузить ее не удалось).
+        """
+        if self._model is None and not self._load_failed:
+            try:
+                self._model = get_embedding_model(self.model_name, self.device, self.backend)
+                print(f"Модель успешно загружена. Размерность эмбеддингов: {self.embedding_dimension}")
+
+            except Exception as e:
+                print(f"Ошибка при загрузке модели {self.model_name}: {e}")
+                self._load_failed = True
+        return self._model
+
+    @property
+    def embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension() if self.model else 0
 
     def embed_documents(self, chunks: List[Document]) -> List[List[float]]:
         """
@@ -45,22 +73,95 @@ class Embedder:
         print(f"Начало векторизации {len(texts)} текстовых чанков.")
         
         try:
-            embeddings = self.model.encode(
-                texts,
-                convert_to_tensor=False,
-                show_progress_bar=True)
+            # Берем из кэша уже посчитанные векторы, модель считает только остальные
+            if self.cache:
+                embeddings = self.cache.get_many(self.cache_model_key, texts)
+            else:
+                embeddings = [None] * len(texts)
+            missing = [i for i, vector in enumerate(embeddings) if vector is None]
 
-            print(f"Генерация завершена. Создано {len(embeddings)} векторов.")
-            return embeddings.tolist()
+            if missing:
+                missing_texts = [texts[i] for i in missing]
+                new_embeddings = self._encode_bucketed(missing_texts)
+
+                if self.cache:
+                    self.cache.put_many(self.cache_model_key, missing_texts, new_embeddings)
+                for i, vector in zip(missing, new_embeddings):
+                    embeddings[i] = vector
+
+            print(f"Генерация завершена. Создано {len(embeddings)} векторов (из кэша: {len(texts) - len(missing)}).")
+            return embeddings
         except Exception as e:
             print(f"Ошибка при генерации эмбеддингов: {e}")
             return []
 
+    def _encode_bucketed(self, texts: List[str], token_budget: int = EMBEDDING_TOKEN_BUDGET) -> List[List[float]]:
+        """
+        Векторизует тексты батчами, сгруппированными по длине в токенах.
+        Тексты сортируются по убыванию длины, и в батч добавляется столько текстов,
+        чтобы (размер батча * длина самого длинного) не превышало token_budget.
+        Так короткие хвосты страниц не дополняются паддингом до длинных чанков.
+        Результат возвращается в исходном порядке; статистика - в self.last_stats.
+        """
+        start = time.perf_counter()
+        max_length = self.model.max_seq_length
+        token_ids = self.model.tokenizer(texts, add_special_tokens=True, truncation=False)['input_ids']
+        lengths = [min(len(ids), max_length) for ids in token_ids]
+        order = sorted(range(len(texts)), key=lambda i: lengths[i], reverse=True)
+
+        # Жадная упаковка: первый текст батча - самый длинный в нем
+        batches: List[List[int]] = []
+        for i in order:
+            if batches and (len(batches[-1]) + 1) * lengths[batches[-1][0]] <= token_budget:
+                batches[-1].append(i)
+            else:
+                batches.append([i])
+
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        for batch in batches:
+            vectors = self.model.encode(
+                [texts[i] for i in batch],
+                batch_size=len(batch),
+                convert_to_tensor=False,
+                show_progress_bar=False)
+            for i, vector in zip(batch, vectors.tolist()):
+                embeddings[i] = vector
+
+        elapsed = time.perf_counter() - start
+        n_tokens = sum(lengths)
+        padded_tokens = sum(len(batch) * lengths[batch[0]] for batch in batches)
+        self.last_stats = {
+            'chunks': len(texts),
+            'tokens': n_tokens,
+            'batches': len(batches),
+            'seconds': elapsed,
+            'chunks_per_sec': len(texts) / elapsed if elapsed else 0.0,
+            'tokens_per_sec': n_tokens / elapsed if elapsed else 0.0,
+            'padding_ratio': 1 - n_tokens / padded_tokens if padded_tokens else 0.0,
+        }
+        print(f"Векторизация: {len(batches)} батчей, {self.last_stats['chunks_per_sec']:.1f} чанков/с, "
+              f"{self.last_stats['tokens_per_sec']:.0f} токенов/с, паддинг {self.last_stats['padding_ratio']:.1%}")
+        return embeddings
+
     # Для векторизации запроса пользователя
     def embed_query(self, query: str) -> List[float]:
         """
         Генерирует эмбеддинг для одного запроса.
         """
+        embeddings = self.embed_queries([query])
+        # Возвращаем первый и единственный вектор из списка
+        return embeddings[0] if embeddings else None
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Генерирует эмбеддинги для нескольких запросов за один проход модели.
+
+        Аргументы:
+            queries: Список пользовательских запросов.
+
+        Возвращает:
+            List[List[float]]: Векторы в порядке запросов (пустой список при ошибке).
+        """
         if not self.model:
             print('Ошибка: Модель эмбеддингов не загружена.')
             return []
@@ -68,16 +169,16 @@ class Embedder:
         # query_with_prefix = [f"query: {query}"]
         
         try:
-            embedding = self.model.encode(
-                query,
+            embeddings = self.model.encode(
+                queries,
+                batch_size=max(len(queries), 1),
                 convert_to_tensor=False
             )
-            # Возвращаем первый и единственный вектор из списка
-            return embedding[0].tolist()
+            return embeddings.tolist()
             
         except Exception as e:
             print(f"Ошибка при генерации эмбеддинга запроса: {e}")
-            return None
+            return []
 
     def get_embedding_dimension(self):
         return self.embedding_dimension
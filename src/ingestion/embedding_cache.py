@@ -0,0 +1,145 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import List, Optional
+from pathlib import Path
+
+import numpy as np
+
+from src.core.config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES
+
+# SQLite ограничивает число параметров в одном запросе
+_SQL_BATCH = 500
+
+class EmbeddingCache:
+    """
+    Дисковый кэш эмбеддингов в SQLite.
+    Ключ - SHA-256 от (имя модели, нормализованный текст чанка), значение - вектор float32.
+    При превышении max_entries удаляются записи, к которым дольше всего не обращались.
+    Число записей хранится в таблице stats и поддерживается триггерами на вставку
+    и удаление, поэтому проверка лимита не пересчитывает таблицу и верна, даже
+    если в кэш пишут несколько процессов.
+    """
+    def __init__(self, path: Path = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Счетчик записей для кэша, созданного до его появления, считается один раз
+        self.conn.executescript("""
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, last_access INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access);
+            CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO stats SELECT 'entries', COUNT(*) FROM embeddings;
+            CREATE TRIGGER IF NOT EXISTS embeddings_insert AFTER INSERT ON embeddings
+                BEGIN UPDATE stats SET value = value + 1 WHERE name = 'entries'; END;
+            CREATE TRIGGER IF NOT EXISTS embeddings_delete AFTER DELETE ON embeddings
+                BEGIN UPDATE stats SET value = value - 1 WHERE name = 'entries'; END;
+            COMMIT;
+        """)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Нормализует текст чанка: Unicode NFC и схлопывание пробельных символов.
+        """
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    @classmethod
+    def make_key(cls, model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{cls.normalize(text)}".encode('utf-8')).hexdigest()
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Возвращает векторы из кэша в порядке texts (None для отсутствующих).
+        """
+        keys = [self.make_key(model_name, text) for text in texts]
+        found = {}
+
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start:start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                now = time.time_ns()
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self.conn.commit()
+
+            results = [
+                np.frombuffer(found[key], dtype=np.float32).tolist() if key in found else None
+                for key in keys
+            ]
+            n_hits = sum(1 for vector in results if vector is not None)
+            self.hits += n_hits
+            self.misses += len(keys) - n_hits
+
+        return results
+
+    def put_many(self, model_name: str, texts: List[str], vectors: List[List[float]]):
+        """
+        Сохраняет векторы в кэш и при необходимости вытесняет старые записи.
+        """
+        now = time.time_ns()
+        rows = [
+            (self.make_key(model_name, text), model_name, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+
+        with self._lock:
+            # Не INSERT OR REPLACE: неявное удаление при замене не вызывает триггер счетчика
+            self.conn.executemany(
+                "INSERT INTO embeddings (key, model, vector, last_access) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET model = excluded.model, vector = excluded.vector, "
+                "last_access = excluded.last_access", rows
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """
+        Удаляет самые давно использованные записи сверх max_entries.
+        """
+        excess = self._count() - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)", (excess,)
+            )
+
+    def _count(self) -> int:
+        return self.conn.execute("SELECT value FROM stats WHERE name = 'entries'").fetchone()[0]
+
+    def stats(self) -> dict:
+        """
+        Счетчики попаданий/промахов с момента создания объекта и размер кэша.
+        """
+        with self._lock:
+            entries = self._count()
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries,
+            'max_entries': self.max_entries,
+        }
+
+    def close(self):
+        self.conn.close()
@@ -1,4 +1,5 @@
 import sys
+from typing import Dict, Iterator, List, Tuple
 from pathlib import Path
 
 # Добавляем корневую папку src в PYTHONPATH, чтобы импортировать модули
@@ -8,12 +9,20 @@ sys.path.append(str(Path(__file__).resolve().parent / "src"))
 from src.ingestion.downloader import DataLoader
 from src.ingestion.text_splitter import TextSplitter
 from src.ingestion.vector_store import VectorStoreManager
-from src.core.config import RAW_DATA_PATH
+from src.ingestion.manifest import IngestionManifest
+from langchain.schema.document import Document
+from src.core.config import RAW_DATA_PATH, INGEST_BATCH_SIZE
 
-def run_ingestion_pipeline():
+def run_ingestion_pipeline(sync_data: bool = False):
     """
-    Оркестрирует полный пайплайн индексации документов:
+    Оркестрирует пайплайн индексации документов:
     Загрузка -> Разбиение -> Векторизация и Сохранение в ChromaDB.
+    sync_data - скачать архив заново и синхронизировать data/raw, даже если PDF уже есть
+    (распаковываются только изменившиеся файлы, остальные индексируются как неизмененные).
+    Обрабатываются только новые и измененные PDF (по манифесту),
+    чанки удаленных PDF удаляются из коллекции. Индексация идет потоково,
+    батчами по INGEST_BATCH_SIZE чанков; манифест сохраняется по мере
+    готовности файлов, поэтому после сбоя повторный запуск продолжит работу.
     """
     print("Запуск Ingestion-пайплайна")
     
@@ -21,8 +30,9 @@ def run_ingestion_pipeline():
     print("1. Проверка и загрузка исходных PDF-документов")
     
     # Проверка наличия PDF-файлов
-    if not list(RAW_DATA_PATH.rglob("*.pdf")):
-        print("Исходные PDF-файлы не найдены в data/raw. Запускаем загрузчик.")
+    if sync_data or not list(RAW_DATA_PATH.rglob("*.pdf")):
+        if not sync_data:
+            print("Исходные PDF-файлы не найдены в data/raw. Запускаем загрузчик.")
         downloader = DataLoader()
         if not downloader.download_and_prepare_data():
             print("Ошибка загрузки данных. Пайплайн остановлен.")
@@ -30,34 +40,114 @@ def run_ingestion_pipeline():
 
     # ЗАГРУЖАЮ ТОЛЬКО ЧАСТЬ ДЛЯ ТЕСТА
     TEST_DATA_PATH = RAW_DATA_PATH / "zvirt-metrics"
-    
-    # разбиение на чанки
-    print("2. Загрузка документов и разбиение их на чанки")
-    splitter = TextSplitter()
-    loaded_pages = splitter.load_documents(TEST_DATA_PATH)
-    if not loaded_pages:
-        print("Документы не загружены. Пайплайн остановлен.")
+
+    # Сравнение с манифестом: обрабатываем только новые/измененные файлы
+    print("2. Поиск новых, измененных и удаленных документов")
+    manifest = IngestionManifest()
+    changed, removed = manifest.diff(TEST_DATA_PATH, RAW_DATA_PATH)
+    print(f"Новых/измененных файлов: {len(changed)}, удаленных: {len(removed)}")
+
+    manager = VectorStoreManager()
+    # Чанки, записанные до появления метаданных продукта
+    manager.backfill_product_metadata()
+
+    if not changed and not removed:
+        manifest.save()
+        print("Индекс актуален. Пайплайн завершен.")
         return
 
-    # Разбиваем страницы на мелкие чанки
-    chunks = splitter.split_documents(loaded_pages)
-    if not chunks:
-        print("Не удалось создать чанки. Пайплайн остановлен.")
+    # Первый запуск с манифестом: убираем чанки со старыми id 'doc_N'
+    if not manifest.files:
+        manager.delete_legacy_documents()
+
+    # Удаляем чанки удаленных и измененных файлов
+    if not manager.delete_documents(manifest.chunk_ids(removed + list(changed))):
+        print("Ошибка удаления устаревших чанков. Пайплайн остановлен.")
         return
+    for source in removed:
+        manifest.remove(source)
+    manifest.save()
 
-    # Эмбеддинги и векторизация
-    print("3. Генерация эмбеддингов и сохранение в ChromaDB")
-    
-    manager = VectorStoreManager()
+    if not changed:
+        manager.lexical_index.optimize()
+        manager.build_vector_export()
+        print("Чанки удаленных документов удалены. Пайплайн завершен.")
+        return
     
-    if manager.index_documents(chunks):
-        # Эмбеддинги генерируются при вызове index_documents(chunks)
-        print("Эмбеддинги сгенерированы")
-        print(f"Документация готова к поиску в коллекции '{manager.collection}'.")
-    else:
-        print("Ошибка генерации эмбеддингов.")
+    # Потоковая обработка: файл -> страницы -> чанки -> батч -> эмбеддинги -> ChromaDB.
+    # В памяти одновременно находятся только текущий батч и страницы одного файла.
+    print("3. Потоковая загрузка, разбиение, векторизация и сохранение в ChromaDB")
+    splitter = TextSplitter()
+    changed_files = [RAW_DATA_PATH / source for source in changed]
+    ids_by_source: Dict[str, List[str]] = {source: [] for source in changed}
+    n_chunks = 0
+
+    for chunks, chunk_ids, finished_sources in iter_chunk_batches(splitter, TEST_DATA_PATH, changed_files):
+        if chunks and not manager.index_documents(chunks, chunk_ids):
+            print("Ошибка генерации эмбеддингов. Пайплайн остановлен, обработанные файлы сохранены в манифесте.")
+            return
+        n_chunks += len(chunks)
+
+        # Фиксируем в манифесте файлы, все чанки которых уже записаны
+        for chunk, chunk_id in zip(chunks, chunk_ids):
+            ids_by_source[chunk.metadata['source']].append(chunk_id)
+        for source in finished_sources:
+            manifest.update(source, changed[source], ids_by_source.pop(source))
+        if finished_sources:
+            manifest.save()
+        print(f"Записано чанков: {n_chunks}, файлов готово: {len(changed) - len(ids_by_source)}/{len(changed)}")
+
+    # Слияние сегментов лексического индекса после записи всех батчей
+    manager.lexical_index.optimize()
+    # Выгрузка для компактного/mmap-бэкенда поиска (для ChromaDB не нужна)
+    manager.build_vector_export()
+
+    print("Эмбеддинги сгенерированы")
+    if manager.embedder.cache:
+        print(f"Кэш эмбеддингов: {manager.embedder.cache.stats()}")
+    print(f"Документация готова к поиску в коллекции '{manager.collection}'.")
+
+
+def iter_chunk_batches(splitter: TextSplitter, data_path: Path, files: List[Path],
+                       batch_size: int = INGEST_BATCH_SIZE) -> Iterator[Tuple[List[Document], List[str], List[str]]]:
+    """
+    Генератор батчей чанков для потоковой индексации.
+
+    Аргументы:
+        splitter: Сплиттер, извлекающий страницы и разбивающий их на чанки.
+        data_path: Папка с PDF-файлами.
+        files: Список PDF-файлов для обработки.
+        batch_size: Количество чанков в батче.
+
+    Возвращает:
+        Iterator: Тройки (чанки, их id, source файлов, все чанки которых
+                  уже вошли в этот или предыдущие батчи).
+    """
+    batch_chunks: List[Document] = []
+    batch_ids: List[str] = []
+    open_sources: List[str] = []
+
+    for file_path, pages in splitter.iter_documents(data_path, files=files, base_path=RAW_DATA_PATH):
+        open_sources.append(str(file_path.relative_to(RAW_DATA_PATH)))
+        chunks = splitter.split_documents(pages) if pages else []
+
+        for chunk, chunk_id in zip(chunks, VectorStoreManager.make_chunk_ids(chunks)):
+            batch_chunks.append(chunk)
+            batch_ids.append(chunk_id)
+            if len(batch_chunks) == batch_size:
+                # Все файлы, кроме текущего, полностью попали в батч
+                yield batch_chunks, batch_ids, open_sources[:-1]
+                batch_chunks, batch_ids, open_sources = [], [], open_sources[-1:]
+
+    yield batch_chunks, batch_ids, open_sources
 
 if __name__ == "__main__":
-    run_ingestion_pipeline()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Индексация документации")
+    parser.add_argument("--sync", action="store_true", help="Синхронизировать data/raw с архивом перед индексацией")
+    args = parser.parse_args()
+
+    run_ingestion_pipeline(sync_data=args.sync)
 
 # запуск: python3 -m src.ingestion.ingest.py
\ No newline at end of file
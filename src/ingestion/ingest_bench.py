@@ -0,0 +1,246 @@
+import argparse
+import cProfile
+import json
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from langchain.schema.document import Document
+
+from src.ingestion.embedder import Embedder
+from src.ingestion.lexical_index import LexicalIndex
+from src.ingestion.text_splitter import TextSplitter
+from src.ingestion.vector_store import VectorStoreManager
+from src.core.config import (RAW_DATA_PATH, INGEST_BATCH_SIZE, PDF_EXTRACTION_WORKERS, EMBEDDING_MODEL_NAME,
+                             EMBEDDING_BACKEND, DEVICE, CHUNK_LENGTH_UNIT, NATIVE_SPLITTER_ENABLED)
+
+def peak_rss_mb(children: bool = False) -> Optional[float]:
+    """
+    Пиковый RSS процесса (children=True - завершившихся дочерних процессов, например пула извлечения), МБ.
+    None, если модуль resource недоступен.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    return usage.ru_maxrss / 1024  # в Linux ru_maxrss - в КБ
+
+class StageProfiler:
+    """
+    Профилировщик этапов: суммарное время, число вызовов и обработанных элементов,
+    рост пикового RSS за время этапа. При profile_dir каждый этап дополнительно
+    профилируется cProfile (один профиль на этап по всем вызовам), профили
+    сохраняются в profile_dir/<этап>.prof - формат pstats (python -m pstats,
+    snakeviz, gprof2dot). Для flame graph без накладных расходов cProfile процесс
+    можно снять снаружи: py-spy record -o ingest.svg -- python -m src.ingestion.ingest_bench.
+    """
+    def __init__(self, profile_dir: Optional[Path] = None):
+        self.profile_dir = profile_dir
+        self.stages: Dict[str, dict] = {}
+        self._profiles: Dict[str, cProfile.Profile] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[dict]:
+        """
+        Замеряет блок кода как вызов этапа name. Возвращает статистику этапа:
+        вызывающий код добавляет в stats['items'] число обработанных элементов.
+        """
+        stats = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0, 'items': 0, 'rss_growth_mb': 0.0})
+        profile = self._profiles.setdefault(name, cProfile.Profile()) if self.profile_dir else None
+        rss_before = peak_rss_mb()
+        if profile:
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats['seconds'] += time.perf_counter() - start
+            if profile:
+                profile.disable()
+            stats['calls'] += 1
+            if rss_before is not None:
+                stats['rss_growth_mb'] += peak_rss_mb() - rss_before
+
+    def dump(self) -> List[Path]:
+        """
+        Сохраняет профили этапов (если задан profile_dir); возвращает пути файлов.
+        """
+        if not self.profile_dir:
+            return []
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for name, profile in self._profiles.items():
+            paths.append(self.profile_dir / f"{name}.prof")
+            profile.dump_stats(paths[-1])
+        return paths
+
+def select_files(folders: List[str], max_files: Optional[int] = None) -> List[Path]:
+    """
+    PDF из указанных папок data/raw (например, zvirt-metrics), не больше max_files.
+    """
+    files = sorted(file for folder in folders for file in (RAW_DATA_PATH / folder).rglob("*.pdf"))
+    return files[:max_files] if max_files else files
+
+def run_benchmark(files: List[Path], batch_size: int = INGEST_BATCH_SIZE, workers: int = PDF_EXTRACTION_WORKERS,
+                  use_embedding_cache: bool = False, profile_dir: Optional[Path] = None,
+                  keep: bool = False) -> dict:
+    """
+    Прогоняет этапы run_ingestion_pipeline на выбранных файлах с тем же потоковым
+    разбиением на батчи: извлечение текста (pypdf) -> разбиение на чанки ->
+    векторизация -> upsert в ChromaDB -> запись в BM25-индекс. Запись идет во
+    временные ChromaDB и лексический индекс, рабочий индекс, манифест и версия
+    индекса не меняются.
+
+    Время извлечения - ожидание страниц очередного файла: при workers > 1 пул
+    процессов извлекает текст параллельно с остальными этапами, и в замер попадает
+    только то, что не удалось скрыть. Для профиля самого pypdf - workers=1.
+
+    Аргументы:
+        files: PDF для индексации.
+        batch_size: Чанков в батче векторизации и записи.
+        workers: Процессов извлечения текста.
+        use_embedding_cache: Использовать кэш эмбеддингов (по умолчанию выключен,
+                             иначе повторный прогон меряет чтение из кэша, а не модель).
+        profile_dir: Папка для cProfile-профилей этапов (None - без профилирования).
+        keep: Не удалять временный индекс.
+
+    Возвращает:
+        dict: Параметры прогона, статистика этапов и итоговые показатели.
+    """
+    if not files:
+        raise ValueError("Нет PDF для индексации.")
+    tmp_path = Path(tempfile.mkdtemp(prefix="ingest_bench_"))
+    profiler = StageProfiler(profile_dir)
+    wall_start = time.perf_counter()
+
+    splitter = TextSplitter()
+    embedder = Embedder(use_cache=use_embedding_cache)
+    manager = VectorStoreManager(db_path=tmp_path / "vectordb", embedder=embedder)
+    collection = manager.get_or_create_collection()
+    lexical_index = LexicalIndex(tmp_path / "lexical_index.sqlite3")
+    max_batch_size = manager._max_batch_size()
+    with profiler.stage('model_load'):
+        if not embedder.model:
+            raise RuntimeError(f"Не удалось загрузить модель эмбеддингов {EMBEDDING_MODEL_NAME}.")
+
+    def flush(chunks: List[Document], ids: List[str]):
+        with profiler.stage('embed') as stats:
+            embeddings = embedder.embed_documents(chunks)
+            stats['items'] += len(embeddings)
+        if len(embeddings) != len(chunks):
+            raise RuntimeError("Не удалось сгенерировать эмбеддинги для всех чанков.")
+        texts = [chunk.page_content for chunk in chunks]
+        with profiler.stage('upsert') as stats:
+            for start in range(0, len(ids), max_batch_size):
+                end = start + max_batch_size
+                collection.upsert(ids=ids[start:end], embeddings=embeddings[start:end],
+                                  documents=texts[start:end], metadatas=[c.metadata for c in chunks[start:end]])
+            stats['items'] += len(ids)
+        with profiler.stage('lexical') as stats:
+            lexical_index.add(ids, texts)
+            stats['items'] += len(ids)
+
+    # Батчи - как в iter_chunk_batches: id считаются по файлу, батч режется ровно по batch_size
+    batch_chunks: List[Document] = []
+    batch_ids: List[str] = []
+    pages_iter = splitter.iter_documents(RAW_DATA_PATH, num_workers=workers, files=files, base_path=RAW_DATA_PATH)
+    n_pages = 0
+    try:
+        while True:
+            with profiler.stage('extract') as stats:
+                item = next(pages_iter, None)
+                if item is not None:
+                    stats['items'] += len(item[1])
+            if item is None:
+                break
+            n_pages += len(item[1])
+            with profiler.stage('split') as stats:
+                chunks = splitter.split_documents(item[1]) if item[1] else []
+                batch_ids.extend(VectorStoreManager.make_chunk_ids(chunks))
+                stats['items'] += len(chunks)
+            batch_chunks.extend(chunks)
+            while len(batch_chunks) >= batch_size:
+                flush(batch_chunks[:batch_size], batch_ids[:batch_size])
+                batch_chunks, batch_ids = batch_chunks[batch_size:], batch_ids[batch_size:]
+        if batch_chunks:
+            flush(batch_chunks, batch_ids)
+        # Слияние сегментов BM25 - как в конце run_ingestion_pipeline
+        with profiler.stage('lexical'):
+            lexical_index.optimize()
+    finally:
+        pages_iter.close()
+        lexical_index.close()
+        if not keep:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    wall_seconds = time.perf_counter() - wall_start
+    units = {'extract': 'pages', 'split': 'chunks', 'embed': 'embeddings', 'upsert': 'upserts', 'lexical': 'chunks'}
+    for name, stats in profiler.stages.items():
+        stats['share'] = stats['seconds'] / wall_seconds
+        if name in units:
+            stats[f"{units[name]}_per_s"] = stats['items'] / stats['seconds'] if stats['seconds'] else 0.0
+
+    results = {
+        'settings': {
+            'files': len(files), 'batch_size': batch_size, 'workers': workers,
+            'embedding_model': EMBEDDING_MODEL_NAME, 'embedding_backend': EMBEDDING_BACKEND, 'device': DEVICE,
+            'embedding_cache': use_embedding_cache, 'chunk_length_unit': CHUNK_LENGTH_UNIT,
+            'native_splitter': NATIVE_SPLITTER_ENABLED,
+        },
+        'stages': profiler.stages,
+        'totals': {
+            'wall_seconds': wall_seconds,
+            'pages': n_pages,
+            'chunks': profiler.stages.get('split', {}).get('items', 0),
+            'pages_per_s': n_pages / wall_seconds,
+            'peak_rss_mb': peak_rss_mb(),
+            'peak_rss_children_mb': peak_rss_mb(children=True),
+        },
+        'profiles': [str(path) for path in profiler.dump()],
+    }
+    if keep:
+        results['index_path'] = str(tmp_path)
+
+    print_results(results)
+    return results
+
+def print_results(results: dict):
+    totals = results['totals']
+    print(f"\nФайлов: {results['settings']['files']}, страниц: {totals['pages']}, чанков: {totals['chunks']}, "
+          f"всего {totals['wall_seconds']:.1f} с ({totals['pages_per_s']:.1f} стр/с)")
+    print(f"{'Этап':<12} {'время, с':>9} {'доля':>7} {'вызовов':>8} {'элементов':>10} {'в секунду':>11} {'рост RSS, МБ':>13}")
+    for name, stats in results['stages'].items():
+        rate = next((value for key, value in stats.items() if key.endswith('_per_s')), None)
+        print(f"{name:<12} {stats['seconds']:>9.2f} {stats['share']:>7.1%} {stats['calls']:>8} {stats['items']:>10} "
+              f"{'' if rate is None else f'{rate:.1f}':>11} {stats['rss_growth_mb']:>13.1f}")
+    if totals['peak_rss_mb'] is not None:
+        print(f"Пиковый RSS: {totals['peak_rss_mb']:.0f} МБ, процессов извлечения: {totals['peak_rss_children_mb']:.0f} МБ")
+    if results['profiles']:
+        print(f"Профили этапов: {', '.join(results['profiles'])}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пропускная способность индексации по этапам")
+    parser.add_argument("--folders", nargs="+", default=["zvirt-metrics"], help="Папки data/raw для индексации")
+    parser.add_argument("--max-files", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=PDF_EXTRACTION_WORKERS, help="Процессов извлечения текста")
+    parser.add_argument("--embedding-cache", action="store_true", help="Использовать кэш эмбеддингов")
+    parser.add_argument("--profile-dir", type=Path, default=None, help="Сохранить cProfile каждого этапа (.prof)")
+    parser.add_argument("--keep", action="store_true", help="Не удалять временный индекс")
+    parser.add_argument("--output", default=None, help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    results = run_benchmark(select_files(args.folders, args.max_files), args.batch_size, args.workers,
+                            args.embedding_cache, args.profile_dir, args.keep)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+# запуск: python -m src.ingestion.ingest_bench --folders zvirt-metrics --profile-dir data/profiles
@@ -0,0 +1,324 @@
+import math
+from array import array
+import re
+import sqlite3
+import threading
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+from pathlib import Path
+
+import numpy as np
+import snowballstemmer
+
+from src.core.config import LEXICAL_INDEX_PATH, BM25_K1, BM25_B
+
+# Слова с дефисами/точками (S-Terra, v1.2.3), CLI-флаги (--force) и коды ошибок (0x80070005)
+_TOKEN_RE = re.compile(r"-{0,2}\w+(?:[-.]\w+)*")
+_CYRILLIC_RE = re.compile(r"^[а-яё]+$")
+_LATIN_RE = re.compile(r"^[a-z]+$")
+_PARTS_RE = re.compile(r"[-.]+")
+_SQL_BATCH = 500
+
+STOPWORDS = frozenset("""
+и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне было вот от
+меня еще нет о из ему теперь когда даже ну вдруг ли если уже или ни быть был него до вас нибудь опять уж
+вам ведь там потом себя ничего ей может они тут где есть надо ней для мы тебя их чем была сам чтоб без
+будто чего раз тоже себе под будет ж тогда кто этот того потому этого какой совсем ним здесь этом один
+почти мой тем чтобы нее сейчас были куда зачем всех никогда можно при наконец два об другой хоть после
+над больше тот через эти нас про всего них какая много разве три эту моя впрочем хорошо свою этой перед
+иногда лучше чуть том нельзя такой им более всегда конечно всю между это
+the a an and or of to in on for is are be by with as at from this that it not
+""".split())
+
+_ru_stemmer = snowballstemmer.stemmer('russian')
+_en_stemmer = snowballstemmer.stemmer('english')
+
+def tokenize(text: str) -> List[str]:
+    """
+    Токенизация для лексического поиска: нижний регистр, без стоп-слов,
+    стемминг Snowball для русских и английских слов. Составные токены
+    (идентификаторы продуктов, флаги, версии) сохраняются целиком,
+    а их части добавляются отдельными токенами.
+    """
+    tokens: List[str] = []
+    for match in _TOKEN_RE.finditer(text.lower().replace('ё', 'е')):
+        tokens.extend(_normalize_token(match.group()))
+    return tokens
+
+@lru_cache(maxsize=200_000)
+def _normalize_token(token: str) -> Tuple[str, ...]:
+    """
+    Термины для одного токена (кэшируется: словарь документации сильно повторяется).
+    """
+    if token in STOPWORDS:
+        return ()
+    if _CYRILLIC_RE.match(token):
+        return (_ru_stemmer.stemWord(token),)
+    if _LATIN_RE.match(token):
+        return (_en_stemmer.stemWord(token),)
+
+    parts = _PARTS_RE.split(token.strip('-'))
+    if len(parts) == 1:
+        return (token,)
+    return (token, *(part for part in parts if len(part) > 1 and part not in STOPWORDS))
+
+class LexicalIndex:
+    """
+    Инвертированный индекс BM25 по тем же id чанков, что и в ChromaDB, в SQLite.
+    Постинги хранятся сегментами: каждый вызов add() пишет для каждого термина
+    одну строку с упакованными массивами (doc, tf, длина документа), поэтому
+    поиск читает по термину несколько BLOB-ов, а не тысячи строк.
+    Удаление помечает документы в таблице deleted; optimize() сливает сегменты
+    термина в один и физически убирает удаленные документы.
+    Поиск можно ограничить продуктами: id чанка начинается с папки продукта.
+    """
+    def __init__(self, path: Path = LEXICAL_INDEX_PATH, k1: float = BM25_K1, b: float = BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        # Номера документов по продуктам и поколение индекса, для которого они посчитаны.
+        # Поколение растет при каждом изменении docs (в том числе из другого процесса -
+        # например, индексации при работающем сервисе), и тогда кэш пересчитывается.
+        self._product_docs: Dict[str, np.ndarray] = {}
+        self._product_docs_generation: Optional[int] = None
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA cache_size=-65536;
+            PRAGMA mmap_size=268435456;
+            CREATE TABLE IF NOT EXISTS docs (
+                doc INTEGER PRIMARY KEY AUTOINCREMENT, chunk_id TEXT UNIQUE NOT NULL, length INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS segments (
+                term TEXT NOT NULL, seg INTEGER NOT NULL, docs BLOB NOT NULL, tfs BLOB NOT NULL, lengths BLOB NOT NULL,
+                PRIMARY KEY (term, seg)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS deleted (doc INTEGER PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO stats VALUES ('n_docs', 0), ('total_length', 0), ('next_seg', 0), ('generation', 0);
+        """)
+        self.conn.commit()
+
+    def _stats(self) -> Dict[str, int]:
+        return dict(self.conn.execute("SELECT name, value FROM stats").fetchall())
+
+    def _set_stats(self, **values: int):
+        self.conn.executemany("UPDATE stats SET value = ? WHERE name = ?", [(v, k) for k, v in values.items()])
+
+    def count(self) -> int:
+        with self._lock:
+            return self._stats()['n_docs']
+
+    def add(self, chunk_ids: List[str], texts: List[str]):
+        """
+        Добавляет (или заменяет) чанки в индексе одним новым сегментом.
+        """
+        with self._lock:
+            self._delete(chunk_ids)
+            stats = self._stats()
+
+            postings: Dict[str, Tuple[List[int], List[int], List[int]]] = {}
+            total_length = 0
+            for chunk_id, text in zip(chunk_ids, texts):
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                doc = self.conn.execute(
+                    "INSERT INTO docs (chunk_id, length) VALUES (?, ?)", (chunk_id, length)
+                ).lastrowid
+                total_length += length
+                for term, tf in counts.items():
+                    docs, tfs, lengths = postings.setdefault(term, ([], [], []))
+                    docs.append(doc)
+                    tfs.append(tf)
+                    lengths.append(length)
+
+            seg = stats['next_seg']
+            self.conn.executemany(
+                "INSERT INTO segments (term, seg, docs, tfs, lengths) VALUES (?, ?, ?, ?, ?)",
+                [(term, seg, *self._pack(docs, tfs, lengths)) for term, (docs, tfs, lengths) in postings.items()]
+            )
+            self._set_stats(n_docs=stats['n_docs'] + len(chunk_ids),
+                            total_length=stats['total_length'] + total_length,
+                            next_seg=seg + 1, generation=stats['generation'] + 1)
+            self.conn.commit()
+
+    @staticmethod
+    def _pack(docs, tfs, lengths) -> Tuple[bytes, bytes, bytes]:
+        # array быстрее numpy на коротких списках, а формат тот же (int64/int32)
+        return (array('q', docs).tobytes(), array('i', tfs).tobytes(), array('i', lengths).tobytes())
+
+    def delete(self, chunk_ids: List[str]):
+        """
+        Удаляет чанки из индекса (отсутствующие id игнорируются).
+        """
+        with self._lock:
+            self._delete(chunk_ids)
+            self.conn.commit()
+
+    def _delete(self, chunk_ids: List[str]):
+        stats = self._stats()
+        n_docs, total_length = stats['n_docs'], stats['total_length']
+        for start in range(0, len(chunk_ids), _SQL_BATCH):
+            batch = chunk_ids[start:start + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT doc, length FROM docs WHERE chunk_id IN ({placeholders})", batch
+            ).fetchall()
+            if not rows:
+                continue
+            self.conn.executemany("INSERT INTO deleted (doc) VALUES (?)", [(doc,) for doc, _ in rows])
+            self.conn.execute(f"DELETE FROM docs WHERE chunk_id IN ({placeholders})", batch)
+            n_docs -= len(rows)
+            total_length -= sum(length for _, length in rows)
+        if n_docs != stats['n_docs']:
+            self._set_stats(n_docs=n_docs, total_length=total_length, generation=stats['generation'] + 1)
+
+    def optimize(self):
+        """
+        Сливает сегменты каждого термина в один и убирает удаленные документы.
+        Вызывается после индексации; поиск работает и без него, но медленнее.
+        """
+        with self._lock:
+            deleted = self._deleted_docs()
+            self.conn.execute(
+                "CREATE TEMP TABLE merged (term TEXT NOT NULL, seg INTEGER NOT NULL, "
+                "docs BLOB NOT NULL, tfs BLOB NOT NULL, lengths BLOB NOT NULL)"
+            )
+            current_term, parts = None, []
+            rows = self.conn.execute("SELECT term, docs, tfs, lengths FROM segments ORDER BY term, seg")
+            for term, *blobs in list(rows) + [(None, None, None, None)]:
+                if term != current_term and parts:
+                    merged = self._merge(parts, deleted)
+                    if len(merged[0]):
+                        self.conn.execute("INSERT INTO merged VALUES (?, 0, ?, ?, ?)",
+                                          (current_term, *self._pack(*merged)))
+                    parts = []
+                current_term = term
+                if term is not None:
+                    parts.append(blobs)
+
+            self.conn.execute("DELETE FROM segments")
+            self.conn.execute("INSERT INTO segments SELECT * FROM merged")
+            self.conn.execute("DROP TABLE merged")
+            self.conn.execute("DELETE FROM deleted")
+            self._set_stats(next_seg=1)
+            self.conn.commit()
+
+    @staticmethod
+    def _unpack(parts: List[Tuple[bytes, bytes, bytes]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        docs = np.concatenate([np.frombuffer(p[0], dtype=np.int64) for p in parts])
+        tfs = np.concatenate([np.frombuffer(p[1], dtype=np.int32) for p in parts])
+        lengths = np.concatenate([np.frombuffer(p[2], dtype=np.int32) for p in parts])
+        return docs, tfs, lengths
+
+    def _merge(self, parts, deleted: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        docs, tfs, lengths = self._unpack(parts)
+        if len(deleted):
+            alive = ~np.isin(docs, deleted)
+            docs, tfs, lengths = docs[alive], tfs[alive], lengths[alive]
+        return docs, tfs, lengths
+
+    def _deleted_docs(self) -> np.ndarray:
+        return np.asarray([doc for (doc,) in self.conn.execute("SELECT doc FROM deleted")], dtype=np.int64)
+
+    def rebuild(self, items: Iterable[Tuple[List[str], List[str]]]):
+        """
+        Полностью пересобирает индекс из пачек (id чанков, тексты).
+        """
+        with self._lock:
+            self.conn.executescript("DELETE FROM segments; DELETE FROM docs; DELETE FROM deleted;")
+            self._set_stats(n_docs=0, total_length=0, next_seg=0, generation=self._stats()['generation'] + 1)
+            self.conn.commit()
+        for chunk_ids, texts in items:
+            self.add(chunk_ids, texts)
+        self.optimize()
+
+    def _docs_for_products(self, products: List[str], generation: int) -> np.ndarray:
+        """
+        Номера документов, id чанков которых начинаются с 'продукт/' (диапазон по индексу chunk_id).
+        generation - текущее поколение индекса (из stats, прочитанных под блокировкой);
+        если оно изменилось, посчитанные ранее номера сбрасываются.
+        """
+        if generation != self._product_docs_generation:
+            self._product_docs.clear()
+            self._product_docs_generation = generation
+        arrays = []
+        for product in products:
+            if product not in self._product_docs:
+                rows = self.conn.execute(
+                    "SELECT doc FROM docs WHERE chunk_id >= ? AND chunk_id < ?",
+                    (product + "/", product + chr(ord("/") + 1))
+                ).fetchall()
+                self._product_docs[product] = np.asarray([doc for (doc,) in rows], dtype=np.int64)
+            arrays.append(self._product_docs[product])
+        return np.concatenate(arrays)
+
+    def search(self, query: str, n_results: int, products: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Ищет чанки по BM25.
+
+        Аргументы:
+            query: Текст запроса.
+            n_results: Количество результатов.
+            products: Искать только среди чанков этих продуктов (None - по всему индексу).
+                      IDF считается по всему индексу, как и без фильтра.
+
+        Возвращает:
+            List[Tuple[str, float]]: Пары (id чанка, оценка BM25) по убыванию оценки.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self._lock:
+            stats = self._stats()
+            n_docs = stats['n_docs']
+            if n_docs == 0:
+                return []
+            avg_length = stats['total_length'] / n_docs
+            deleted = self._deleted_docs()
+            allowed = self._docs_for_products(products, stats['generation']) if products else None
+
+            doc_parts, score_parts = [], []
+            for term in terms:
+                parts = self.conn.execute(
+                    "SELECT docs, tfs, lengths FROM segments WHERE term = ?", (term,)
+                ).fetchall()
+                if not parts:
+                    continue
+                docs, tfs, lengths = self._merge(parts, deleted)
+                if not len(docs):
+                    continue
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                if allowed is not None:
+                    in_scope = np.isin(docs, allowed)
+                    docs, tfs, lengths = docs[in_scope], tfs[in_scope], lengths[in_scope]
+                    if not len(docs):
+                        continue
+                tf = tfs.astype(np.float64)
+                doc_parts.append(docs)
+                score_parts.append(
+                    idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * lengths / avg_length))
+                )
+
+            if not doc_parts:
+                return []
+
+            docs, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+            n = min(n_results, len(docs))
+            top = np.argpartition(-scores, n - 1)[:n]
+            top = top[np.argsort(-scores[top], kind='stable')]
+
+            top_docs = [int(docs[i]) for i in top]
+            placeholders = ",".join("?" * len(top_docs))
+            chunk_ids = dict(self.conn.execute(
+                f"SELECT doc, chunk_id FROM docs WHERE doc IN ({placeholders})", top_docs
+            ).fetchall())
+
+        return [(chunk_ids[doc], float(scores[i])) for doc, i in zip(top_docs, top)]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,108 @@
+import json
+import os
+import hashlib
+from typing import Dict, List, Tuple
+from pathlib import Path
+
+from src.core.config import RAW_DATA_PATH, INGEST_MANIFEST_PATH
+
+class IngestionManifest:
+    """
+    Манифест индексации: для каждого проиндексированного PDF хранит хеш содержимого,
+    mtime, размер и идентификаторы его чанков в ChromaDB.
+    Позволяет обрабатывать только новые/измененные файлы и удалять чанки удаленных.
+    """
+    def __init__(self, path: Path = INGEST_MANIFEST_PATH):
+        self.path = path
+        self.files: Dict[str, dict] = {}
+
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.files = json.load(f).get('files', {})
+            except Exception as e:
+                print(f"Ошибка чтения манифеста {self.path}: {e}. Будет выполнена полная индексация.")
+                self.files = {}
+
+    def save(self):
+        """
+        Атомарно сохраняет манифест на диск (через временный файл).
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'files': self.files}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def file_hash(file_path: Path) -> str:
+        """
+        Считает SHA-256 содержимого файла, читая его блоками.
+        """
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def diff(self, data_path: Path, base_path: Path = RAW_DATA_PATH) -> Tuple[Dict[str, dict], List[str]]:
+        """
+        Сравнивает PDF-файлы в data_path с манифестом.
+        Хеш пересчитывается только для файлов, у которых изменились mtime или размер.
+
+        Аргументы:
+            data_path: Папка, которую нужно проиндексировать (data/raw или ее подпапка).
+            base_path: Папка, относительно которой считаются пути 'source'.
+
+        Возвращает:
+            Tuple: (новые/измененные файлы {source: запись манифеста без chunk_ids},
+                    список source удаленных файлов).
+        """
+        changed: Dict[str, dict] = {}
+        seen = set()
+
+        for file_path in sorted(data_path.rglob("*.pdf")):
+            source = str(file_path.relative_to(base_path))
+            seen.add(source)
+            stat = file_path.stat()
+            entry = self.files.get(source)
+
+            if entry and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                continue
+
+            sha256 = self.file_hash(file_path)
+            if entry and entry['sha256'] == sha256:
+                # Файл "тронут", но содержимое то же - обновляем только mtime
+                entry['mtime'] = stat.st_mtime_ns
+                continue
+
+            changed[source] = {'sha256': sha256, 'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+
+        # Удаленными считаются только файлы из проверяемой папки
+        prefix = data_path.relative_to(base_path)
+        removed = [
+            source for source in self.files
+            if source not in seen and (prefix == Path('.') or prefix in Path(source).parents)
+        ]
+        return changed, removed
+
+    def chunk_ids(self, sources: List[str]) -> List[str]:
+        """
+        Возвращает идентификаторы чанков, записанных в манифест для указанных файлов.
+        """
+        ids: List[str] = []
+        for source in sources:
+            ids.extend(self.files.get(source, {}).get('chunk_ids', []))
+        return ids
+
+    def update(self, source: str, entry: dict, chunk_ids: List[str]):
+        """
+        Записывает (или перезаписывает) файл в манифест вместе с его чанками.
+        """
+        self.files[source] = {**entry, 'chunk_ids': chunk_ids}
+
+    def remove(self, source: str):
+        """
+        Удаляет файл из манифеста.
+        """
+        self.files.pop(source, None)
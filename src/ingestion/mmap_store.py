@@ -0,0 +1,228 @@
+import json
+import mmap
+import os
+import shutil
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from pathlib import Path
+
+import numpy as np
+from langchain.schema.document import Document
+
+from src.core.config import MMAP_STORE_PATH, MMAP_SEARCH_BLOCK_ROWS
+
+# Результат поиска по одному запросу: (номера строк, косинусные дистанции как в ChromaDB)
+RowResult = Tuple[np.ndarray, np.ndarray]
+
+class MmapVectorStore:
+    """
+    Точный векторный поиск полным перебором по выгрузке коллекции ChromaDB
+    (источник истины остается там). Для корпуса в сотни тысяч чанков одно
+    матричное умножение по нормализованной fp32-матрице быстрее запроса
+    через HNSW и слои ChromaDB и дает точный recall.
+
+    Файлы в path:
+    - vectors.npy: нормализованные векторы (n x dim, float32), открываются через
+      np.load(mmap_mode='r') - поиск читает страницы файла без копирования в память процесса;
+    - records.bin + offsets.npy: таблица записей - для строки i в records.bin по смещениям
+      offsets[i]:offsets[i + 1] лежит JSON [id, текст, метаданные];
+    - products.npy: номер продукта строки (для фильтра), meta.json: версия индекса и размеры.
+    """
+    def __init__(self, path: Path = MMAP_STORE_PATH, block_rows: int = MMAP_SEARCH_BLOCK_ROWS):
+        self.path = path
+        self.block_rows = block_rows
+        self.meta: Optional[dict] = None
+        self._records: Optional[mmap.mmap] = None
+
+    def build(self, batches: Iterator[Dict], count: int, index_version: str) -> dict:
+        """
+        Выгружает коллекцию по пачкам collection.get (ids, embeddings, documents, metadatas)
+        и атомарно заменяет предыдущую выгрузку.
+
+        Аргументы:
+            batches: Пачки коллекции, например
+                     VectorStoreManager.iter_collection(include=('embeddings', 'documents', 'metadatas')).
+            count: Размер коллекции (для выделения файла векторов заранее).
+            index_version: Версия индекса ChromaDB, с которой сделана выгрузка.
+
+        Возвращает:
+            dict: Метаданные выгрузки (meta.json).
+        """
+        start = time.perf_counter()
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+
+        vectors = None
+        offsets = [0]
+        product_names: List[str] = []
+        with open(tmp_path / "records.bin", 'wb') as records:
+            for batch in batches:
+                embeddings = np.asarray(batch['embeddings'], dtype=np.float32)
+                if vectors is None:
+                    vectors = np.lib.format.open_memmap(tmp_path / "vectors.npy", mode='w+', dtype=np.float32,
+                                                        shape=(count, embeddings.shape[1]))
+                row = len(offsets) - 1
+                norms = np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+                vectors[row:row + len(embeddings)] = embeddings / norms
+
+                for chunk_id, text, meta in zip(batch['ids'], batch['documents'], batch['metadatas']):
+                    meta = meta or {}
+                    record = json.dumps([chunk_id, text, meta], ensure_ascii=False).encode('utf-8')
+                    records.write(record)
+                    offsets.append(offsets[-1] + len(record))
+                    product_names.append(meta.get('product', ''))
+
+        n = len(offsets) - 1
+        if vectors is None or n == 0:
+            shutil.rmtree(tmp_path)
+            raise ValueError("Коллекция пуста - выгружать нечего.")
+        dim = vectors.shape[1]
+        vectors.flush()
+        del vectors
+        if n < count:
+            # Коллекция уменьшилась во время выгрузки - обрезаем файл до фактического числа строк
+            trimmed = np.load(tmp_path / "vectors.npy", mmap_mode='r')[:n]
+            np.save(tmp_path / "vectors.trim.npy", trimmed)
+            del trimmed
+            os.replace(tmp_path / "vectors.trim.npy", tmp_path / "vectors.npy")
+
+        products = sorted(set(product_names))
+        np.save(tmp_path / "offsets.npy", np.array(offsets, dtype=np.int64))
+        np.save(tmp_path / "products.npy", np.array([products.index(p) for p in product_names], dtype=np.int16))
+        meta = {'index_version': index_version, 'count': n, 'dim': dim, 'products': products}
+        with open(tmp_path / "meta.json", 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        self.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(tmp_path, self.path)
+        print(f"Выгрузка для поиска перебором готова: {n} векторов, {time.perf_counter() - start:.1f} с.")
+        return meta
+
+    def open(self) -> bool:
+        """
+        Открывает выгрузку: векторы и таблица записей отображаются в память (mmap),
+        в память процесса читаются только смещения и номера продуктов.
+        Возвращает False, если выгрузки еще нет.
+        """
+        if not (self.path / "meta.json").exists():
+            return False
+        self.close()
+        with open(self.path / "meta.json", 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.vectors = np.load(self.path / "vectors.npy", mmap_mode='r')
+        self.offsets = np.load(self.path / "offsets.npy")
+        self.product_codes = np.load(self.path / "products.npy")
+        with open(self.path / "records.bin", 'rb') as f:
+            self._records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return True
+
+    def close(self):
+        if self._records is not None:
+            self._records.close()
+            self._records = None
+
+    def is_fresh(self, index_version: str) -> bool:
+        """
+        Выгрузка открыта и сделана из текущей версии коллекции.
+        """
+        return self.meta is not None and self.meta['index_version'] == index_version
+
+    def stored_version(self) -> Optional[str]:
+        """
+        Версия индекса выгрузки, лежащей на диске (она может быть новее открытой,
+        если выгрузку перестроила индексация в другом процессе); None - выгрузки нет.
+        """
+        try:
+            with open(self.path / "meta.json", 'r', encoding='utf-8') as f:
+                return json.load(f)['index_version']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def reopen(self) -> Optional['MmapVectorStore']:
+        """
+        Новый экземпляр с теми же настройками, открытый на текущих файлах (None - выгрузки нет).
+        Текущий экземпляр не закрывается: по его отображениям могут дочитывать другие потоки.
+        """
+        store = MmapVectorStore(self.path, self.block_rows)
+        return store if store.open() else None
+
+    def search_rows(self, query_embeddings: Sequence[Sequence[float]], n_results: int,
+                    products: Optional[List[str]] = None) -> List[RowResult]:
+        """
+        Точный поиск n_results ближайших строк сразу для всех запросов: матрица
+        перебирается блоками по block_rows строк, на каждом блоке одно умножение
+        (запросы x блок) и argpartition; лучшие кандидаты блоков объединяются в конце.
+
+        Аргументы:
+            query_embeddings: Векторы запросов (батч).
+            n_results: Сколько строк вернуть на запрос.
+            products: Искать только среди чанков этих продуктов (None или [] - везде).
+
+        Возвращает:
+            List[RowResult]: Для каждого запроса (номера строк, дистанции 1 - cos) по возрастанию дистанции.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        allowed = None
+        if products:
+            allowed = np.array([i for i, p in enumerate(self.meta['products']) if p in products], dtype=np.int16)
+            if len(allowed) == 0:
+                return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+
+        best_rows, best_scores = [], []
+        for start in range(0, len(self.vectors), self.block_rows):
+            scores = queries @ self.vectors[start:start + self.block_rows].T
+            if allowed is not None:
+                scores[:, ~np.isin(self.product_codes[start:start + self.block_rows], allowed)] = -np.inf
+            k = min(n_results, scores.shape[1])
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_rows.append(top + start)
+            best_scores.append(np.take_along_axis(scores, top, axis=1))
+
+        rows = np.concatenate(best_rows, axis=1)
+        scores = np.concatenate(best_scores, axis=1)
+        order = np.argsort(-scores, axis=1, kind='stable')[:, :n_results]
+        results: List[RowResult] = []
+        for query_rows, query_scores in zip(np.take_along_axis(rows, order, axis=1),
+                                            np.take_along_axis(scores, order, axis=1)):
+            found = np.isfinite(query_scores)
+            results.append((query_rows[found], 1.0 - query_scores[found]))
+        return results
+
+    def record(self, row: int) -> Tuple[str, str, dict]:
+        """
+        Запись строки из таблицы: (id чанка, текст, метаданные).
+        """
+        chunk_id, text, meta = json.loads(self._records[self.offsets[row]:self.offsets[row + 1]])
+        return chunk_id, text, meta
+
+    def documents(self, rows: np.ndarray, distances: np.ndarray) -> List[Document]:
+        """
+        Document для найденных строк; в метаданные добавляются id чанка и дистанция.
+        """
+        documents = []
+        for row, dist in zip(rows.tolist(), distances.tolist()):
+            chunk_id, text, meta = self.record(row)
+            meta['id'] = chunk_id
+            meta['distance'] = dist
+            documents.append(Document(page_content=text, metadata=meta))
+        return documents
+
+    def search(self, query_embeddings: Sequence[Sequence[float]], n_results: int,
+               products: Optional[List[str]] = None) -> List[List[Document]]:
+        """
+        Батчевый поиск: для каждого запроса - найденные чанки по возрастанию дистанции.
+        """
+        return [self.documents(rows, distances)
+                for rows, distances in self.search_rows(query_embeddings, n_results, products)]
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """
+        Размеры файлов в байтах: векторы и таблица записей (смещения + JSON).
+        """
+        return {
+            'vectors': (self.path / "vectors.npy").stat().st_size,
+            'records': (self.path / "records.bin").stat().st_size + (self.path / "offsets.npy").stat().st_size,
+        }
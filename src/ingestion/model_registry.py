@@ -0,0 +1,78 @@
+import threading
+from typing import Dict, Tuple
+
+import torch
+from sentence_transformers import CrossEncoder, SentenceTransformer
+from transformers import AutoTokenizer, PreTrainedTokenizerBase
+
+from src.core.config import (
+    EMBEDDING_MODEL_NAME, DEVICE, EMBEDDING_BACKEND, EMBEDDING_ONNX_FILE_NAME, RERANKER_MODEL_NAME,
+    LLM_TOKENIZER_NAME
+)
+
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx")
+
+# Реестр моделей процесса: одна копия модели на (имя модели, устройство, бэкенд)
+_models: Dict[Tuple[str, str, str], SentenceTransformer] = {}
+_cross_encoders: Dict[Tuple[str, str], CrossEncoder] = {}
+_tokenizers: Dict[str, PreTrainedTokenizerBase] = {}
+_lock = threading.Lock()
+
+def get_embedding_model(model_name: str = EMBEDDING_MODEL_NAME, device: str = DEVICE,
+                        backend: str = EMBEDDING_BACKEND) -> SentenceTransformer:
+    """
+    Возвращает модель эмбеддингов, общую для всего процесса.
+    Модель загружается при первом обращении; Embedder, VectorStoreManager и
+    Retriever получают один и тот же объект вместо собственных копий.
+    """
+    key = (model_name, device, backend)
+    with _lock:
+        if key not in _models:
+            print(f"Загрузка модели эмбеддингов {model_name} ({device}, бэкенд {backend})")
+            _models[key] = _load_model(model_name, device, backend)
+        return _models[key]
+
+def get_cross_encoder(model_name: str = RERANKER_MODEL_NAME, device: str = DEVICE) -> CrossEncoder:
+    """
+    Возвращает кросс-энкодер для переранжирования, общий для всего процесса.
+    """
+    key = (model_name, device)
+    with _lock:
+        if key not in _cross_encoders:
+            print(f"Загрузка модели переранжирования {model_name} ({device})")
+            _cross_encoders[key] = CrossEncoder(model_name, device=device)
+        return _cross_encoders[key]
+
+def get_tokenizer(model_name: str = LLM_TOKENIZER_NAME) -> PreTrainedTokenizerBase:
+    """
+    Возвращает токенизатор (например, LLM для подсчета токенов промпта), общий для всего процесса.
+    """
+    with _lock:
+        if model_name not in _tokenizers:
+            print(f"Загрузка токенизатора {model_name}")
+            _tokenizers[model_name] = AutoTokenizer.from_pretrained(model_name)
+        return _tokenizers[model_name]
+
+def unload_embedding_model(model_name: str = EMBEDDING_MODEL_NAME, device: str = DEVICE,
+                           backend: str = EMBEDDING_BACKEND):
+    """
+    Убирает модель из реестра (память освободится, когда на нее не останется ссылок).
+    """
+    with _lock:
+        _models.pop((model_name, device, backend), None)
+
+def _load_model(model_name: str, device: str, backend: str) -> SentenceTransformer:
+    if backend == "torch":
+        return SentenceTransformer(model_name, device=device)
+
+    if backend == "torch-int8":
+        # Динамическая квантизация поддерживается только на CPU
+        model = SentenceTransformer(model_name, device="cpu")
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return model
+
+    if backend == "onnx":
+        model_kwargs = {"file_name": EMBEDDING_ONNX_FILE_NAME} if EMBEDDING_ONNX_FILE_NAME else None
+        return SentenceTransformer(model_name, device=device, backend="onnx", model_kwargs=model_kwargs)
+
+    raise ValueError(f"Неизвестный бэкенд эмбеддингов: {backend}. Допустимые: {', '.join(EMBEDDING_BACKENDS)}")
@@ -0,0 +1,121 @@
+import argparse
+import json
+import random
+import time
+from typing import Callable, Dict, List
+
+from langchain.schema.document import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from src.ingestion.text_splitter import TextSplitter
+from src.core.config import RAW_DATA_PATH, SEPARATORS, EMBEDDING_MODEL_NAME
+
+def make_pages(n_pages: int, seed: int = 0) -> List[Document]:
+    """
+    Синтетические страницы, похожие на текст из pypdf: строки по ~80 символов,
+    абзацы, строки таблиц без переносов, длинные "слова" (URL, хеши), лишние пробелы.
+    """
+    rng = random.Random(seed)
+    vocabulary = [f"слово{i}" for i in range(3000)] + ["zVirt", "Nova", "—", "1.", "2.", "(см. рис. 3)"]
+    pages = []
+    for i in range(n_pages):
+        paragraphs = []
+        for _ in range(rng.randint(1, 8)):
+            kind = rng.random()
+            if kind < 0.1:
+                # строка таблицы/кода без переносов, длиннее чанка
+                paragraphs.append("  ".join(rng.choice(vocabulary) for _ in range(rng.randint(100, 300))))
+            elif kind < 0.15:
+                paragraphs.append("https://docs.example/" + "x" * rng.randint(500, 2500))
+            else:
+                lines = [" ".join(rng.choice(vocabulary) for _ in range(rng.randint(3, 12)))
+                         for _ in range(rng.randint(1, 25))]
+                paragraphs.append("\n".join(lines))
+        text = (" " if rng.random() < 0.2 else "") + "\n\n".join(paragraphs) + ("\n" if rng.random() < 0.2 else "")
+        pages.append(Document(page_content=text, metadata={'source': f"nova/doc_{i // 40}.pdf",
+                                                           'filename': f"doc_{i // 40}.pdf",
+                                                           'page': i % 40 + 1, 'product': "nova"}))
+    return pages
+
+def load_pages(max_files: int) -> List[Document]:
+    """
+    Страницы первых max_files PDF из data/raw.
+    """
+    files = sorted(RAW_DATA_PATH.rglob("*.pdf"))[:max_files]
+    return TextSplitter(use_native=False).load_documents(RAW_DATA_PATH, files=files)
+
+def _best_time(split: Callable[[], List[Document]], repeats: int) -> tuple:
+    best, chunks = float('inf'), []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        chunks = split()
+        best = min(best, time.perf_counter() - start)
+    return best, chunks
+
+def run_benchmark(pages: List[Document], repeats: int = 3, tokens: bool = False) -> Dict[str, dict]:
+    """
+    Сравнивает RecursiveCharacterTextSplitter (текущее разбиение) с RecursiveChunker
+    на одних и тех же страницах: время (лучшее из repeats) и совпадение чанков
+    (текст и метаданные) байт в байт.
+    tokens=True - размер в токенах; эталон - from_huggingface_tokenizer с тем же токенизатором.
+    """
+    if tokens:
+        from src.ingestion.model_registry import get_tokenizer
+        native = TextSplitter(length_unit="tokens")
+        reference = RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+            get_tokenizer(EMBEDDING_MODEL_NAME), chunk_size=native.chunker.chunk_size,
+            chunk_overlap=native.chunker.chunk_overlap, separators=SEPARATORS,
+        )
+    else:
+        native = TextSplitter(use_native=True)
+        reference = TextSplitter(use_native=False).splitter
+
+    n_chars = sum(len(page.page_content) for page in pages)
+    results: Dict[str, dict] = {}
+    for name, split in (('langchain', lambda: reference.split_documents(pages)),
+                        ('native', lambda: native.split_documents(pages)),
+                        ('native_spans', lambda: native.chunker.split_pages([p.page_content for p in pages]))):
+        seconds, chunks = _best_time(split, repeats)
+        results[name] = {
+            'seconds': seconds,
+            'pages_per_s': len(pages) / seconds,
+            'mb_per_s': n_chars / seconds / 2**20,
+            'chunks': len(chunks),
+            'chunks_per_s': len(chunks) / seconds,
+        }
+        if name == 'langchain':
+            expected = [(c.page_content, c.metadata) for c in chunks]
+        elif name == 'native':
+            actual = [(c.page_content, c.metadata) for c in chunks]
+
+    identical = actual == expected
+    mismatch = next((i for i, (a, b) in enumerate(zip(actual, expected)) if a != b), min(len(actual), len(expected)))
+    results['check'] = {'identical': identical, 'first_mismatch': None if identical else mismatch,
+                        'pages': len(pages), 'chars': n_chars}
+
+    print(f"\nСтраниц: {len(pages)}, символов: {n_chars}, единица размера: {'токены' if tokens else 'символы'}")
+    print(f"{'Вариант':<14} {'время, с':>9} {'стр/с':>9} {'МБ/с':>7} {'чанков':>8} {'чанков/с':>10}")
+    for name in ('langchain', 'native', 'native_spans'):
+        r = results[name]
+        print(f"{name:<14} {r['seconds']:>9.3f} {r['pages_per_s']:>9.0f} {r['mb_per_s']:>7.2f} "
+              f"{r['chunks']:>8} {r['chunks_per_s']:>10.0f}")
+    print(f"Ускорение: {results['langchain']['seconds'] / results['native']['seconds']:.2f}x, "
+          f"чанки совпадают: {'да' if identical else f'нет (первое расхождение - чанк {mismatch})'}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Скорость и совпадение чанков: LangChain vs RecursiveChunker")
+    parser.add_argument("--pages", type=int, default=5000, help="Синтетических страниц (если не задан --max-files)")
+    parser.add_argument("--max-files", type=int, default=None, help="Взять страницы первых N PDF из data/raw")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--tokens", action="store_true", help="Размер чанка в токенах модели эмбеддингов")
+    parser.add_argument("--output", default=None, help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    pages = load_pages(args.max_files) if args.max_files else make_pages(args.pages)
+    results = run_benchmark(pages, args.repeats, args.tokens)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+# запуск: python -m src.ingestion.splitter_bench --pages 5000
@@ -1,77 +1,220 @@
 # ПОКА ЧТО ИГНОРИРУЕМ ФОТО
 # Вариант для улучшения: PyMuPDF
-from typing import List
+from typing import Deque, Iterator, List, Optional, Tuple
 from pathlib import Path
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 import pypdf
 import os
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain.schema.document import Document
 
+from src.ingestion.chunker import RecursiveChunker
 from src.core.config import (
-    RAW_DATA_PATH, CHUNK_SIZE, CHUNK_OVERLAP, SEPARATORS
+    RAW_DATA_PATH, CHUNK_SIZE, CHUNK_OVERLAP, SEPARATORS,
+    PDF_EXTRACTION_WORKERS, PDF_PAGES_PER_TASK,
+    NATIVE_SPLITTER_ENABLED, CHUNK_LENGTH_UNIT, CHUNK_SIZE_TOKENS, CHUNK_OVERLAP_TOKENS
 )
 
+
+def _count_pages(file_path: Path) -> int:
+    """
+    Возвращает количество страниц в PDF-файле (0, если файл не читается).
+    Выполняется в дочернем процессе пула.
+    """
+    try:
+        return len(pypdf.PdfReader(file_path).pages)
+    except Exception as e:
+        print(f"Ошибка при загрузке файла {file_path}: {e}")
+        return 0
+
+
+def get_product(source: str) -> str:
+    """
+    Продукт чанка - папка верхнего уровня в 'raw' (как в folder_structure.json).
+    Для файлов в корне 'raw' - пустая строка.
+    """
+    parts = Path(source).parts
+    return parts[0] if len(parts) > 1 else ""
+
+def _extract_pages(file_path: Path, start: int = 0, end: Optional[int] = None) -> List[Tuple[int, str]]:
+    """
+    Извлекает текст страниц [start, end) одного PDF-файла.
+    Выполняется в дочернем процессе пула, поэтому возвращает только
+    пары (индекс страницы, текст), а не объекты Document.
+    """
+    pages: List[Tuple[int, str]] = []
+    try:
+        reader = pypdf.PdfReader(file_path)
+        end = len(reader.pages) if end is None else end
+
+        for i in range(start, end):
+            page_content = reader.pages[i].extract_text()
+            if page_content:
+                pages.append((i, page_content))
+
+    except Exception as e:
+        print(f"Ошибка при загрузке файла {file_path}: {e}")
+
+    return pages
+
+
 class TextSplitter:
     """
     Класс для загрузки PDF-документов с помощью pypdf и разбиения их на чанки.
+    Разбиение по умолчанию выполняет RecursiveChunker (те же чанки, что у
+    RecursiveCharacterTextSplitter, но на смещениях); use_native=False - LangChain.
     """
-    def __init__(self, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+    def __init__(self, chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None,
+                 use_native: bool = NATIVE_SPLITTER_ENABLED, length_unit: str = CHUNK_LENGTH_UNIT):
         """
         Инициализирует сплиттер с заданными параметрами.
+        Размер и перекрытие по умолчанию - CHUNK_SIZE/CHUNK_OVERLAP в символах
+        или CHUNK_SIZE_TOKENS/CHUNK_OVERLAP_TOKENS в токенах (length_unit="tokens").
         """
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            separators=SEPARATORS,
-            length_function=len,
-            is_separator_regex=False,
-        )
-        print(f"TextSplitter инициализирован: размер чанка={chunk_size}, перекрытие={chunk_overlap}")
-
-    def load_documents(self, data_path: Path = RAW_DATA_PATH) -> List[Document]:
+        if length_unit == "tokens":
+            chunk_size = chunk_size or CHUNK_SIZE_TOKENS
+            chunk_overlap = CHUNK_OVERLAP_TOKENS if chunk_overlap is None else chunk_overlap
+        else:
+            chunk_size = chunk_size or CHUNK_SIZE
+            chunk_overlap = CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+
+        self.chunker: Optional[RecursiveChunker] = None
+        self.splitter: Optional[RecursiveCharacterTextSplitter] = None
+        if use_native or length_unit == "tokens":
+            self.chunker = RecursiveChunker(chunk_size, chunk_overlap, SEPARATORS, length_unit)
+        else:
+            self.splitter = RecursiveCharacterTextSplitter(
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                separators=SEPARATORS,
+                length_function=len,
+                is_separator_regex=False,
+            )
+        unit = "токенов" if length_unit == "tokens" else "символов"
+        print(f"TextSplitter инициализирован: размер чанка={chunk_size}, перекрытие={chunk_overlap} ({unit})")
+
+    def load_documents(self, data_path: Path = RAW_DATA_PATH,
+                       num_workers: int = PDF_EXTRACTION_WORKERS,
+                       pages_per_task: int = PDF_PAGES_PER_TASK,
+                       files: Optional[List[Path]] = None,
+                       base_path: Optional[Path] = None) -> List[Document]:
         """
         Рекурсивно загружает все PDF-файлы из указанной папки, используя pypdf.
+        Обертка над iter_documents, собирающая все страницы в один список.
 
         Аргументы:
             data_path: Базовый путь, откуда начинать поиск PDF-файлов (data/raw).
+            num_workers: Количество процессов для извлечения текста.
+            pages_per_task: Количество страниц в одной задаче пула.
+            files: Явный список PDF-файлов (например, только измененные). По умолчанию - все PDF из data_path.
+            base_path: Папка, относительно которой записывается 'source'. По умолчанию - data_path.
 
         Возвращает:
             List[Document]: Список объектов LangChain Document, где каждый объект — это страница.
         """
         print(f"Начало загрузки документов из: {data_path}")
         all_documents: List[Document] = []
-        
-        # поиск всех PDF-файлов в подпапках
-        pdf_files = list(data_path.rglob("*.pdf"))
 
-        for file_path in pdf_files:
-            try:
-                reader = pypdf.PdfReader(file_path)
-                
-                # Извлекаем текст постранично
-                for i, page in enumerate(reader.pages):
-                    page_content = page.extract_text()
-                    
-                    if page_content:
-                        # Создаем объект Document для каждой страницы
-                        doc = Document(
-                            page_content=page_content,
-                            metadata={
-                                'source': str(file_path.relative_to(data_path)), # Путь относительно 'raw'
-                                'filename': file_path.name,
-                                'page': i + 1, # Номер страницы, начиная с 1
-                            }
-                        )
-                        all_documents.append(doc)
-                
-                # print(f"Обработан файл: {file_path.name} ({len(reader.pages)} страниц)")
-                
-            except Exception as e:
-                print(f"Ошибка при загрузке файла {file_path}: {e}")
+        for _, documents in self.iter_documents(data_path, num_workers, pages_per_task, files, base_path):
+            all_documents.extend(documents)
                 
         print(f"Всего загружено {len(all_documents)} страниц.")
         return all_documents
 
+    def iter_documents(self, data_path: Path = RAW_DATA_PATH,
+                       num_workers: int = PDF_EXTRACTION_WORKERS,
+                       pages_per_task: int = PDF_PAGES_PER_TASK,
+                       files: Optional[List[Path]] = None,
+                       base_path: Optional[Path] = None) -> Iterator[Tuple[Path, List[Document]]]:
+        """
+        Генератор: по одному PDF-файлу за раз возвращает его страницы.
+        При num_workers > 1 текст извлекается пулом процессов: каждый файл
+        делится на диапазоны по pages_per_task страниц, чтобы крупные
+        сводные PDF не тормозили весь пул. В работе одновременно не более
+        2 * num_workers диапазонов, поэтому при медленном потребителе
+        извлечение приостанавливается и память не растет.
+        Порядок файлов и страниц не зависит от числа процессов.
+
+        Аргументы: те же, что и у load_documents.
+
+        Возвращает:
+            Iterator[Tuple[Path, List[Document]]]: Пары (путь к файлу, страницы файла).
+            Файлы без текста возвращаются с пустым списком страниц.
+        """
+        base_path = base_path or data_path
+
+        # поиск всех PDF-файлов в подпапках (сортировка - для детерминированного порядка)
+        pdf_files = sorted(files if files is not None else data_path.rglob("*.pdf"))
+
+        if num_workers <= 1 or len(pdf_files) == 0:
+            for file_path in pdf_files:
+                pages = _extract_pages(file_path)
+                # print(f"Обработан файл: {file_path.name} ({len(pages)} страниц)")
+                yield file_path, self._make_documents(file_path, base_path, pages)
+            return
+
+        print(f"Извлечение текста в {num_workers} процессах")
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            page_counts = list(executor.map(_count_pages, pdf_files))
+
+            # Задачи вида (файл, начало, конец) по pages_per_task страниц.
+            # Для пустых/нечитаемых файлов - одна пустая задача, чтобы файл попал в результат.
+            tasks = (
+                (file_path, start, min(start + pages_per_task, n_pages))
+                for file_path, n_pages in zip(pdf_files, page_counts)
+                for start in (range(0, n_pages, pages_per_task) if n_pages else [0])
+            )
+
+            current_file: Optional[Path] = None
+            current_pages: List[Tuple[int, str]] = []
+            for file_path, pages in self._bounded_map(executor, tasks, max_in_flight=2 * num_workers):
+                if file_path != current_file:
+                    if current_file is not None:
+                        yield current_file, self._make_documents(current_file, base_path, current_pages)
+                    current_file, current_pages = file_path, []
+                current_pages.extend(pages)
+
+            if current_file is not None:
+                yield current_file, self._make_documents(current_file, base_path, current_pages)
+
+    @staticmethod
+    def _bounded_map(executor: ProcessPoolExecutor, tasks: Iterator[Tuple[Path, int, int]],
+                     max_in_flight: int) -> Iterator[Tuple[Path, List[Tuple[int, str]]]]:
+        """
+        Аналог executor.map для _extract_pages, который не отправляет все задачи
+        сразу, а держит в работе не более max_in_flight. Результаты - в порядке задач.
+        """
+        pending: Deque[Tuple[Path, Future]] = deque()
+        for file_path, start, end in tasks:
+            pending.append((file_path, executor.submit(_extract_pages, file_path, start, end)))
+            if len(pending) >= max_in_flight:
+                done_file, future = pending.popleft()
+                yield done_file, future.result()
+
+        while pending:
+            done_file, future = pending.popleft()
+            yield done_file, future.result()
+
+    @staticmethod
+    def _make_documents(file_path: Path, base_path: Path, pages: List[Tuple[int, str]]) -> List[Document]:
+        """
+        Создает объекты Document для извлеченных страниц одного файла.
+        """
+        source = str(file_path.relative_to(base_path))
+        return [
+            Document(
+                page_content=page_content,
+                metadata={
+                    'source': source, # Путь относительно 'raw'
+                    'filename': file_path.name,
+                    'page': i + 1, # Номер страницы, начиная с 1
+                    'product': get_product(source),
+                }
+            )
+            for i, page_content in pages
+        ]
+
     def split_documents(self, documents: List[Document]) -> List[Document]:
         """
         Разбивает список документов (страниц) на текстовые чанки.
@@ -85,7 +228,15 @@ class TextSplitter:
         print(f"Начало разбиения {len(documents)} страниц на чанки...")
         
         # Разбиение, сохраняющее метаданные страниц
-        chunks = self.splitter.split_documents(documents)
+        if self.chunker:
+            spans = self.chunker.split_pages([doc.page_content for doc in documents])
+            chunks = [
+                Document(page_content=documents[page].page_content[start:end],
+                         metadata=dict(documents[page].metadata))
+                for page, start, end in spans
+            ]
+        else:
+            chunks = self.splitter.split_documents(documents)
         
         print(f"Разбиение завершено. Создано {len(chunks)} чанков.")
         return chunks
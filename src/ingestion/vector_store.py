@@ -1,19 +1,29 @@
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from pathlib import Path
+import sqlite3
+import uuid
 import chromadb
 
 from langchain.schema.document import Document
 from chromadb.api.models.Collection import Collection
 
-from src.core.config import VECTOR_DB_PATH, BASE_DIR, COLLECTION_NAME
+from src.core.config import (VECTOR_DB_PATH, BASE_DIR, COLLECTION_NAME, INDEX_VERSION_PATH,
+                             ANSWER_CACHE_ENABLED, ANSWER_CACHE_PATH, ANSWER_CACHE_LINKS_TABLE,
+                             COMPACT_STORE_DTYPE, VECTOR_BACKEND)
 from src.ingestion.embedder import Embedder
-from src.ingestion.text_splitter import TextSplitter
+from src.ingestion.lexical_index import LexicalIndex
+from src.ingestion.chunk_links import ChunkLinks
+from src.ingestion.compact_store import CompactVectorStore
+from src.ingestion.mmap_store import MmapVectorStore
+from src.ingestion.text_splitter import TextSplitter, get_product
 from src.ingestion.downloader import DataLoader
 
 class VectorStoreManager:
-    def __init__(self, db_path: Path = VECTOR_DB_PATH):
+    def __init__(self, db_path: Path = VECTOR_DB_PATH, embedder: Optional[Embedder] = None):
         """
-        Инициализирует Chroma DB
+        Инициализирует Chroma DB.
+        Эмбеддер создается только при первой индексации, поэтому чтение
+        коллекции не требует загрузки модели эмбеддингов.
         """
         self.db_path = db_path
         self.db_path.mkdir(parents=True, exist_ok=True)
@@ -21,18 +31,56 @@ class VectorStoreManager:
         print(f"Инициализация ChromaDB клиент, путь: {self.db_path}")
 
         self.client = chromadb.PersistentClient(path=str(self.db_path))
-        self.embedder = Embedder()
-        self.embedding_dimension = self.embedder.get_embedding_dimension()
+        self._embedder = embedder
+        self._lexical_index: Optional[LexicalIndex] = None
+        self._answer_links: Optional[ChunkLinks] = None
         self.collection = COLLECTION_NAME
+        self._collection: Optional[Collection] = None
+
+    @property
+    def embedder(self) -> Embedder:
+        if self._embedder is None:
+            self._embedder = Embedder()
+        return self._embedder
+
+    @property
+    def lexical_index(self) -> LexicalIndex:
+        """
+        BM25-индекс, синхронизируемый с коллекцией при каждой записи и удалении.
+        """
+        if self._lexical_index is None:
+            self._lexical_index = LexicalIndex()
+        return self._lexical_index
+
+    @property
+    def answer_links(self) -> Optional[ChunkLinks]:
+        """
+        Связи ответов кэша LLM с чанками: при переиндексации чанков связи снимаются,
+        и кэш ответов больше не отдает построенные на них ответы
+        (None, если кэш отключен или еще не создан).
+        """
+        if self._answer_links is None and ANSWER_CACHE_ENABLED and ANSWER_CACHE_PATH.exists():
+            self._answer_links = ChunkLinks(sqlite3.connect(str(ANSWER_CACHE_PATH)), ANSWER_CACHE_LINKS_TABLE)
+        return self._answer_links
+
+    def _invalidate_answers(self, ids: List[str]):
+        if self.answer_links:
+            with self.answer_links.conn:
+                n_answers = len(self.answer_links.unlink_chunks(ids))
+            if n_answers:
+                print(f"В кэше ответов устарело {n_answers} ответов по измененным чанкам.")
+
+    @property
+    def embedding_dimension(self) -> int:
+        return self.embedder.get_embedding_dimension()
 
     def get_or_create_collection(self) -> Optional[Collection]:
         """
-        Получает существующую коллекцию или создает новую, 
-        используя размерность векторов.
+        Получает существующую коллекцию или создает новую.
         """
-        if self.embedding_dimension == 0:
-            print("Ошибка: Размерность эмбеддингов равна нулю. Невозможно создать коллекцию.")
-            return None
+        # Коллекция запрашивается один раз: при потоковой индексации метод вызывается на каждый батч
+        if self._collection is not None:
+            return self._collection
 
         print(f"Получение/создание коллекции '{COLLECTION_NAME}'.")
         
@@ -43,14 +91,60 @@ class VectorStoreManager:
         
         current_count = collection.count()
         print(f"Коллекция '{COLLECTION_NAME}' готова. Текущее количество документов: {current_count}")
+        self._collection = collection
         return collection
 
-    def index_documents(self, chunks: List[Document]) -> bool:
+    @staticmethod
+    def get_index_version(path: Path = INDEX_VERSION_PATH) -> str:
         """
-        Генерирует эмбеддинги для чанков и добавляет их в ChromaDB.
+        Возвращает текущую версию индекса (пустая строка, если индекс еще не менялся).
+        Версия меняется при каждой записи или удалении чанков, по ней
+        кэши поиска понимают, что коллекция изменилась.
+        """
+        try:
+            return path.read_text(encoding='utf-8')
+        except FileNotFoundError:
+            return ""
+
+    @staticmethod
+    def _bump_index_version(path: Path = INDEX_VERSION_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_text(uuid.uuid4().hex, encoding='utf-8')
+        tmp_path.replace(path)
+
+    def _max_batch_size(self) -> int:
+        """
+        Максимальное число записей в одном запросе к ChromaDB
+        (метод клиента называется по-разному в разных версиях chromadb).
+        """
+        if hasattr(self.client, 'get_max_batch_size'):
+            return self.client.get_max_batch_size()
+        return getattr(self.client, 'max_batch_size', 5000)
+
+    @staticmethod
+    def make_chunk_ids(chunks: List[Document]) -> List[str]:
+        """
+        Формирует стабильные идентификаторы чанков вида 'source:page:n',
+        где n - порядковый номер чанка на странице. Повторная индексация того же
+        файла дает те же id, поэтому запуски не перезаписывают чужие чанки.
+        """
+        ids = []
+        counters: Dict[Tuple[str, int], int] = {}
+        for chunk in chunks:
+            key = (chunk.metadata.get('source', ''), chunk.metadata.get('page', 0))
+            n = counters.get(key, 0)
+            counters[key] = n + 1
+            ids.append(f"{key[0]}:{key[1]}:{n}")
+        return ids
+
+    def index_documents(self, chunks: List[Document], ids: Optional[List[str]] = None) -> bool:
+        """
+        Генерирует эмбеддинги для чанков и добавляет (upsert) их в ChromaDB.
         
         Аргументы:
             chunks: Список объектов LangChain Document (текстовые чанки).
+            ids: Идентификаторы чанков. По умолчанию - make_chunk_ids(chunks).
             
         Возвращает:
             bool: True, если индексация прошла успешно.
@@ -63,6 +157,10 @@ class VectorStoreManager:
             print("Список чанков пуст. Индексация отменена.")
             return False
 
+        if self.embedding_dimension == 0:
+            print("Ошибка: Размерность эмбеддингов равна нулю. Невозможно проиндексировать чанки.")
+            return False
+
         # Генерация эмбеддингов
         embeddings_list = self.embedder.embed_documents(chunks)
 
@@ -71,19 +169,26 @@ class VectorStoreManager:
             return False
 
         # Подготовка данных для ChromaDB
-        ids = [f"doc_{i}" for i in range(len(chunks))]
+        ids = ids or self.make_chunk_ids(chunks)
         documents = [chunk.page_content for chunk in chunks]
         metadatas = [chunk.metadata for chunk in chunks]
 
-        # Добавление данных в коллекцию
+        # Добавление данных в коллекцию (частями, не больше лимита ChromaDB на запрос)
         print(f"Добавление {len(documents)} документов в ChromaDB.")
+        batch_size = self._max_batch_size()
         try:
-            collection.add(
-                embeddings=embeddings_list,
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
+            for start in range(0, len(ids), batch_size):
+                end = start + batch_size
+                collection.upsert(
+                    embeddings=embeddings_list[start:end],
+                    documents=documents[start:end],
+                    metadatas=metadatas[start:end],
+                    ids=ids[start:end]
+                )
+            self.lexical_index.add(ids, documents)
+            # Версия меняется до снятия связей ответов: AnswerCache.put сверяет ее под блокировкой записи
+            self._bump_index_version()
+            self._invalidate_answers(ids)
             print("Индексация завершена успешно.")
             print(f"Общее количество документов в коллекции: {collection.count()}")
             return True
@@ -92,6 +197,150 @@ class VectorStoreManager:
             print(f"Ошибка при добавлении в ChromaDB: {e}")
             return False
 
+    def delete_documents(self, ids: List[str]) -> bool:
+        """
+        Удаляет чанки с указанными идентификаторами из ChromaDB.
+        """
+        if not ids:
+            return True
+
+        collection = self.get_or_create_collection()
+        if not collection:
+            return False
+
+        print(f"Удаление {len(ids)} устаревших чанков из ChromaDB.")
+        batch_size = self._max_batch_size()
+        try:
+            for start in range(0, len(ids), batch_size):
+                collection.delete(ids=ids[start:start + batch_size])
+            self.lexical_index.delete(ids)
+            # Версия меняется до снятия связей ответов: AnswerCache.put сверяет ее под блокировкой записи
+            self._bump_index_version()
+            self._invalidate_answers(ids)
+            return True
+        except Exception as e:
+            print(f"Ошибка при удалении из ChromaDB: {e}")
+            return False
+
+    def iter_collection(self, batch_size: int = 1000,
+                        include: Tuple[str, ...] = ('documents', 'metadatas')) -> Iterator[Dict]:
+        """
+        Постранично читает всю коллекцию: результаты collection.get по batch_size записей.
+        """
+        collection = self.get_or_create_collection()
+        if not collection:
+            return
+
+        offset = 0
+        while True:
+            batch = collection.get(limit=batch_size, offset=offset, include=list(include))
+            if not batch['ids']:
+                return
+            yield batch
+            offset += len(batch['ids'])
+
+    def rebuild_lexical_index(self):
+        """
+        Пересобирает BM25-индекс по текущему содержимому коллекции
+        (например, для коллекции, проиндексированной до появления лексического индекса).
+        """
+        print("Пересборка лексического индекса по коллекции ChromaDB.")
+        self.lexical_index.rebuild(
+            (batch['ids'], batch['documents']) for batch in self.iter_collection(include=('documents',))
+        )
+        self._bump_index_version()
+        print(f"Лексический индекс готов: {self.lexical_index.count()} чанков.")
+
+    def build_compact_store(self, dtype: str = COMPACT_STORE_DTYPE) -> Optional[dict]:
+        """
+        Выгружает коллекцию в CompactVectorStore (float16/int8 + IVF) для VECTOR_BACKEND="compact".
+        Выгрузку нужно повторять после изменения коллекции: устаревшая выгрузка не используется.
+
+        Возвращает:
+            Optional[dict]: Метаданные хранилища или None, если коллекция недоступна или пуста.
+        """
+        collection = self.get_or_create_collection()
+        if not collection or collection.count() == 0:
+            print("Коллекция пуста - компактное хранилище не построено.")
+            return None
+        index_version = self.get_index_version()
+        return CompactVectorStore(dtype=dtype).build(
+            self.iter_collection(include=('embeddings', 'metadatas')), collection.count(), index_version
+        )
+
+    def build_mmap_store(self) -> Optional[dict]:
+        """
+        Выгружает коллекцию (векторы, тексты и метаданные) в MmapVectorStore для VECTOR_BACKEND="mmap".
+        Выгрузку нужно повторять после изменения коллекции: устаревшая выгрузка не используется.
+
+        Возвращает:
+            Optional[dict]: Метаданные выгрузки или None, если коллекция недоступна или пуста.
+        """
+        collection = self.get_or_create_collection()
+        if not collection or collection.count() == 0:
+            print("Коллекция пуста - выгрузка для поиска перебором не построена.")
+            return None
+        index_version = self.get_index_version()
+        return MmapVectorStore().build(
+            self.iter_collection(include=('embeddings', 'documents', 'metadatas')), collection.count(), index_version
+        )
+
+    def build_vector_export(self, backend: str = VECTOR_BACKEND) -> Optional[dict]:
+        """
+        Обновляет выгрузку коллекции для выбранного бэкенда поиска (для "chroma" ничего не делает).
+        """
+        if backend == "compact":
+            return self.build_compact_store()
+        if backend == "mmap":
+            return self.build_mmap_store()
+        return None
+
+    def delete_legacy_documents(self) -> bool:
+        """
+        Удаляет чанки со старыми идентификаторами 'doc_N', записанные
+        до появления манифеста индексации.
+        """
+        collection = self.get_or_create_collection()
+        if not collection:
+            return False
+
+        existing_ids = collection.get(include=[])['ids']
+        legacy_ids = [doc_id for doc_id in existing_ids if doc_id.startswith('doc_')]
+        return self.delete_documents(legacy_ids)
+
+    def backfill_product_metadata(self) -> int:
+        """
+        Добавляет поле 'product' чанкам, проиндексированным до его появления,
+        чтобы они не выпадали из поиска с фильтром по продукту.
+        Эмбеддинги не пересчитываются - обновляются только метаданные.
+
+        Возвращает:
+            int: Количество обновленных чанков.
+        """
+        collection = self.get_or_create_collection()
+        if not collection or collection.count() == 0:
+            return 0
+        # Поле заполняется для всей коллекции за один проход, поэтому достаточно проверить первый чанк
+        first = collection.get(limit=1, include=['metadatas'])['metadatas'][0]
+        if 'product' in first:
+            return 0
+
+        print("Добавление метаданных продукта в чанки коллекции.")
+        updates: List[Tuple[str, dict]] = []
+        for batch in self.iter_collection(include=('metadatas',)):
+            for chunk_id, meta in zip(batch['ids'], batch['metadatas']):
+                if 'product' not in meta:
+                    meta['product'] = get_product(meta.get('source', ''))
+                    updates.append((chunk_id, meta))
+
+        batch_size = self._max_batch_size()
+        for start in range(0, len(updates), batch_size):
+            ids, metadatas = zip(*updates[start:start + batch_size])
+            collection.update(ids=list(ids), metadatas=list(metadatas))
+        self._bump_index_version()
+        print(f"Обновлено чанков: {len(updates)}")
+        return len(updates)
+
 # if __name__ == "__main__":
 #     manager = VectorStoreManager()
 #     manager.index_documents(chunks)
\ No newline at end of file
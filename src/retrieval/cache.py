@@ -0,0 +1,193 @@
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema.document import Document
+
+from src.core.config import (
+    RETRIEVAL_CACHE_MAX_ENTRIES, RETRIEVAL_CACHE_TTL_SECONDS,
+    RETRIEVAL_CACHE_SEMANTIC_MAX_ENTRIES, RETRIEVAL_CACHE_SEMANTIC_THRESHOLD, CHUNK_CACHE_MAX_ENTRIES
+)
+
+class RetrievalCache:
+    """
+    Двухуровневый кэш результатов поиска:
+    1. LRU/TTL по нормализованному тексту запроса;
+    2. семантический: попадание, если косинусная близость эмбеддинга нового
+       запроса к одному из закэшированных не ниже semantic_threshold.
+    Кэш полностью сбрасывается, когда меняется версия индекса.
+    Параметр scope (например, k или фильтр по продукту) входит в ключ обоих уровней.
+    """
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = RETRIEVAL_CACHE_TTL_SECONDS,
+                 semantic_max_entries: int = RETRIEVAL_CACHE_SEMANTIC_MAX_ENTRIES,
+                 semantic_threshold: float = RETRIEVAL_CACHE_SEMANTIC_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.semantic_max_entries = semantic_max_entries
+        self.semantic_threshold = semantic_threshold
+
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._exact: "OrderedDict[Tuple[str, Hashable], Tuple[float, List[Document]]]" = OrderedDict()
+        # Семантический уровень - кольцевой буфер нормированных векторов
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: List[Optional[Tuple[float, Hashable, List[Document]]]] = [None] * semantic_max_entries
+        self._next_slot = 0
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """
+        Нормализует запрос: Unicode NFC, нижний регистр, схлопывание пробелов,
+        без завершающих знаков препинания.
+        """
+        return " ".join(unicodedata.normalize("NFC", query).lower().split()).rstrip("?!.")
+
+    def _check_version(self, version: str):
+        if version != self._version:
+            self._exact.clear()
+            self._vectors = None
+            self._entries = [None] * self.semantic_max_entries
+            self._next_slot = 0
+            self._version = version
+
+    def get(self, query: str, version: str, scope: Hashable = ()) -> Optional[List[Document]]:
+        """
+        Точный уровень: результат для того же нормализованного запроса.
+        """
+        key = (self.normalize(query), scope)
+        with self._lock:
+            self._check_version(version)
+            entry = self._exact.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._exact.pop(key, None)
+                return None
+            self._exact.move_to_end(key)
+            self.exact_hits += 1
+            return list(entry[1])
+
+    def get_semantic(self, query: str, embedding: List[float], version: str,
+                     scope: Hashable = ()) -> Optional[List[Document]]:
+        """
+        Семантический уровень: результат для самого близкого закэшированного запроса.
+        При попадании результат заодно кладется в точный уровень.
+        """
+        with self._lock:
+            self._check_version(version)
+            documents = self._lookup_vector(embedding, scope)
+            if documents is None:
+                self.misses += 1
+                return None
+            self.semantic_hits += 1
+            self._put_exact((self.normalize(query), scope), documents)
+            return list(documents)
+
+    def put(self, query: str, embedding: Optional[List[float]], documents: List[Document],
+            version: str, scope: Hashable = ()):
+        """
+        Сохраняет результат поиска на обоих уровнях.
+        """
+        with self._lock:
+            self._check_version(version)
+            self._put_exact((self.normalize(query), scope), documents)
+            if embedding is not None and self.semantic_max_entries > 0:
+                self._put_vector(embedding, scope, documents)
+
+    def _put_exact(self, key: Tuple[str, Hashable], documents: List[Document]):
+        self._exact[key] = (time.monotonic() + self.ttl, list(documents))
+        self._exact.move_to_end(key)
+        while len(self._exact) > self.max_entries:
+            self._exact.popitem(last=False)
+
+    @staticmethod
+    def _normalize_vector(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _put_vector(self, embedding: List[float], scope: Hashable, documents: List[Document]):
+        vector = self._normalize_vector(embedding)
+        if self._vectors is None:
+            self._vectors = np.zeros((self.semantic_max_entries, vector.shape[0]), dtype=np.float32)
+
+        slot = self._next_slot
+        self._vectors[slot] = vector
+        self._entries[slot] = (time.monotonic() + self.ttl, scope, list(documents))
+        self._next_slot = (slot + 1) % self.semantic_max_entries
+
+    def _lookup_vector(self, embedding: List[float], scope: Hashable) -> Optional[List[Document]]:
+        if self._vectors is None:
+            return None
+
+        similarities = self._vectors @ self._normalize_vector(embedding)
+        now = time.monotonic()
+        # Проверяем кандидатов от самого близкого, пока близость выше порога
+        for slot in np.argsort(-similarities):
+            if similarities[slot] < self.semantic_threshold:
+                break
+            entry = self._entries[slot]
+            if entry is not None and entry[0] >= now and entry[1] == scope:
+                return entry[2]
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'exact_hits': self.exact_hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'exact_entries': len(self._exact),
+                'semantic_entries': sum(1 for entry in self._entries if entry is not None),
+            }
+
+
+class ChunkCache:
+    """
+    LRU-кэш текстов и метаданных чанков по id в памяти ретривера.
+    Заполняется результатами векторного поиска, чтобы кандидатам BM25 и
+    переранжированию не требовалось повторно читать чанки из ChromaDB.
+    Сбрасывается при изменении версии индекса.
+    """
+    def __init__(self, max_entries: int = CHUNK_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._chunks: "OrderedDict[str, Tuple[str, dict]]" = OrderedDict()
+
+    def get_many(self, chunk_ids: List[str], version: str) -> Dict[str, Document]:
+        """
+        Возвращает найденные в кэше чанки (новые объекты Document - их метаданные можно менять).
+        """
+        found: Dict[str, Document] = {}
+        with self._lock:
+            if version != self._version:
+                self._chunks.clear()
+                self._version = version
+            for chunk_id in chunk_ids:
+                entry = self._chunks.get(chunk_id)
+                if entry is not None:
+                    self._chunks.move_to_end(chunk_id)
+                    found[chunk_id] = Document(page_content=entry[0], metadata=dict(entry[1]))
+        return found
+
+    def put_many(self, documents: List[Document], version: str):
+        """
+        Сохраняет чанки (id берется из metadata['id']).
+        """
+        with self._lock:
+            if version != self._version:
+                self._chunks.clear()
+                self._version = version
+            for doc in documents:
+                chunk_id = doc.metadata['id']
+                self._chunks[chunk_id] = (doc.page_content, dict(doc.metadata))
+                self._chunks.move_to_end(chunk_id)
+            while len(self._chunks) > self.max_entries:
+                self._chunks.popitem(last=False)
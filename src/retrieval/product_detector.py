@@ -0,0 +1,67 @@
+import json
+import re
+from pathlib import Path
+from typing import Dict, List
+
+from src.core.config import FOLDER_STRUCTURE_PATH
+
+# Дополнительные написания продуктов в запросах (ключ - папка в 'raw').
+# Название папки и его вариант с пробелами вместо дефисов добавляются автоматически.
+PRODUCT_ALIASES: Dict[str, List[str]] = {
+    "zvirt": ["z-virt", "звирт", "звирта", "звирте", "зевирт"],
+    "zvirt-dc-manager": ["zvirt dc manager", "dc manager", "dc-manager", "dcmanager"],
+    "zvirt-containers": ["zvirt containers", "звирт контейнеры"],
+    "zvirt-metrics": ["zvirt metrics", "звирт метрики"],
+    "nova": ["нова", "новы", "нове", "нову"],
+    "nova-se": ["nova se", "novase", "нова се", "нова se"],
+    "starvault": ["star vault", "старволт", "старвольт", "стар волт"],
+    "termit": ["термит", "термита", "термите", "термитом"],
+    "cloudlink": ["cloud link", "клаудлинк", "клауд линк"],
+}
+
+class ProductDetector:
+    """
+    Определяет по тексту запроса, о каких продуктах (папках верхнего уровня
+    из folder_structure.json) спрашивает пользователь.
+    """
+    def __init__(self, structure_path: Path = FOLDER_STRUCTURE_PATH):
+        self.products: List[str] = self._load_products(structure_path)
+
+        # Псевдоним -> продукт; длинные псевдонимы проверяются первыми,
+        # чтобы "nova se" не засчитывалось еще и как "nova"
+        aliases: Dict[str, str] = {}
+        for product in self.products:
+            for alias in [product, product.replace("-", " "), *PRODUCT_ALIASES.get(product, [])]:
+                aliases.setdefault(self.normalize(alias), product)
+        self._patterns = [
+            (re.compile(rf"(?<!\w){re.escape(alias)}(?!\w)"), product)
+            for alias, product in sorted(aliases.items(), key=lambda item: -len(item[0]))
+        ]
+
+    @staticmethod
+    def _load_products(structure_path: Path) -> List[str]:
+        if not structure_path.exists():
+            print(f"Файл {structure_path} не найден, определение продукта по запросу отключено.")
+            return []
+        with open(structure_path, "r", encoding="utf-8") as f:
+            return list(json.load(f).get("folders", {}))
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Нижний регистр, 'ё' -> 'е', дефисы и подчеркивания как пробелы.
+        """
+        text = text.lower().replace("ё", "е")
+        return " ".join(re.sub(r"[-_]", " ", text).split())
+
+    def detect(self, query: str) -> List[str]:
+        """
+        Возвращает продукты, упомянутые в запросе, в порядке папок (пустой список - продукт не указан).
+        """
+        text = self.normalize(query)
+        found = set()
+        for pattern, product in self._patterns:
+            text, n_matches = pattern.subn(" ", text)
+            if n_matches:
+                found.add(product)
+        return [product for product in self.products if product in found]
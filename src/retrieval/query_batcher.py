@@ -0,0 +1,121 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from src.ingestion.embedder import Embedder
+from src.core.config import QUERY_BATCH_MAX_SIZE, QUERY_BATCH_MAX_WAIT_MS
+
+class QueryEmbeddingBatcher:
+    """
+    Микробатчинг эмбеддингов запросов перед общей моделью.
+    Запросы, пришедшие почти одновременно, копятся до max_wait_ms миллисекунд
+    (или до max_batch_size штук) и векторизуются за один проход модели;
+    каждый вызывающий получает свой результат через Future.
+    Работает и из потоков (embed), и из asyncio (aembed).
+    """
+    def __init__(self, embedder: Embedder,
+                 max_batch_size: int = QUERY_BATCH_MAX_SIZE,
+                 max_wait_ms: float = QUERY_BATCH_MAX_WAIT_MS):
+        self.embedder = embedder
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue: "queue.Queue[Optional[Tuple[str, Future]]]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._queries = 0
+        self._batch_sizes: Dict[int, int] = {}
+
+        self._thread = threading.Thread(target=self._run, name="query-embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, query: str) -> Future:
+        """
+        Ставит запрос в очередь и возвращает Future с его эмбеддингом.
+        """
+        future: Future = Future()
+        self._queue.put((query, future))
+        return future
+
+    def embed(self, query: str) -> List[float]:
+        """
+        Синхронно возвращает эмбеддинг запроса (блокирует поток до готовности батча).
+        """
+        return self.submit(query).result()
+
+    async def aembed(self, query: str) -> List[float]:
+        """
+        Асинхронно возвращает эмбеддинг запроса, не блокируя цикл событий.
+        """
+        return await asyncio.wrap_future(self.submit(query))
+
+    def _run(self):
+        """
+        Цикл фонового потока: собирает батч и векторизует его.
+        """
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._process(batch)
+            if stop:
+                return
+
+    def _process(self, batch: List[Tuple[str, Future]]):
+        with self._stats_lock:
+            self._batches += 1
+            self._queries += len(batch)
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+
+        try:
+            embeddings = self.embedder.embed_queries([query for query, _ in batch])
+            if len(embeddings) != len(batch):
+                raise RuntimeError("Не удалось сгенерировать эмбеддинги запросов.")
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future), embedding in zip(batch, embeddings):
+            future.set_result(embedding)
+
+    def metrics(self) -> dict:
+        """
+        Текущая глубина очереди и статистика размеров батчей.
+        """
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batches': self._batches,
+                'queries': self._queries,
+                'avg_batch_size': self._queries / self._batches if self._batches else 0.0,
+                'max_batch_size_seen': max(self._batch_sizes, default=0),
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+            }
+
+    def close(self):
+        """
+        Останавливает фоновый поток после обработки уже поставленных запросов.
+        """
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,73 @@
+import time
+from typing import List, Optional
+
+from langchain.schema.document import Document
+from sentence_transformers import CrossEncoder
+
+from src.ingestion.model_registry import get_cross_encoder
+from src.core.config import (
+    DEVICE, RERANKER_MODEL_NAME, RERANK_BATCH_SIZE, RERANK_BUDGET_MS
+)
+
+class Reranker:
+    """
+    Переранжирование кандидатов мультиязычным кросс-энкодером.
+    Кандидаты оцениваются батчами; если очередной батч не укладывается
+    в бюджет времени запроса, возвращается исходный (векторный/гибридный) порядок.
+    """
+    def __init__(self, model_name: str = RERANKER_MODEL_NAME, device: str = DEVICE,
+                 batch_size: int = RERANK_BATCH_SIZE, budget_ms: float = RERANK_BUDGET_MS):
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.budget = budget_ms / 1000
+        self._model: Optional[CrossEncoder] = None
+
+        self.reranked = 0
+        self.fallbacks = 0
+
+    @property
+    def model(self) -> CrossEncoder:
+        if self._model is None:
+            self._model = get_cross_encoder(self.model_name, self.device)
+        return self._model
+
+    def rerank(self, query: str, documents: List[Document], k: int) -> List[Document]:
+        """
+        Возвращает k лучших кандидатов по оценке кросс-энкодера.
+
+        Аргументы:
+            query: Пользовательский запрос.
+            documents: Кандидаты в исходном порядке (тексты уже в памяти).
+            k: Сколько документов вернуть.
+
+        Возвращает:
+            List[Document]: Переранжированные документы (оценка - в metadata['rerank_score'])
+                            или первые k в исходном порядке, если бюджет превышен.
+        """
+        if len(documents) <= 1:
+            return documents[:k]
+
+        start = time.perf_counter()
+        scores: List[float] = []
+        for batch_start in range(0, len(documents), self.batch_size):
+            elapsed = time.perf_counter() - start
+            n_batches = batch_start // self.batch_size
+            # Не начинаем батч, если по средней длительности он не успеет в бюджет
+            if n_batches and elapsed + elapsed / n_batches > self.budget:
+                self.fallbacks += 1
+                print(f"Переранжирование не укладывается в {self.budget * 1000:.0f} мс, порядок без переранжирования.")
+                return documents[:k]
+
+            batch = documents[batch_start:batch_start + self.batch_size]
+            scores.extend(float(score) for score in self.model.predict(
+                [(query, doc.page_content) for doc in batch],
+                batch_size=len(batch),
+                show_progress_bar=False
+            ))
+
+        self.reranked += 1
+        ranked = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)[:k]
+        for i in ranked:
+            documents[i].metadata['rerank_score'] = scores[i]
+        return [documents[i] for i in ranked]
@@ -0,0 +1,233 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema.document import Document
+
+from src.retrieval.retriever import Retriever
+from src.core.config import (RETRIEVAL_EVAL_DATASET_PATH, RETRIEVAL_EVAL_KS, RAW_DATA_PATH, VECTOR_BACKEND,
+                             HYBRID_SEARCH_ENABLED, CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_LENGTH_UNIT,
+                             CHUNK_SIZE_TOKENS, CHUNK_OVERLAP_TOKENS, NATIVE_SPLITTER_ENABLED,
+                             EMBEDDING_MODEL_NAME, RERANKER_MODEL_NAME)
+
+def load_dataset(path: Path = RETRIEVAL_EVAL_DATASET_PATH) -> dict:
+    """
+    Читает набор вопросов и предупреждает об ожидаемых файлах, которых нет в data/raw
+    (набор составлен для другой версии корпуса - такие вопросы найти нельзя).
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        dataset = json.load(f)
+    missing = sorted({item['source'] for question in dataset['questions'] for item in question['expected']
+                      if not (RAW_DATA_PATH / item['source']).exists()})
+    if missing:
+        print(f"Внимание: {len(missing)} ожидаемых файлов нет в {RAW_DATA_PATH}: {', '.join(missing[:5])}")
+    return dataset
+
+def first_hit(documents: List[Document], expected: List[dict]) -> Optional[int]:
+    """
+    Ранг (с 1) первого результата, страница которого есть среди ожидаемых; None - не найдено.
+    """
+    pages = {(item['source'], item['page']) for item in expected}
+    for rank, doc in enumerate(documents, 1):
+        if (doc.metadata.get('source'), doc.metadata.get('page')) in pages:
+            return rank
+    return None
+
+def make_configs(backends: List[str], hybrid: List[bool], reranker: List[bool]) -> Dict[str, dict]:
+    """
+    Конфигурации поиска - все сочетания бэкенда, гибридного поиска и переранжирования.
+    """
+    configs = {}
+    for backend, use_hybrid, use_reranker in itertools.product(backends, hybrid, reranker):
+        name = backend + ("+bm25" if use_hybrid else "") + ("+rerank" if use_reranker else "")
+        configs[name] = {'vector_backend': backend, 'use_hybrid': use_hybrid, 'use_reranker': use_reranker}
+    return configs
+
+def index_settings(retriever: Retriever) -> dict:
+    """
+    Параметры индекса, по которому идет прогон. Размер чанка и модель задаются при
+    индексации, поэтому их сравнение - это сравнение JSON-результатов прогонов
+    до и после переиндексации с другими настройками.
+    """
+    tokens = CHUNK_LENGTH_UNIT == "tokens"
+    return {
+        'chunk_size': CHUNK_SIZE_TOKENS if tokens else CHUNK_SIZE,
+        'chunk_overlap': CHUNK_OVERLAP_TOKENS if tokens else CHUNK_OVERLAP,
+        'chunk_length_unit': CHUNK_LENGTH_UNIT,
+        'native_splitter': NATIVE_SPLITTER_ENABLED,
+        'embedding_model': EMBEDDING_MODEL_NAME,
+        'chunks': retriever.collection.count(),
+        'index_version': retriever.manager.get_index_version(),
+    }
+
+def _ensure_export(retriever: Retriever, backend: str):
+    """
+    Строит выгрузку компактного или mmap-хранилища, если ее нет или она устарела,
+    иначе ретривер молча искал бы в ChromaDB и результаты конфигурации были бы подменены.
+    """
+    store = retriever.compact_store if backend == "compact" else retriever.mmap_store
+    if store is not None and not store.is_fresh(retriever.manager.get_index_version()):
+        retriever.manager.build_vector_export(backend)
+        store.open()
+
+def evaluate(retriever: Retriever, questions: List[dict], ks: Tuple[int, ...], scope: str) -> dict:
+    """
+    Прогоняет вопросы по одному через retrieve (как в работе ассистента) и
+    затем одним вызовом retrieve_many (пропускная способность пакетного режима).
+
+    Аргументы:
+        retriever: Ретривер с k = max(ks).
+        questions: Вопросы набора.
+        ks: Значения k для recall@k.
+        scope: "detect" - продукт определяется по вопросу, "product" - поиск в продукте
+               вопроса, "all" - по всей коллекции.
+
+    Возвращает:
+        dict: recall@k, MRR, задержки p50/p95/p99 (мс), запросов/с в пакетном режиме,
+              recall по продуктам и id ненайденных вопросов.
+    """
+    def products_for(question: dict) -> Optional[List[str]]:
+        return {'detect': None, 'product': [question['product']], 'all': []}[scope]
+
+    # Прогрев: загрузка моделей и первое обращение к индексам не входят в задержки
+    with contextlib.redirect_stdout(io.StringIO()):
+        retriever.retrieve(questions[0]['question'], products_for(questions[0]))
+
+    ranks: List[Optional[int]] = []
+    latencies: List[float] = []
+    for question in questions:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            documents = retriever.retrieve(question['question'], products_for(question))
+            latencies.append((time.perf_counter() - start) * 1000)
+        ranks.append(first_hit(documents, question['expected']))
+
+    batch_seconds = None
+    if scope != "product":
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for _ in retriever.retrieve_many([q['question'] for q in questions], products_for(questions[0])):
+                pass
+            batch_seconds = time.perf_counter() - start
+
+    k_max = max(ks)
+    by_product: Dict[str, List[bool]] = {}
+    for question, rank in zip(questions, ranks):
+        by_product.setdefault(question['product'], []).append(rank is not None and rank <= k_max)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        **{f'recall@{k}': float(np.mean([rank is not None and rank <= k for rank in ranks])) for k in ks},
+        'mrr': float(np.mean([1 / rank if rank else 0.0 for rank in ranks])),
+        'latency_p50_ms': float(p50),
+        'latency_p95_ms': float(p95),
+        'latency_p99_ms': float(p99),
+        'batch_qps': len(questions) / batch_seconds if batch_seconds else None,
+        f'recall@{k_max}_by_product': {product: float(np.mean(hits)) for product, hits in sorted(by_product.items())},
+        'misses': [question['id'] for question, rank in zip(questions, ranks) if rank is None],
+    }
+
+def run_benchmark(configs: Dict[str, dict], dataset_path: Path = RETRIEVAL_EVAL_DATASET_PATH,
+                  ks: Tuple[int, ...] = RETRIEVAL_EVAL_KS, scope: str = "detect",
+                  products: Optional[List[str]] = None, baseline: Optional[dict] = None) -> dict:
+    """
+    Качество и задержка поиска для каждой конфигурации на наборе вопросов.
+    Кэш результатов и микробатчер отключены: каждый вопрос проходит весь путь поиска.
+
+    Аргументы:
+        configs: Конфигурации (make_configs).
+        dataset_path: Набор вопросов.
+        ks: Значения k для recall@k; ретривер возвращает max(ks) чанков.
+        scope: Как ограничивать поиск продуктом (см. evaluate).
+        products: Взять только вопросы этих продуктов.
+        baseline: Результаты прошлого прогона - в таблице показываются изменения метрик.
+
+    Возвращает:
+        dict: Результаты прогона (dataset, index, run, configs) - для сохранения в JSON.
+    """
+    dataset = load_dataset(dataset_path)
+    questions = [q for q in dataset['questions'] if not products or q['product'] in products]
+    if not questions:
+        raise ValueError("В наборе нет вопросов для выбранных продуктов.")
+
+    results = {
+        'dataset': {'path': str(dataset_path), 'version': dataset['version'], 'questions': len(questions)},
+        'run': {'started': datetime.now().isoformat(timespec='seconds'), 'ks': list(ks), 'scope': scope,
+                'reranker_model': RERANKER_MODEL_NAME},
+        'configs': {},
+    }
+    for name, config in configs.items():
+        print(f"Конфигурация {name}...")
+        with contextlib.redirect_stdout(io.StringIO()):
+            retriever = Retriever(k=max(ks), use_batching=False, use_cache=False, **config)
+        if not retriever.collection or retriever.collection.count() == 0:
+            raise RuntimeError("Коллекция пуста - сначала запустите индексацию (python -m src.ingestion.ingest).")
+        if config['vector_backend'] != "chroma":
+            _ensure_export(retriever, config['vector_backend'])
+        results.setdefault('index', index_settings(retriever))
+        results['configs'][name] = {**config, **evaluate(retriever, questions, ks, scope)}
+
+    print_results(results, baseline)
+    return results
+
+def print_results(results: dict, baseline: Optional[dict] = None):
+    """
+    Таблица метрик; если передан baseline (результаты прошлого прогона) -
+    в скобках изменение относительно него для общих конфигураций.
+    """
+    ks = results['run']['ks']
+    index = results['index']
+    print(f"\nНабор v{results['dataset']['version']}: {results['dataset']['questions']} вопросов, "
+          f"чанков: {index['chunks']}, чанк {index['chunk_size']}/{index['chunk_overlap']} "
+          f"({index['chunk_length_unit']}), модель {index['embedding_model']}, поиск: {results['run']['scope']}")
+    columns = [f'recall@{k}' for k in ks] + ['mrr', 'latency_p50_ms', 'latency_p95_ms', 'latency_p99_ms']
+    print(f"{'Конфигурация':<22}" + "".join(f"{c.replace('latency_', '').replace('_ms', ''):>16}" for c in columns))
+    for name, metrics in results['configs'].items():
+        base = (baseline or {}).get('configs', {}).get(name)
+        cells = []
+        for c in columns:
+            cell = f"{metrics[c]:.3f}" if not c.startswith('latency') else f"{metrics[c]:.1f}"
+            if base and c in base:
+                delta = metrics[c] - base[c]
+                cell += f" ({delta:+.3f})" if not c.startswith('latency') else f" ({delta:+.1f})"
+            cells.append(f"{cell:>16}")
+        print(f"{name:<22}" + "".join(cells))
+    for name, metrics in results['configs'].items():
+        if metrics['batch_qps']:
+            print(f"{name}: retrieve_many - {metrics['batch_qps']:.1f} запросов/с")
+        if metrics['misses']:
+            print(f"{name}: не найдено в top-{max(ks)}: {', '.join(metrics['misses'])}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@k, MRR и задержка поиска на наборе вопросов по корпусу")
+    parser.add_argument("--dataset", type=Path, default=RETRIEVAL_EVAL_DATASET_PATH)
+    parser.add_argument("--backends", nargs="+", choices=["chroma", "compact", "mmap"], default=[VECTOR_BACKEND])
+    parser.add_argument("--hybrid", nargs="+", choices=["on", "off"],
+                        default=["on" if HYBRID_SEARCH_ENABLED else "off"], help="Гибридный поиск (BM25 + RRF)")
+    parser.add_argument("--reranker", nargs="+", choices=["on", "off"], default=["off"],
+                        help="Переранжирование кросс-энкодером")
+    parser.add_argument("--k", type=int, nargs="+", default=list(RETRIEVAL_EVAL_KS), help="Значения k для recall@k")
+    parser.add_argument("--scope", choices=["detect", "product", "all"], default="detect",
+                        help="detect - продукт по вопросу, product - продукт из набора, all - вся коллекция")
+    parser.add_argument("--products", nargs="+", default=None, help="Только вопросы этих продуктов")
+    parser.add_argument("--output", default=None, help="Сохранить результаты в JSON")
+    parser.add_argument("--compare", default=None, help="JSON прошлого прогона - показать изменения метрик")
+    args = parser.parse_args()
+
+    configs = make_configs(args.backends, [h == "on" for h in args.hybrid], [r == "on" for r in args.reranker])
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    results = run_benchmark(configs, args.dataset, tuple(sorted(args.k)), args.scope, args.products, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+# запуск: python -m src.retrieval.retrieval_bench --hybrid off on --output data/eval/results.json
@@ -1,43 +1,111 @@
-from typing import List, Dict, Any, Optional
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Iterator, List, Dict, Any, Optional, Sequence, Tuple, TypeVar
 from pathlib import Path
 
 from langchain.schema.document import Document
 from chromadb.api.models.Collection import Collection
 
-from ingestion.embedder import Embedder
-from ingestion.vector_store import VectorStoreManager, COLLECTION_NAME
-from core.config import (VECTOR_DB_PATH, TOP_K_CHUNKS)
+from src.ingestion.embedder import Embedder
+from src.ingestion.vector_store import VectorStoreManager, COLLECTION_NAME
+from src.retrieval.query_batcher import QueryEmbeddingBatcher
+from src.retrieval.cache import RetrievalCache, ChunkCache
+from src.retrieval.reranker import Reranker
+from src.retrieval.product_detector import ProductDetector
+from src.ingestion.compact_store import CompactVectorStore
+from src.ingestion.mmap_store import MmapVectorStore
+from src.core.config import (VECTOR_DB_PATH, TOP_K_CHUNKS, QUERY_BATCHING_ENABLED, RETRIEVAL_CACHE_ENABLED,
+                             HYBRID_SEARCH_ENABLED, HYBRID_CANDIDATES, RRF_K, RERANKER_ENABLED, RERANK_CANDIDATES,
+                             PRODUCT_DETECTION_ENABLED, VECTOR_BACKEND, RETRIEVE_MANY_BATCH_SIZE)
+
+T = TypeVar('T')
+
+async def _timed(awaitable: Awaitable[T], timings: Dict[str, float], stage: str) -> T:
+    """
+    Ожидает awaitable и записывает длительность в timings[stage] (мс).
+    """
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = (time.perf_counter() - start) * 1000
 
 class Retriever:
     """
     Класс для Retrieval в ChromaDB.
     """
-    def __init__(self, db_path: Path = VECTOR_DB_PATH, k: int = TOP_K_CHUNKS):
+    def __init__(self, db_path: Path = VECTOR_DB_PATH, k: int = TOP_K_CHUNKS,
+                 use_batching: bool = QUERY_BATCHING_ENABLED, use_cache: bool = RETRIEVAL_CACHE_ENABLED,
+                 use_hybrid: bool = HYBRID_SEARCH_ENABLED, use_reranker: bool = RERANKER_ENABLED,
+                 detect_product: bool = PRODUCT_DETECTION_ENABLED, vector_backend: str = VECTOR_BACKEND):
         """
         Инициализирует ретривер, подключаясь к ChromaDB и загружая модель эмбеддингов.
         
         Аргументы:
             db_path: Путь к папке, где хранится ChromaDB.
             k: Количество чанков, которое нужно извлечь.
+            use_batching: Векторизовать конкурентные запросы общими батчами (QueryEmbeddingBatcher).
+            use_cache: Кэшировать результаты поиска (RetrievalCache).
+            use_hybrid: Объединять векторный поиск с BM25-поиском по лексическому индексу.
+            use_reranker: Переранжировать кандидатов кросс-энкодером (Reranker).
+            detect_product: Определять продукт по запросу и искать только в его документах.
+            vector_backend: "chroma", "compact" (CompactVectorStore) или "mmap" (MmapVectorStore);
+                            выгрузка используется, пока она соответствует коллекции.
         """
         self.k = k
-        self.embedder: Embedder = Embedder()
-        self.manager: VectorStoreManager = VectorStoreManager(db_path=db_path)
+        # Один эмбеддер (и одна модель из общего реестра) на ретривер и менеджер хранилища.
+        # Кэш эмбеддингов чанков при поиске не нужен.
+        self.embedder: Embedder = Embedder(use_cache=False)
+        self.manager: VectorStoreManager = VectorStoreManager(db_path=db_path, embedder=self.embedder)
+        self.batcher: Optional[QueryEmbeddingBatcher] = (
+            QueryEmbeddingBatcher(self.embedder) if use_batching else None
+        )
+        self.cache: Optional[RetrievalCache] = RetrievalCache() if use_cache else None
+        self.use_hybrid = use_hybrid
+        self.reranker: Optional[Reranker] = Reranker() if use_reranker else None
+        self.product_detector: Optional[ProductDetector] = ProductDetector() if detect_product else None
+        # Тексты чанков, уже прочитанных из ChromaDB, для кандидатов BM25
+        self.chunk_cache: ChunkCache = ChunkCache()
+        self.compact_store: Optional[CompactVectorStore] = None
+        self.mmap_store: Optional[MmapVectorStore] = None
+        # Версия индекса, для которой уже сообщили, что выгрузка устарела и поиск идет в ChromaDB
+        self._export_fallback_version: Optional[str] = None
+        if vector_backend == "compact":
+            self.compact_store = CompactVectorStore()
+            if not self.compact_store.open():
+                print("Компактное хранилище не построено, поиск идет в ChromaDB. "
+                      "Постройте его: VectorStoreManager().build_compact_store()")
+        elif vector_backend == "mmap":
+            self.mmap_store = MmapVectorStore()
+            if not self.mmap_store.open():
+                print("Выгрузка для поиска перебором не построена, поиск идет в ChromaDB. "
+                      "Постройте ее: VectorStoreManager().build_mmap_store()")
         
         # Получаем доступ к коллекции ChromaDB
         self.collection: Optional[Collection] = self.manager.get_or_create_collection()
         
         if self.collection:
             print(f"Ретривер инициализирован: подключен к коллекции '{COLLECTION_NAME}' (K={self.k}).")
+            if self.use_hybrid and self.manager.lexical_index.count() == 0 and self.collection.count() > 0:
+                print("Лексический индекс пуст, поиск будет только векторным. "
+                      "Постройте его: VectorStoreManager().rebuild_lexical_index()")
         else:
             print("Ошибка: Не удалось подключиться к коллекции ChromaDB.")
 
-    def retrieve(self, query: str) -> List[Document]:
+    def retrieve(self, query: str, products: Optional[List[str]] = None) -> List[Document]:
         """
         Извлекает k наиболее релевантных чанков из векторной базы по запросу.
+        Поиск ограничивается продуктами (папками верхнего уровня в 'raw'):
+        заданными явно или, если не заданы, упомянутыми в запросе.
+        При гибридном поиске кандидаты векторного и BM25-поиска
+        объединяются через Reciprocal Rank Fusion. Если включен Reranker,
+        расширенный список кандидатов переранжируется кросс-энкодером.
 
         Аргументы:
             query: Пользовательский текстовый запрос.
+            products: Продукты для поиска, например ['nova'] (None - определить по запросу,
+                      [] - искать по всей коллекции).
 
         Возвращает:
             List[Document]: Список объектов LangChain Document, содержащих 
@@ -49,38 +117,411 @@ class Retriever:
 
         print(f"Поиск релевантного контекста для запроса: '{query[:50]}.'")
 
-        # 1. Векторизация запроса
-        # Создаем временный Document для векторизации
-        query_embedding = self.embedder.embed_query(query)
+        products = self._resolve_products(query, products)
+        if products:
+            print(f"Поиск по продуктам: {', '.join(products)}")
+        scope = (self.k, tuple(products))
+
+        # 0. Точный кэш (сбрасывается при изменении индекса)
+        index_version = self.manager.get_index_version()
+        if self.cache:
+            cached = self.cache.get(query, index_version, scope=scope)
+            if cached is not None:
+                print(f"Результат взят из кэша: {len(cached)} фрагментов.")
+                return cached
+
+        # 1. Векторизация запроса (через микробатчер, если он включен)
+        query_embedding = self._embed_query(query)
+        if not query_embedding:
+            return []
+
+        # Семантический кэш: похожий запрос уже искали
+        if self.cache:
+            cached = self.cache.get_semantic(query, query_embedding, index_version, scope=scope)
+            if cached is not None:
+                print(f"Результат взят из семантического кэша: {len(cached)} фрагментов.")
+                return cached
         
-        # 2. Поиск в ChromaDB
+        # 2. Поиск в ChromaDB (и в BM25-индексе при гибридном поиске)
+        n_results, n_candidates = self._n_candidates()
+        if self.use_hybrid:
+            dense_documents = self._dense_search(query_embedding, n_candidates, index_version, products)
+            lexical_hits = self._lexical_search(query, n_candidates, products)
+            retrieved_documents = self._fuse(dense_documents, lexical_hits, index_version)[:n_results]
+        else:
+            retrieved_documents = self._dense_search(query_embedding, n_results, index_version, products)
+
+        # 3. Переранжирование кандидатов кросс-энкодером
+        if self.reranker:
+            retrieved_documents = self._rerank(query, retrieved_documents)
+
+        print(f"Найдено {len(retrieved_documents)} релевантных фрагментов.")
+
+        if self.cache:
+            self.cache.put(query, query_embedding, retrieved_documents, index_version, scope=scope)
+        
+        return retrieved_documents
+
+    async def aretrieve(self, query: str, products: Optional[List[str]] = None,
+                        timings: Optional[Dict[str, float]] = None) -> List[Document]:
+        """
+        Асинхронный вариант retrieve для работы многих запросов в одном event loop.
+        Векторизация запроса (через микробатчер) и BM25-поиск выполняются
+        одновременно; блокирующие вызовы ChromaDB, SQLite и моделей - в пуле потоков.
+
+        Аргументы:
+            query: Пользовательский текстовый запрос.
+            products: Как в retrieve.
+            timings: Словарь, в который записываются длительности этапов (мс):
+                     cache, embed, lexical, dense, fuse, rerank.
+
+        Возвращает:
+            List[Document]: Тот же результат, что и у retrieve.
+        """
+        timings = {} if timings is None else timings
+        if not self.collection:
+            return []
+
+        products = self._resolve_products(query, products)
+        scope = (self.k, tuple(products))
+        start = time.perf_counter()
+        index_version = self.manager.get_index_version()
+        if self.cache:
+            cached = self.cache.get(query, index_version, scope=scope)
+            if cached is not None:
+                timings['cache'] = (time.perf_counter() - start) * 1000
+                return cached
+        timings['cache'] = (time.perf_counter() - start) * 1000
+
+        # 1. Векторизация запроса и BM25-поиск параллельно
+        n_results, n_candidates = self._n_candidates()
+        embedding_task = _timed(self._aembed_query(query), timings, 'embed')
+        if self.use_hybrid:
+            lexical_task = _timed(asyncio.to_thread(self._lexical_search, query, n_candidates, products),
+                                  timings, 'lexical')
+            query_embedding, lexical_hits = await asyncio.gather(embedding_task, lexical_task)
+        else:
+            query_embedding, lexical_hits = await embedding_task, []
+        if not query_embedding:
+            return []
+
+        if self.cache:
+            start = time.perf_counter()
+            cached = self.cache.get_semantic(query, query_embedding, index_version, scope=scope)
+            timings['cache'] += (time.perf_counter() - start) * 1000
+            if cached is not None:
+                return cached
+
+        # 2. Векторный поиск и слияние
+        if self.use_hybrid:
+            dense_documents = await _timed(asyncio.to_thread(
+                self._dense_search, query_embedding, n_candidates, index_version, products), timings, 'dense')
+            retrieved_documents = (await _timed(asyncio.to_thread(
+                self._fuse, dense_documents, lexical_hits, index_version), timings, 'fuse'))[:n_results]
+        else:
+            retrieved_documents = await _timed(asyncio.to_thread(
+                self._dense_search, query_embedding, n_results, index_version, products), timings, 'dense')
+
+        # 3. Переранжирование
+        if self.reranker:
+            retrieved_documents = await _timed(asyncio.to_thread(
+                self._rerank, query, retrieved_documents), timings, 'rerank')
+
+        if self.cache:
+            self.cache.put(query, query_embedding, retrieved_documents, index_version, scope=scope)
+        return retrieved_documents
+
+    def retrieve_many(self, queries: Sequence[str], products: Optional[List[str]] = None,
+                      batch_size: int = RETRIEVE_MANY_BATCH_SIZE) -> Iterator[Tuple[int, List[Document]]]:
+        """
+        Пакетный поиск для офлайн-прогонов (оценка качества, заготовка ответов на FAQ).
+        Запросы векторизуются батчами по batch_size за один проход модели, векторный
+        поиск - один вызов хранилища на батч (на каждую группу запросов с одинаковыми
+        продуктами). Следующий батч векторизуется в фоне, пока идет поиск по текущему.
+        Результаты отдаются по мере готовности батчей, в порядке запросов.
+
+        Аргументы:
+            queries: Пользовательские текстовые запросы.
+            products: Как в retrieve, общие для всех запросов (None - определить по каждому запросу).
+            batch_size: Запросов в одном батче.
+
+        Возвращает:
+            Iterator[Tuple[int, List[Document]]]: (номер запроса в queries, тот же результат, что у retrieve).
+        """
+        if not self.collection:
+            print('Коллекция не найдена.')
+            return
+
+        index_version = self.manager.get_index_version()
+        batches = [range(start, min(start + batch_size, len(queries))) for start in range(0, len(queries), batch_size)]
+        if not batches:
+            return
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            embedding = executor.submit(self._embed_batch, [queries[i] for i in batches[0]])
+            for b, batch in enumerate(batches):
+                embeddings = embedding.result()
+                if b + 1 < len(batches):
+                    embedding = executor.submit(self._embed_batch, [queries[i] for i in batches[b + 1]])
+                results = self._retrieve_batch([queries[i] for i in batch], embeddings, products, index_version)
+                yield from zip(batch, results)
+
+    def _embed_batch(self, queries: List[str]) -> List[Optional[List[float]]]:
+        """
+        Векторизует батч запросов напрямую (без микробатчера); при ошибке - None для каждого запроса.
+        """
+        try:
+            embeddings = self.embedder.embed_queries(queries)
+        except Exception as e:
+            print(f"Ошибка при векторизации запросов: {e}")
+            embeddings = []
+        return embeddings if len(embeddings) == len(queries) else [None] * len(queries)
+
+    def _retrieve_batch(self, queries: List[str], embeddings: List[Optional[List[float]]],
+                        products: Optional[List[str]], index_version: str) -> List[List[Document]]:
+        """
+        Поиск по батчу уже векторизованных запросов (этапы те же, что в retrieve).
+        """
+        results: List[List[Document]] = [[] for _ in queries]
+        scopes: List[Tuple[int, Tuple[str, ...]]] = []
+        groups: Dict[Tuple[str, ...], List[int]] = {}
+        for i, (query, embedding) in enumerate(zip(queries, embeddings)):
+            query_products = tuple(self._resolve_products(query, products))
+            scopes.append((self.k, query_products))
+            if self.cache:
+                cached = self.cache.get(query, index_version, scope=scopes[i])
+                if cached is None and embedding is not None:
+                    cached = self.cache.get_semantic(query, embedding, index_version, scope=scopes[i])
+                if cached is not None:
+                    results[i] = cached
+                    continue
+            if embedding is not None:
+                groups.setdefault(query_products, []).append(i)
+
+        n_results, n_candidates = self._n_candidates()
+        for group_products, members in groups.items():
+            dense = self._dense_search_many([embeddings[i] for i in members],
+                                            n_candidates if self.use_hybrid else n_results,
+                                            index_version, list(group_products))
+            for i, dense_documents in zip(members, dense):
+                if self.use_hybrid:
+                    lexical_hits = self._lexical_search(queries[i], n_candidates, list(group_products))
+                    retrieved_documents = self._fuse(dense_documents, lexical_hits, index_version)[:n_results]
+                else:
+                    retrieved_documents = dense_documents
+                if self.reranker:
+                    retrieved_documents = self._rerank(queries[i], retrieved_documents)
+                if self.cache:
+                    self.cache.put(queries[i], embeddings[i], retrieved_documents, index_version, scope=scopes[i])
+                results[i] = retrieved_documents
+        return results
+
+    def _resolve_products(self, query: str, products: Optional[List[str]]) -> List[str]:
+        """
+        Явно заданные продукты или определенные по запросу.
+        """
+        if products is None:
+            return self.product_detector.detect(query) if self.product_detector else []
+        return products
+
+    def _n_candidates(self) -> Tuple[int, int]:
+        """
+        (сколько кандидатов передать дальше после слияния, сколько брать от каждого поиска).
+        При переранжировании кандидатов берется больше k.
+        """
+        n_results = max(self.k, RERANK_CANDIDATES) if self.reranker else self.k
+        return n_results, max(n_results, HYBRID_CANDIDATES)
+
+    async def _aembed_query(self, query: str) -> Optional[List[float]]:
+        """
+        Асинхронная векторизация запроса: общий батч микробатчера или пул потоков.
+        """
+        if not self.batcher:
+            return await asyncio.to_thread(self._embed_query, query)
+        try:
+            return await self.batcher.aembed(query)
+        except Exception as e:
+            print(f"Ошибка при векторизации запроса: {e}")
+            return None
+
+    def _embed_query(self, query: str) -> Optional[List[float]]:
+        """
+        Векторизует запрос через микробатчер (если включен) или напрямую.
+        """
+        try:
+            if self.batcher:
+                return self.batcher.embed(query)
+            return self.embedder.embed_query(query)
+        except Exception as e:
+            print(f"Ошибка при векторизации запроса: {e}")
+            return None
+
+    def _rerank(self, query: str, documents: List[Document]) -> List[Document]:
+        """
+        Переранжирует кандидатов; при ошибке модели возвращает первые k в исходном порядке.
+        """
+        try:
+            return self.reranker.rerank(query, documents, self.k)
+        except Exception as e:
+            print(f"Ошибка переранжирования: {e}")
+            return documents[:self.k]
+
+    @staticmethod
+    def _product_filter(products: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        Фильтр ChromaDB по полю метаданных 'product'.
+        """
+        if not products:
+            return None
+        if len(products) == 1:
+            return {'product': products[0]}
+        return {'product': {'$in': list(products)}}
+
+    def _dense_search(self, query_embedding: List[float], n_results: int, index_version: str,
+                      products: Optional[List[str]] = None) -> List[Document]:
+        """
+        Векторный поиск в ChromaDB (с фильтром по продуктам, если они заданы).
+        В метаданные добавляются id чанка и дистанция. Найденные чанки сохраняются в кэш чанков.
+        Если выбран компактный или mmap-бэкенд и его выгрузка актуальна, поиск идет в нем.
+        """
+        return self._dense_search_many([query_embedding], n_results, index_version, products)[0]
+
+    def _dense_search_many(self, query_embeddings: List[List[float]], n_results: int, index_version: str,
+                           products: Optional[List[str]] = None) -> List[List[Document]]:
+        """
+        Векторный поиск сразу для батча запросов с одинаковым фильтром по продуктам:
+        один вызов хранилища на батч. Для каждого запроса - свои объекты Document.
+        """
+        mmap_store = self._fresh_export('mmap_store', index_version)
+        if mmap_store:
+            results = mmap_store.search(query_embeddings, n_results, products)
+            self.chunk_cache.put_many([doc for documents in results for doc in documents], index_version)
+            return results
+
+        compact_store = self._fresh_export('compact_store', index_version)
+        if compact_store:
+            found = compact_store.search(query_embeddings, n_results, products)
+            documents = self._get_documents(list(dict.fromkeys(
+                chunk_id for chunk_ids, _ in found for chunk_id in chunk_ids)), index_version)
+            results = []
+            for chunk_ids, distances in found:
+                retrieved_documents = []
+                for chunk_id, dist in zip(chunk_ids, distances):
+                    if chunk_id in documents:
+                        doc = documents[chunk_id]
+                        retrieved_documents.append(Document(page_content=doc.page_content,
+                                                            metadata={**doc.metadata, 'distance': dist}))
+                results.append(retrieved_documents)
+            return results
+
         results: Dict[str, Any] = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=self.k,
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=self._product_filter(products),
             include=['documents', 'metadatas', 'distances']
         )
-        # посмотреть результат results
         
-        retrieved_documents: List[Document] = []
-
-        # 3. Форматирование результатов в объекты Document
-        if results['documents'] and results['metadatas']:
-            # Проходим по результатам (они приходят в виде списков в списках)
-            docs = results['documents'][0]
-            metadatas = results['metadatas'][0]
-            distances = results['distances'][0]
-            
-            print(f"Найдено {len(docs)} релевантных фрагментов.")
-
-            for doc_content, meta, dist in zip(docs, metadatas, distances):
-                # Добавляем дистанцию как метаданные для отладки
-                meta['distance'] = dist
-                
-                retrieved_documents.append(
-                    Document(page_content=doc_content, metadata=meta)
-                )
-        
-        return retrieved_documents
+        retrieved: List[List[Document]] = []
+
+        # Форматирование результатов в объекты Document (по списку на каждый запрос)
+        for i in range(len(query_embeddings)):
+            retrieved_documents: List[Document] = []
+            if results['documents'] and results['metadatas']:
+                for chunk_id, doc_content, meta, dist in zip(
+                        results['ids'][i], results['documents'][i], results['metadatas'][i], results['distances'][i]):
+                    # Добавляем id и дистанцию как метаданные для отладки и слияния
+                    meta['id'] = chunk_id
+                    meta['distance'] = dist
+                    
+                    retrieved_documents.append(
+                        Document(page_content=doc_content, metadata=meta)
+                    )
+            retrieved.append(retrieved_documents)
+
+        self.chunk_cache.put_many([doc for documents in retrieved for doc in documents], index_version)
+        return retrieved
+
+    def _fresh_export(self, attr: str, index_version: str):
+        """
+        Выгрузка (self.<attr>), соответствующая версии индекса, или None - искать в ChromaDB.
+        После индексации (в том числе в другом процессе) выгрузка перестраивается на диске:
+        если там уже текущая версия, открывается новый экземпляр и подменяет старый.
+        О переходе на ChromaDB сообщается один раз для каждой версии индекса.
+        """
+        store = getattr(self, attr)
+        if store is None or store.is_fresh(index_version):
+            return store
+        if store.stored_version() == index_version:
+            reopened = store.reopen()
+            if reopened is not None and reopened.is_fresh(index_version):
+                setattr(self, attr, reopened)
+                print(f"Выгрузка {reopened.path} переоткрыта для новой версии индекса.")
+                return reopened
+        if self._export_fallback_version != index_version:
+            self._export_fallback_version = index_version
+            print(f"Выгрузка {store.path} не соответствует текущей версии индекса, поиск идет в ChromaDB. "
+                  "Перестройте ее: VectorStoreManager().build_vector_export()")
+        return None
+
+    def _lexical_search(self, query: str, n_results: int,
+                        products: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """
+        BM25-поиск по лексическому индексу: пары (id чанка, оценка).
+        """
+        try:
+            return self.manager.lexical_index.search(query, n_results, products)
+        except Exception as e:
+            print(f"Ошибка лексического поиска: {e}")
+            return []
+
+    def _fuse(self, dense_documents: List[Document], lexical_hits: List[Tuple[str, float]],
+              index_version: str) -> List[Document]:
+        """
+        Reciprocal Rank Fusion: оценка чанка - сумма 1 / (RRF_K + ранг) по обоим спискам.
+        Тексты чанков, найденных только BM25, берутся из кэша чанков или дочитываются из ChromaDB.
+        """
+        scores: Dict[str, float] = {}
+        documents: Dict[str, Document] = {}
+
+        for rank, doc in enumerate(dense_documents):
+            chunk_id = doc.metadata['id']
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1 / (RRF_K + rank + 1)
+            documents[chunk_id] = doc
+
+        for rank, (chunk_id, bm25_score) in enumerate(lexical_hits):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1 / (RRF_K + rank + 1)
+            if chunk_id in documents:
+                documents[chunk_id].metadata['bm25'] = bm25_score
+
+        lexical_only = [chunk_id for chunk_id, _ in lexical_hits if chunk_id not in documents]
+        if lexical_only:
+            documents.update(self._get_documents(lexical_only, index_version))
+            for chunk_id, bm25_score in lexical_hits:
+                if chunk_id in documents:
+                    documents[chunk_id].metadata.setdefault('bm25', bm25_score)
+
+        ranked = sorted((chunk_id for chunk_id in scores if chunk_id in documents),
+                        key=lambda chunk_id: scores[chunk_id], reverse=True)
+        for chunk_id in ranked:
+            documents[chunk_id].metadata['rrf_score'] = scores[chunk_id]
+        return [documents[chunk_id] for chunk_id in ranked]
+
+    def _get_documents(self, chunk_ids: List[str], index_version: str) -> Dict[str, Document]:
+        """
+        Чанки по id (без дистанции): из кэша чанков, недостающие - из ChromaDB (и в кэш).
+        """
+        documents = self.chunk_cache.get_many(chunk_ids, index_version)
+        for doc in documents.values():
+            doc.metadata.pop('distance', None)
+        missing = [chunk_id for chunk_id in chunk_ids if chunk_id not in documents]
+        if missing:
+            fetched = self.collection.get(ids=missing, include=['documents', 'metadatas'])
+            fetched_documents = []
+            for chunk_id, doc_content, meta in zip(fetched['ids'], fetched['documents'], fetched['metadatas']):
+                meta['id'] = chunk_id
+                fetched_documents.append(Document(page_content=doc_content, metadata=meta))
+                documents[chunk_id] = fetched_documents[-1]
+            self.chunk_cache.put_many(fetched_documents, index_version)
+        return documents
     
     # @staticmethod
     # def format_context(documents: List[Document]) -> str:
@@ -98,9 +539,10 @@ class Retriever:
     #         header = f"[{i+1}] Источник: {source} (стр. {page})"
     #         context_parts.append(f"{header}\n---\n{doc.page_content}")
             
-        return "\n\n" + "\n---\n\n".join(context_parts)
+    #     return "\n\n" + "\n---\n\n".join(context_parts)
 
 if __name__ == "__main__":
+    from src.generation.prompt_builder import PromptBuilder
     
     # нужно запустить python ingest.py
     if not VECTOR_DB_PATH.exists():
@@ -117,7 +559,7 @@ if __name__ == "__main__":
         
         if retrieved_chunks:
             # 2. Форматирование контекста для промпта
-            context = Retriever.format_context(retrieved_chunks)
+            context = PromptBuilder.format_context_for_prompt(retrieved_chunks)
             
             print("\n" + "="*50)
             print("КОНТЕКСТ ДЛЯ LLM:")
@@ -127,4 +569,4 @@ if __name__ == "__main__":
             # Вывод деталей
             print("\n--- Детализация (K=3) ---")
             for i, chunk in enumerate(retrieved_chunks):
-                print(f"[{i+1}] Файл: {chunk.metadata.get('filename')}, Стр. {chunk.metadata.get('page')}, Расстояние: {chunk.metadata.get('distance'):.4f}")
\ No newline at end of file
+                print(f"[{i+1}] Файл: {chunk.metadata.get('filename')}, Стр. {chunk.metadata.get('page')}, Расстояние: {chunk.metadata.get('distance', float('nan')):.4f}")
\ No newline at end of file